@@ -0,0 +1,101 @@
+#
+# Copyright (C) 2025 pdnguyen of HCMC University of Technology VNU-HCM.
+# All rights reserved.
+# This file is part of the CO3093/CO3094 course.
+#
+# WeApRous release
+#
+# The authors hereby grant to Licensee personal permission to use
+# and modify the Licensed Source Code for the sole purpose of studying
+# while attending the course
+#
+
+"""
+apps.fanout
+~~~~~~~~~~~~~~~~~
+
+This module provides the tracker side delivery of a channel message to
+the P2P endpoints of the live members (``/channels/broadcast``).
+
+The message is serialised once and pushed to every peer concurrently, as
+coroutines on the shared event loop of the backend
+(:data:`daemon.longpoll.PARKER`), at most ``concurrency`` connections at
+a time. Each push is what a chat client does for one peer: connect, send
+the JSON message, close, within ``timeout`` seconds. A channel of 500
+live members thus costs about one timeout in the worst case instead of
+500 of them back to back.
+
+Usage::
+
+  >>> delivered = fan_out({"bob": ("127.0.0.1", 5001)}, payload)
+  >>> delivered
+  {'bob': True}
+"""
+
+import asyncio
+import json
+
+from daemon.longpoll import PARKER
+
+#: Seconds to connect to a peer and send it the message.
+PUSH_TIMEOUT = 2.0
+
+#: Pushes in flight at once.
+PUSH_CONCURRENCY = 128
+
+
+async def push(ip, port, data, timeout):
+    """
+    Sends ``data`` on a new connection to a peer.
+
+    :rtype bool: True when the whole message was sent.
+    """
+    try:
+        _, writer = await asyncio.wait_for(asyncio.open_connection(ip, int(port)), timeout)
+    except (OSError, ValueError, asyncio.TimeoutError):
+        return False
+    try:
+        writer.write(data)
+        await asyncio.wait_for(writer.drain(), timeout)
+        return True
+    except (OSError, asyncio.TimeoutError):
+        return False
+    finally:
+        writer.close()
+
+
+async def push_all(targets, data, timeout, concurrency):
+    """
+    Pushes ``data`` to every target, ``concurrency`` at a time.
+
+    :params targets (dict): username -> ``(ip, port)``.
+
+    :rtype dict: username -> True if delivered.
+    """
+    slots = asyncio.Semaphore(concurrency)
+
+    async def one(ip, port):
+        async with slots:
+            return await push(ip, port, data, timeout)
+
+    users = list(targets)
+    results = await asyncio.gather(*(one(*targets[user]) for user in users))
+    return dict(zip(users, results))
+
+
+def fan_out(targets, payload, timeout=PUSH_TIMEOUT, concurrency=PUSH_CONCURRENCY):
+    """
+    Pushes a message to many peers from a handler thread, which waits for
+    all of them.
+
+    :params targets (dict): username -> ``(ip, port)``.
+    :params payload (dict): the message, sent as JSON.
+    :params timeout (float): seconds per peer.
+    :params concurrency (int): pushes in flight at once.
+
+    :rtype dict: username -> True if delivered.
+    """
+    if not targets:
+        return {}
+    data = json.dumps(payload).encode('utf-8')
+    return PARKER.submit(push_all(targets, data, timeout, concurrency)).result()
@@ -0,0 +1,1093 @@
+#
+# Copyright (C) 2025 pdnguyen of HCMC University of Technology VNU-HCM.
+# All rights reserved.
+# This file is part of the CO3093/CO3094 course.
+#
+# WeApRous release
+#
+# The authors hereby grant to Licensee personal permission to use
+# and modify the Licensed Source Code for the sole purpose of studying
+# while attending the course
+#
+
+"""
+apps.tracker_state
+~~~~~~~~~~~~~~~~~
+
+This module provides the state of the chat tracker (``start_sampleapp.py``):
+users, sessions, registered peers, channels and offline messages.
+
+Each structure has its own lock, so a login never waits for a channel
+join. The per-user structures (sessions, peers, offline messages) are
+also striped: a :class:`StripedDict <StripedDict>` spreads its keys over
+``stripes`` small dicts, each behind its own lock, so the heartbeats and
+session lookups of unrelated users take different locks and never wait
+for each other. A scan of all the peers only holds one stripe at a time.
+
+Silent peers are dropped by a reaper thread (:meth:`TrackerState.start_reaper`)
+driven by an :class:`ExpiryWheel <ExpiryWheel>`. A peer is put on the wheel
+when it registers, at the second it would expire. When its slot comes up
+it is dropped if no heartbeat came in meanwhile, otherwise put back at its
+new expiry. Each peer is thus looked at about once per timeout whatever its
+heartbeat rate, and the reads return the live peers without checking them.
+
+Channel members are sets, and each channel also keeps the set of its
+members which are live peers. Registering, joining and expiring update
+both through a ``username -> channels`` index, so listing the peers of a
+channel costs its live members only, whatever its total membership.
+
+The read endpoints (``/get-peers``, ``/channels/list``, ``/channels/peers``)
+read a :class:`Snapshot <Snapshot>` instead: an immutable copy of the live
+peers and the channels, republished by the writers at each change of the
+peer list or of a channel (a registration, a move, an expiry, a join) but
+not at heartbeats. Readers take the current snapshot without any lock, and
+its JSON bodies are serialised once, by the first reader, then shared by
+all the others until the next change.
+
+Each publication also appends its changes (peers registered, moved or
+dropped, channels created) to a change log, under the new version. A
+client which knows version ``v`` asks for the changes since ``v``
+(``/get-peers?since=v``) and gets the merged delta, or nothing when ``v``
+is current, so it pays for the churn rather than the population. The
+versions start at the publication time in milliseconds, so the cursor of
+a client from before a tracker restart is older than the new log and gets
+a full list.
+
+Offline messages are kept in a :class:`Mailbox <Mailbox>`: each message
+body is serialised and stored once, whatever its number of recipients,
+and each user has a queue of message IDs. A body counts the queues
+holding it and is freed when the last of its recipients acknowledged it,
+so a channel message to a thousand offline members costs one body and a
+thousand queue entries, not a thousand copies. A user reads its queue a
+page at a time after a cursor (the last ID read) and acknowledges the
+cursor to remove what it read, so a message lost on the way is read
+again. The queues are capped per user and the messages expire, both
+memory and pages stay bounded however long a user stays away.
+
+Long polls (``/events``) wait on the state: :meth:`TrackerState.watch`
+registers a poll for a user, and it is woken by each publication and by
+each offline message queued for that user.
+
+Usage::
+
+  >>> state = TrackerState()
+  >>> state.load_users({"alice": "secret"})
+  >>> session_id = state.login("alice", "secret")
+  >>> state.register_peer(state.session_user(session_id), "127.0.0.1", 5000)
+  >>> state.heartbeat("alice")
+"""
+
+import bisect
+import itertools
+import json
+import secrets
+import threading
+import time
+
+from daemon.longpoll import wake_all
+from daemon.response import JSONBytes
+
+#: Locks of a striped structure, a power of two.
+DEFAULT_STRIPES = 64
+
+#: Seconds without a heartbeat before a peer is dropped.
+HEARTBEAT_TIMEOUT = 30
+
+#: Channel every registered peer joins.
+DEFAULT_CHANNEL = "chung"
+
+#: Seconds per slot of the peer expiry wheel, and between two reaps.
+REAP_TICK = 1.0
+
+#: Slots of the expiry wheel. Keys due later are re-checked each turn.
+REAP_SLOTS = 64
+
+#: Publications kept in the change log, older cursors get a full list.
+CHANGE_LOG_SIZE = 1024
+
+#: Deltas cached per snapshot, for cursors at most this many versions old.
+DELTA_CACHE_DEPTH = 64
+
+#: Offline messages kept per user, the oldest are dropped beyond.
+OFFLINE_BACKLOG = 1000
+
+#: Seconds an offline message is kept.
+OFFLINE_TTL = 7 * 24 * 3600
+
+#: Largest offline message, serialised.
+OFFLINE_MESSAGE_BYTES = 16 * 1024
+
+#: Offline messages per page by default.
+OFFLINE_PAGE_SIZE = 100
+
+#: Bytes of messages per page, beyond its first message.
+OFFLINE_PAGE_BYTES = 256 * 1024
+
+#: Seconds between two purges of the expired offline messages.
+OFFLINE_PURGE_INTERVAL = 60.0
+
+
+class ExpiryWheel:
+    """The :class:`ExpiryWheel <ExpiryWheel>` object, a timing wheel of
+    keys to check at a given time.
+
+    Scheduling and taking the due keys both cost O(1) per key, against a
+    scan of every key for each expiry pass.
+
+    :attrs tick (float): seconds per slot.
+    """
+
+    __attrs__ = [
+        "tick",
+    ]
+
+    def __init__(self, tick=REAP_TICK, slots=REAP_SLOTS):
+        """
+        :params tick (float): seconds per slot.
+        :params slots (int): number of slots.
+        """
+        self.tick = tick
+        self._wheel = [[] for _ in range(slots)]
+        self._cursor = None
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return sum(len(slot) for slot in self._wheel)
+
+    def schedule(self, key, due, now):
+        """
+        Puts ``key`` in the slot of ``due``, at the latest one turn ahead.
+
+        :params key (hashable): the key.
+        :params due (float): time the key should be checked.
+        :params now (float): current time.
+        """
+        with self._lock:
+            if self._cursor is None:
+                self._cursor = int(now / self.tick)
+            tick = int(due / self.tick)
+            tick = min(max(tick, self._cursor + 1), self._cursor + len(self._wheel))
+            self._wheel[tick % len(self._wheel)].append(key)
+
+    def advance(self, now):
+        """
+        Moves the wheel to ``now``.
+
+        :rtype list: the keys of the slots passed, which the caller checks
+                     and schedules again if they are not due yet.
+        """
+        current = int(now / self.tick)
+        due = []
+        with self._lock:
+            if self._cursor is None:
+                self._cursor = current
+                return due
+            steps = min(current - self._cursor, len(self._wheel))
+            self._cursor = current - steps
+            for _ in range(steps):
+                self._cursor += 1
+                slot = self._cursor % len(self._wheel)
+                due.extend(self._wheel[slot])
+                self._wheel[slot] = []
+        return due
+
+
+class StripedDict:
+    """The :class:`StripedDict <StripedDict>` object, a dict split into
+    stripes by the hash of the key, each stripe with its own lock.
+
+    :attrs stripes (int): number of stripes.
+    """
+
+    __attrs__ = [
+        "stripes",
+    ]
+
+    def __init__(self, stripes=DEFAULT_STRIPES):
+        """
+        :params stripes (int): number of stripes, rounded up to a power of
+                               two so a stripe is picked with a mask.
+        """
+        size = 1
+        while size < stripes:
+            size <<= 1
+        self.stripes = size
+        self._mask = size - 1
+        self._maps = [{} for _ in range(size)]
+        self._locks = [threading.Lock() for _ in range(size)]
+
+    def _stripe(self, key):
+        index = hash(key) & self._mask
+        return self._maps[index], self._locks[index]
+
+    # The hot paths index the stripe inline, a helper call costs as much
+    # as the lock itself
+
+    def get(self, key, default=None):
+        index = hash(key) & self._mask
+        with self._locks[index]:
+            return self._maps[index].get(key, default)
+
+    def set(self, key, value):
+        """Stores ``value`` and returns the previous value, or None."""
+        index = hash(key) & self._mask
+        with self._locks[index]:
+            data = self._maps[index]
+            previous = data.get(key)
+            data[key] = value
+            return previous
+
+    def pop(self, key, default=None):
+        index = hash(key) & self._mask
+        with self._locks[index]:
+            return self._maps[index].pop(key, default)
+
+    def set_field(self, key, field, value):
+        """
+        Sets one field of the dict stored under ``key``, if any.
+
+        :rtype bool: False when ``key`` is missing.
+        """
+        index = hash(key) & self._mask
+        with self._locks[index]:
+            item = self._maps[index].get(key)
+            if item is None:
+                return False
+            item[field] = value
+            return True
+
+    def update(self, key, change, default=None):
+        """
+        Applies ``change`` to the value of ``key`` under its stripe lock.
+
+        :params key (hashable): the key.
+        :params change (callable): takes the current value (``default`` when
+                                   missing) and returns the new one, or None
+                                   to leave the entry as it is.
+        :params default: value passed when the key is missing.
+
+        :rtype: the new value, or None when nothing was stored.
+        """
+        data, lock = self._stripe(key)
+        with lock:
+            value = change(data.get(key, default))
+            if value is not None:
+                data[key] = value
+            return value
+
+    def update_many(self, keys, change, default=None):
+        """
+        Applies ``change`` to the value of each of ``keys``, as
+        :meth:`update` does, taking each stripe lock once for all its keys.
+
+        :params keys (iterable): the keys.
+        :params change (callable): takes the current value and returns the
+                                   new one, or None to leave it.
+        :params default: value passed when a key is missing.
+        """
+        by_stripe = {}
+        for key in keys:
+            by_stripe.setdefault(hash(key) & self._mask, []).append(key)
+        for index, stripe_keys in by_stripe.items():
+            data = self._maps[index]
+            with self._locks[index]:
+                for key in stripe_keys:
+                    value = change(data.get(key, default))
+                    if value is not None:
+                        data[key] = value
+
+    def sweep(self, change):
+        """
+        Applies ``change`` to every item, one stripe lock at a time.
+
+        :params change (callable): takes the key and the value and returns
+                                   the new value, or None to remove the
+                                   entry.
+        """
+        for data, lock in zip(self._maps, self._locks):
+            with lock:
+                for key, value in list(data.items()):
+                    value = change(key, value)
+                    if value is None:
+                        del data[key]
+                    else:
+                        data[key] = value
+
+    def pop_if(self, key, predicate):
+        """
+        Removes ``key`` if ``predicate`` holds for its value, checked and
+        removed under the stripe lock.
+
+        :rtype bool: True if the key was removed.
+        """
+        data, lock = self._stripe(key)
+        with lock:
+            if key in data and predicate(data[key]):
+                del data[key]
+                return True
+            return False
+
+    def __contains__(self, key):
+        data, lock = self._stripe(key)
+        with lock:
+            return key in data
+
+    def __len__(self):
+        return sum(len(data) for data in self._maps)
+
+    def stripes_items(self):
+        """
+        Yields the items of each stripe, copied under that stripe lock only.
+
+        :rtype iterator: lists of ``(key, value)`` pairs, one per stripe.
+        """
+        for data, lock in zip(self._maps, self._locks):
+            with lock:
+                items = list(data.items())
+            yield items
+
+    def items(self):
+        """Returns a copy of every item, taken one stripe at a time."""
+        return [item for items in self.stripes_items() for item in items]
+
+
+def encode_message(payload):
+    """
+    Serialises an offline message, as :meth:`Mailbox.put` stores it.
+
+    :params payload (dict): the message.
+
+    :rtype bytes: its JSON.
+    :raises ValueError: when it is larger than ``OFFLINE_MESSAGE_BYTES``.
+    """
+    body = json.dumps(payload).encode('utf-8')
+    if len(body) > OFFLINE_MESSAGE_BYTES:
+        raise ValueError("message larger than {} bytes".format(OFFLINE_MESSAGE_BYTES))
+    return body
+
+
+class Mailbox:
+    """The :class:`Mailbox <Mailbox>` object, the offline messages of all
+    the users: each body once, serialised, with the count of the queues
+    holding it, and a queue of message IDs per user.
+
+    The IDs grow with each message, so a queue is sorted and an ID is a
+    cursor: a user reads the messages after a cursor one page at a time,
+    then acknowledges the last ID read, which removes that message and the
+    older ones. A queue keeps at most ``backlog`` messages (the oldest are
+    dropped), and a message expires ``ttl`` seconds after it was stored.
+
+    The queues are striped by user. The bodies share one lock, taken once
+    per message stored and once per acknowledgement. A body is freed when
+    no queue holds it any more.
+
+    :attrs backlog (int): messages kept per user.
+    :attrs ttl (float): seconds a message is kept.
+    :attrs dropped (int): messages dropped from a full queue.
+    """
+
+    __attrs__ = [
+        "backlog",
+        "ttl",
+        "dropped",
+    ]
+
+    def __init__(self, stripes=DEFAULT_STRIPES, backlog=OFFLINE_BACKLOG, ttl=OFFLINE_TTL):
+        """
+        :params stripes (int): stripes of the per-user queues.
+        :params backlog (int): messages kept per user.
+        :params ttl (float): seconds a message is kept.
+        """
+        self.backlog = backlog
+        self.ttl = ttl
+        self.dropped = 0
+        self._queues = StripedDict(stripes)
+        # Message ID -> [queues holding it, JSON body, expiry time]
+        self._bodies = {}
+        self._bodies_lock = threading.Lock()
+        self._ids = itertools.count(1)
+
+    def put(self, recipients, payload, now=None):
+        """
+        Stores one message for every user of ``recipients``.
+
+        :params recipients (iterable): the usernames.
+        :params payload (dict): the message, serialised here once, or the
+                                bytes of :func:`encode_message`.
+        :params now (float): current time, ``time.time()`` by default.
+
+        :rtype int: the message ID, None when there is no recipient.
+        :raises ValueError: when the serialised message is larger than
+                            ``OFFLINE_MESSAGE_BYTES``.
+        """
+        recipients = set(recipients)
+        if not recipients:
+            return None
+        body = payload if isinstance(payload, bytes) else encode_message(payload)
+        now = time.time() if now is None else now
+        message_id = next(self._ids)
+        with self._bodies_lock:
+            self._bodies[message_id] = [len(recipients), body, now + self.ttl]
+
+        dropped = []
+
+        def append(ids):
+            ids = [] if ids is None else ids
+            # Two puts may reach a queue in either order: keep it sorted
+            # for the bisect of page and ack
+            bisect.insort(ids, message_id)
+            if len(ids) > self.backlog:
+                dropped.extend(ids[:-self.backlog])
+                del ids[:-self.backlog]
+            return ids
+
+        self._queues.update_many(recipients, append)
+        if dropped:
+            self._release(dropped)
+            with self._bodies_lock:
+                self.dropped += len(dropped)
+        return message_id
+
+    def page(self, username, after=0, limit=OFFLINE_PAGE_SIZE, now=None):
+        """
+        Reads the messages of ``username`` after the cursor ``after``,
+        without removing them: at most ``limit`` messages and about
+        ``OFFLINE_PAGE_BYTES`` bytes, at least one message.
+
+        :params username (str): the recipient.
+        :params after (int): the last message ID already read.
+        :params limit (int): messages at most.
+        :params now (float): current time, expired messages are skipped.
+
+        :rtype (list, int, bool): the JSON bodies (bytes), oldest first,
+                                  the cursor of the page (its last ID, or
+                                  ``after``) and whether more follow.
+        """
+        now = time.time() if now is None else now
+        page = []
+
+        def read(ids):
+            if ids:
+                start = bisect.bisect_right(ids, after)
+                page.extend(ids[start:start + limit])
+                page.append(start + limit < len(ids))
+            # Nothing to store back
+            return None
+
+        self._queues.update(username, read)
+        if not page:
+            return [], after, False
+        more = page.pop()
+        bodies = []
+        size = 0
+        cursor = after
+        for message_id in page:
+            entry = self._bodies.get(message_id)
+            if entry is None:
+                # Acknowledged since the queue was read
+                cursor = message_id
+                continue
+            if bodies and size + len(entry[1]) > OFFLINE_PAGE_BYTES:
+                more = True
+                break
+            cursor = message_id
+            if entry[2] > now:
+                bodies.append(entry[1])
+                size += len(entry[1])
+        return bodies, cursor, more
+
+    def ack(self, username, cursor):
+        """
+        Removes the messages of ``username`` up to the ID ``cursor``, the
+        last one it read.
+
+        :rtype int: the messages removed.
+        """
+        acked = []
+
+        def remove(ids):
+            if ids:
+                end = bisect.bisect_right(ids, cursor)
+                acked.extend(ids[:end])
+                del ids[:end]
+            return None
+
+        self._queues.update(username, remove)
+        if acked:
+            # Unless a message came in meanwhile
+            self._queues.pop_if(username, lambda ids: not ids)
+            self._release(acked)
+        return len(acked)
+
+    def purge(self, now=None):
+        """
+        Removes the expired messages from every queue, one stripe at a
+        time, and the queues left empty.
+
+        :rtype int: the messages removed.
+        """
+        now = time.time() if now is None else now
+        expired = []
+        bodies = self._bodies
+
+        def drop(username, ids):
+            # Expiry times follow the IDs: the expired messages come first
+            end = 0
+            while end < len(ids) and bodies[ids[end]][2] <= now:
+                end += 1
+            if end:
+                expired.extend(ids[:end])
+                del ids[:end]
+            return ids or None
+
+        self._queues.sweep(drop)
+        self._release(expired)
+        return len(expired)
+
+    def _release(self, message_ids):
+        # Each ID left one queue
+        with self._bodies_lock:
+            for message_id in message_ids:
+                entry = self._bodies[message_id]
+                entry[0] -= 1
+                if not entry[0]:
+                    del self._bodies[message_id]
+
+    def __contains__(self, username):
+        return username in self._queues
+
+    def __len__(self):
+        return len(self._queues)
+
+    def stats(self):
+        """
+        Returns the queues and the stored bodies.
+
+        :rtype dict: ``queues``, ``bodies``, ``body_bytes`` and ``dropped``.
+        """
+        with self._bodies_lock:
+            body_bytes = sum(len(entry[1]) for entry in self._bodies.values())
+            bodies = len(self._bodies)
+        return {"queues": len(self._queues), "bodies": bodies, "body_bytes": body_bytes,
+                "dropped": self.dropped}
+
+
+def messages_json(bodies):
+    """Returns the JSON array of message bodies read from a :class:`Mailbox`."""
+    return JSONBytes(b"[" + b", ".join(bodies) + b"]")
+
+
+def page_json(bodies, cursor, more):
+    """
+    Returns the ``/api/fetch_offline`` body of a page of :meth:`Mailbox.page`.
+
+    :rtype JSONBytes: ``{"status", "messages", "cursor", "more"}``.
+    """
+    return JSONBytes(b'{"status": "ok", "messages": %s, "cursor": %d, "more": %s}' % (
+        messages_json(bodies), cursor, b"true" if more else b"false"))
+
+
+class Snapshot:
+    """The :class:`Snapshot <Snapshot>` object, an immutable view of the
+    live peers and of the channels at one version of the tracker.
+
+    Its structures are never modified once published, a writer builds the
+    next snapshot from copies. Each JSON body is serialised on first use
+    and cached with the snapshot.
+
+    :attrs version (int): number of changes published before it.
+    :attrs peers (dict): username -> ``{"ip", "port", "last_seen"}``, the
+                         ``last_seen`` as of the publication.
+    :attrs channels (tuple): channel names, in creation order.
+    :attrs live (dict): channel name -> frozenset of its live members.
+    :attrs log (list): ``(version, peers, channels)`` changes up to this
+                       version at least, consecutive versions: the peers
+                       registered or moved (username -> info) or dropped
+                       (username -> None), the channels created.
+    """
+
+    __attrs__ = [
+        "version",
+        "peers",
+        "channels",
+        "live",
+        "log",
+    ]
+
+    def __init__(self, version, peers, channels, live, log=()):
+        self.version = version
+        self.peers = peers
+        self.channels = channels
+        self.live = live
+        self.log = log
+        self._json = {}
+
+    def _cached(self, key, build):
+        body = self._json.get(key)
+        if body is None:
+            # Two first readers may both serialise it, either copy is kept
+            body = JSONBytes(json.dumps(build()).encode('utf-8'))
+            self._json[key] = body
+        return body
+
+    def channel_peers(self, channel):
+        """Returns the live peers which are members of ``channel``."""
+        peers = self.peers
+        return {username: peers[username]
+                for username in self.live.get(channel, ()) if username in peers}
+
+    def peers_json(self):
+        """Returns the ``/get-peers`` body, every live peer."""
+        return self._cached("peers", lambda: self.peers)
+
+    def channels_json(self):
+        """Returns the ``/channels/list`` body."""
+        return self._cached("channels", lambda: {"status": "ok",
+                                                 "channels": list(self.channels)})
+
+    def changes_since(self, since):
+        """
+        Merges the changes published after version ``since``.
+
+        :params since (int): version the client is at.
+
+        :rtype dict: ``{"version", "full": False, "peers", "left",
+                     "channels"}``, the peers to add or update, the
+                     usernames to drop and the new channels; or ``{"version",
+                     "full": True, "peers", "channels"}``, the whole lists,
+                     when ``since`` is not in the log.
+        """
+        log = self.log
+        first = log[0][0] if log else self.version + 1
+        if not first - 1 <= since <= self.version:
+            return {"version": self.version, "full": True,
+                    "peers": self.peers, "channels": list(self.channels)}
+        peers = {}
+        left = set()
+        channels = []
+        # Entries after self.version may be appended meanwhile, not read
+        for _, changed, created in log[since + 1 - first:self.version + 1 - first]:
+            for username, peer in changed.items():
+                if peer is None:
+                    peers.pop(username, None)
+                    left.add(username)
+                else:
+                    peers[username] = peer
+                    left.discard(username)
+            channels.extend(created)
+        return {"version": self.version, "full": False, "peers": peers,
+                "left": sorted(left), "channels": channels}
+
+    def changes_json(self, since):
+        """Returns the ``/get-peers?since=`` body of :meth:`changes_since`."""
+        log = self.log
+        if not log or since < log[0][0] - 1 or since > self.version:
+            return self._cached("full", lambda: self.changes_since(since))
+        if self.version - since > DELTA_CACHE_DEPTH:
+            # Rare old cursor, not worth keeping
+            return JSONBytes(json.dumps(self.changes_since(since)).encode('utf-8'))
+        return self._cached(("since", since), lambda: self.changes_since(since))
+
+    def channel_peers_json(self, channel):
+        """Returns the ``/channels/peers`` body of ``channel``."""
+        if channel not in self.live:
+            # Not cached, unknown names would grow the cache
+            return EMPTY_JSON
+        return self._cached(("channel", channel), lambda: self.channel_peers(channel))
+
+
+#: Body of an empty JSON object.
+EMPTY_JSON = JSONBytes(b"{}")
+
+
+class TrackerState:
+    """The :class:`TrackerState <TrackerState>` object, everything the
+    tracker remembers, with one lock per structure and striped per-user
+    locks.
+
+    :attrs users (dict): username -> password, replaced whole on load.
+    :attrs sessions (StripedDict): session ID -> username.
+    :attrs peers (StripedDict): username -> ``{"ip", "port", "last_seen"}``.
+    :attrs channels (dict): channel name -> set of member usernames.
+    :attrs offline (Mailbox): the messages waiting for their recipients.
+    :attrs heartbeat_timeout (int): seconds before a silent peer is dropped.
+    :attrs snapshot (Snapshot): the current read view, replaced whole.
+    """
+
+    __attrs__ = [
+        "users",
+        "sessions",
+        "peers",
+        "channels",
+        "offline",
+        "heartbeat_timeout",
+        "snapshot",
+    ]
+
+    def __init__(self, stripes=DEFAULT_STRIPES, heartbeat_timeout=HEARTBEAT_TIMEOUT):
+        """
+        :params stripes (int): stripes of the per-user structures.
+        :params heartbeat_timeout (int): seconds before a silent peer is
+                                         dropped.
+        """
+        self.users = {}
+        self.sessions = StripedDict(stripes)
+        self.peers = StripedDict(stripes)
+        self.channels = {DEFAULT_CHANNEL: set()}
+        self.offline = Mailbox(stripes)
+        self.heartbeat_timeout = heartbeat_timeout
+        # The channels, their live members and the channels of each user,
+        # updated together
+        self._channel_lock = threading.Lock()
+        self._live = {DEFAULT_CHANNEL: set()}
+        self._memberships = {}
+        self._expiry = ExpiryWheel()
+        self._log = []
+        # Long polls to wake, username -> set of polls
+        self._watch_lock = threading.Lock()
+        self._watchers = {}
+        self.snapshot = Snapshot(int(time.time() * 1000), {}, (DEFAULT_CHANNEL,),
+                                 {DEFAULT_CHANNEL: frozenset()}, self._log)
+
+    # Users and sessions
+
+    def load_users(self, users):
+        """Replaces the user table, readers see the old or the new one."""
+        self.users = dict(users)
+
+    def login(self, username, password):
+        """
+        Checks a password and opens a session.
+
+        :rtype str: the new session ID, or None for invalid credentials.
+        """
+        expected = self.users.get(username)
+        if not expected or expected != password:
+            return None
+        session_id = secrets.token_hex(16)
+        self.sessions.set(session_id, username)
+        return session_id
+
+    def session_user(self, session_id):
+        """Returns the username of a session, or None."""
+        if not session_id:
+            return None
+        return self.sessions.get(session_id)
+
+    # Peers
+
+    def register_peer(self, username, ip, port, now=None):
+        """Registers (or moves) the P2P endpoint of a user and adds them to
+        the default channel."""
+        now = int(time.time()) if now is None else now
+        previous = self.peers.set(username, {"ip": ip, "port": port, "last_seen": now})
+        if previous is None:
+            # A known peer is already on the wheel
+            self._expiry.schedule(username, now + self.heartbeat_timeout, now)
+        elif previous["ip"] == ip and previous["port"] == port:
+            # Same endpoint, already live everywhere: a heartbeat
+            return
+        with self._channel_lock:
+            self._add_member(DEFAULT_CHANNEL, username)
+            # Live again in every channel kept since an earlier registration
+            for channel in self._memberships[username]:
+                self._live[channel].add(username)
+            self._publish([username], self._memberships[username])
+
+    def heartbeat(self, username, now=None):
+        """
+        Refreshes the ``last_seen`` of a peer, under its stripe lock only.
+        The wheel is not touched, the reaper reads ``last_seen`` when the
+        peer comes up.
+
+        :rtype bool: False when the user is not registered.
+        """
+        return self.peers.set_field(username, "last_seen",
+                                    int(time.time()) if now is None else now)
+
+    def active_peers(self):
+        """
+        Returns the live peers of the current snapshot, without locking.
+        Expired peers were removed by the reaper.
+
+        :rtype dict: username -> peer info, not to be modified.
+        """
+        return self.snapshot.peers
+
+    def reap(self, now=None):
+        """
+        Drops the peers of the wheel slots passed since the last reap whose
+        heartbeat is older than the timeout, from the peers and every
+        channel. The others are put back at their new expiry.
+
+        :params now (int): current time, ``time.time()`` by default.
+
+        :rtype list: the dropped usernames.
+        """
+        now = int(time.time()) if now is None else now
+        timeout = self.heartbeat_timeout
+
+        def stale(peer):
+            return now - peer["last_seen"] >= timeout
+
+        expired = []
+        for username in self._expiry.advance(now):
+            # Checked and removed under the stripe lock: a heartbeat racing
+            # the reaper keeps its peer
+            if self.peers.pop_if(username, stale):
+                expired.append(username)
+                continue
+            peer = self.peers.get(username)
+            if peer is not None:
+                self._expiry.schedule(username, peer["last_seen"] + timeout, now)
+        if expired:
+            self._leave_channels(expired)
+        return expired
+
+    def _leave_channels(self, usernames):
+        for username in usernames:
+            print(f"[Tracker] Xoa peer (timeout): {username}")
+        changed = set()
+        with self._channel_lock:
+            for username in usernames:
+                # A new registration since the reap keeps its channels
+                if username in self.peers:
+                    continue
+                for channel in self._memberships.pop(username, ()):
+                    self.channels[channel].discard(username)
+                    self._live[channel].discard(username)
+                    changed.add(channel)
+            self._publish(usernames, changed)
+
+    def start_reaper(self, interval=REAP_TICK, purge_interval=OFFLINE_PURGE_INTERVAL):
+        """
+        Runs :meth:`reap` every ``interval`` seconds in a daemon thread, and
+        :meth:`purge_offline` every ``purge_interval`` seconds.
+
+        :params interval (float): seconds between two reaps.
+        :params purge_interval (float): seconds between two purges.
+        """
+        def loop():
+            next_purge = time.time() + purge_interval
+            while True:
+                time.sleep(interval)
+                try:
+                    self.reap()
+                    if time.time() >= next_purge:
+                        next_purge = time.time() + purge_interval
+                        self.purge_offline()
+                except Exception as e:
+                    print(f"[Tracker] Reaper error: {e}")
+
+        threading.Thread(target=loop, daemon=True).start()
+
+    # Channels
+
+    def _add_member(self, channel, username):
+        # Caller holds the channel lock
+        if channel not in self.channels:
+            self.channels[channel] = set()
+            self._live[channel] = set()
+        self.channels[channel].add(username)
+        self._memberships.setdefault(username, set()).add(channel)
+
+    def _publish(self, usernames, channels):
+        """
+        Publishes the next snapshot, with the peers ``usernames`` and the
+        live members of ``channels`` read again. The caller holds the
+        channel lock, so publications follow the order of the changes.
+
+        :params usernames (iterable): peers registered, moved or dropped.
+        :params channels (iterable): channels created or whose live
+                                     members changed.
+        """
+        previous = self.snapshot
+        version = previous.version + 1
+        peers = previous.peers
+        changed = {}
+        if usernames:
+            peers = dict(peers)
+            for username in usernames:
+                # Read back under the stripe lock, the last write wins
+                peer = self.peers.get(username)
+                if peer is None:
+                    if peers.pop(username, None) is not None:
+                        changed[username] = None
+                else:
+                    peers[username] = changed[username] = dict(peer)
+        live = previous.live
+        names = previous.channels
+        if channels:
+            live = dict(live)
+            for channel in channels:
+                live[channel] = frozenset(self._live[channel])
+            if len(live) != len(names):
+                names = tuple(self.channels)
+        if len(self._log) >= 2 * CHANGE_LOG_SIZE:
+            # A new list, readers of the old one are not disturbed
+            self._log = self._log[-CHANGE_LOG_SIZE:]
+        self._log.append((version, changed, names[len(previous.channels):]))
+        self.snapshot = Snapshot(version, peers, names, live, self._log)
+        self._notify()
+
+    def channel_names(self):
+        """Returns the channel names of the current snapshot."""
+        return list(self.snapshot.channels)
+
+    def join_channel(self, channel, username):
+        with self._channel_lock:
+            created = channel not in self.channels
+            self._add_member(channel, username)
+            live = self._live[channel]
+            if username in self.peers and username not in live:
+                live.add(username)
+            elif not created:
+                # No change to the read view
+                return
+            self._publish((), (channel,))
+
+    def channel_members(self, channel):
+        """
+        Returns every member of ``channel``, live or not.
+
+        :rtype frozenset: the usernames, None for an unknown channel.
+        """
+        with self._channel_lock:
+            members = self.channels.get(channel)
+            return None if members is None else frozenset(members)
+
+    def channel_peers(self, channel):
+        """
+        Returns the active peers which are members of ``channel``, from
+        the current snapshot.
+
+        :rtype dict: username -> peer info, built from the live members of
+                     the channel only.
+        """
+        return self.snapshot.channel_peers(channel)
+
+    # Offline messages
+
+    def store_offline(self, target_user, payload):
+        """
+        Queues a message for a user who is not connected.
+
+        :raises ValueError: when the message is too large.
+        """
+        self.offline.put((target_user,), payload)
+        self._notify(target_user)
+
+    def store_offline_many(self, target_users, payload):
+        """
+        Queues one message for many users (a channel message): one body,
+        each stripe lock taken once, the polls of all of them woken at once.
+
+        :params target_users (iterable): the recipients.
+        :params payload (dict): the message, or the bytes of
+                                :func:`encode_message`.
+
+        :raises ValueError: when the message is too large.
+        """
+        target_users = list(target_users)
+        self.offline.put(target_users, payload)
+        with self._watch_lock:
+            polls = [poll for username in target_users
+                     for poll in self._watchers.get(username, ())]
+        wake_all(polls)
+
+    def fetch_offline(self, username, after=0, limit=OFFLINE_PAGE_SIZE):
+        """
+        Reads a page of the messages queued for ``username`` after the
+        cursor ``after``. They stay queued until :meth:`ack_offline`.
+
+        :rtype (list, int, bool): their JSON bodies, the cursor of the
+                                  page and whether more follow, see
+                                  :meth:`Mailbox.page`.
+        """
+        return self.offline.page(username, after, limit)
+
+    def ack_offline(self, username, cursor):
+        """
+        Removes the messages of ``username`` up to ``cursor``, the cursor
+        of the last page it received.
+
+        :rtype int: the messages removed.
+        """
+        return self.offline.ack(username, cursor)
+
+    def purge_offline(self, now=None):
+        """Removes the expired offline messages, see :meth:`Mailbox.purge`."""
+        expired = self.offline.purge(now)
+        if expired:
+            print(f"[Tracker] Xoa {expired} tin nhan offline het han")
+        return expired
+
+    # Long polls
+
+    def watch(self, username, poll):
+        """Wakes ``poll`` at each change of the peers or the channels, and
+        at each offline message for ``username``."""
+        with self._watch_lock:
+            self._watchers.setdefault(username, set()).add(poll)
+
+    def unwatch(self, username, poll):
+        with self._watch_lock:
+            polls = self._watchers.get(username)
+            if polls is not None:
+                polls.discard(poll)
+                if not polls:
+                    del self._watchers[username]
+
+    def _notify(self, username=None):
+        # All the polls on a publication, those of ``username`` otherwise
+        with self._watch_lock:
+            if username is None:
+                polls = [poll for polls in self._watchers.values() for poll in polls]
+            else:
+                polls = list(self._watchers.get(username, ()))
+        wake_all(polls)
+
+    def events(self, username, since, after=0):
+        """
+        Returns what happened for ``username`` after version ``since``: the
+        changes of the peers and channels, and a page of the offline
+        messages after the cursor ``after``, read as :meth:`fetch_offline`
+        does.
+
+        :rtype JSONBytes: ``{"version", "changes", "messages", "cursor",
+                          "more"}``, with the changes of
+                          :meth:`Snapshot.changes_since` or null; None when
+                          nothing happened.
+        """
+        snapshot = self.snapshot
+        messages, cursor, more = [], after, False
+        if username in self.offline:
+            messages, cursor, more = self.fetch_offline(username, after)
+        if snapshot.version == since and not messages:
+            return None
+        changes = b"null" if snapshot.version == since else snapshot.changes_json(since)
+        return JSONBytes(b'{"version": %d, "changes": %s, "messages": %s, "cursor": %d, "more": %s}' % (
+            snapshot.version, changes, messages_json(messages), cursor,
+            b"true" if more else b"false"))
+
+    def stats(self):
+        """
+        Returns the size of each structure.
+
+        :rtype dict: users, sessions, peers, channels, offline queues and
+                     message bodies.
+        """
+        with self._channel_lock:
+            channels = len(self.channels)
+        return {
+            "version": self.snapshot.version,
+            "users": len(self.users),
+            "sessions": len(self.sessions),
+            "peers": len(self.peers),
+            "channels": channels,
+            "offline": len(self.offline),
+            "offline_bodies": self.offline.stats()["bodies"],
+            "offline_dropped": self.offline.dropped,
+            "expiry_wheel": len(self._expiry),
+            "watchers": len(self._watchers),
+        }
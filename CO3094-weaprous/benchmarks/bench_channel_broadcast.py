@@ -0,0 +1,176 @@
+#
+# Copyright (C) 2025 pdnguyen of HCMC University of Technology VNU-HCM.
+# All rights reserved.
+# This file is part of the CO3093/CO3094 course.
+#
+# WeApRous release
+#
+# The authors hereby grant to Licensee personal permission to use
+# and modify the Licensed Source Code for the sole purpose of studying
+# while attending the course
+#
+
+"""
+benchmarks.bench_channel_broadcast
+~~~~~~~~~~~~~~~~~
+
+Measures the delivery of one message to a large channel, sent the way
+``chat_ui.py`` used to (the client connects to each live member in turn,
+with a 2 s timeout, and queues an offline copy for each failure) and with
+the tracker fan-out of ``/channels/broadcast`` (:func:`fan_out
+<apps.fanout.fan_out>` plus one bulk offline enqueue).
+
+Every member of the channel is one of:
+
+- live: registered at a listener which reads the message;
+- refused: registered at a closed port, the connection fails at once;
+- silent: registered at a listener which never accepts, the connection
+  times out (a peer gone without unregistering);
+- offline: a member which is not a live peer.
+
+Both paths run in process against the same :class:`TrackerState
+<TrackerState>`, the HTTP round trips of the old path (one per offline
+copy) are not counted. The script reports the time to send the message,
+the copies delivered and queued. The old path only knew the live members,
+its offline members never got the message.
+
+Run from the project root::
+
+    python -m benchmarks.bench_channel_broadcast --live 400 --silent 10
+"""
+
+import argparse
+import json
+import socket
+import threading
+import time
+
+from apps.fanout import PUSH_TIMEOUT, fan_out
+from apps.tracker_state import TrackerState
+
+CHANNEL = "big"
+HOST = "127.0.0.1"
+
+
+def reader(server, counter, lock):
+    """Accepts connections and counts the messages read."""
+    while True:
+        try:
+            conn, _ = server.accept()
+        except OSError:
+            return
+        with conn:
+            if conn.recv(4096):
+                with lock:
+                    counter[0] += 1
+
+
+def listen(backlog):
+    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    server.bind((HOST, 0))
+    server.listen(backlog)
+    return server
+
+
+def silent_listener():
+    """A listener whose accept queue is full, new connections hang."""
+    server = listen(0)
+    fillers = []
+    port = server.getsockname()[1]
+    for _ in range(8):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setblocking(False)
+        sock.connect_ex((HOST, port))
+        fillers.append(sock)
+    time.sleep(0.2)
+    return server, fillers
+
+
+def closed_port():
+    sock = listen(1)
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+
+def populate(args, live_port, refused_port, silent_port):
+    """Builds the tracker state, returns it with the sender name."""
+    state = TrackerState()
+    kinds = ([("live", live_port)] * args.live + [("refused", refused_port)] * args.refused
+             + [("silent", silent_port)] * args.silent + [("offline", None)] * args.offline)
+    for i, (kind, port) in enumerate(kinds):
+        username = "{}{}".format(kind, i)
+        state.join_channel(CHANNEL, username)
+        if port is not None:
+            state.register_peer(username, HOST, port)
+    state.join_channel(CHANNEL, "sender")
+    return state, "sender"
+
+
+def client_driven(state, sender, payload):
+    """The old ``_broadcast_to_channel``: one peer after the other."""
+    queued = 0
+    for username, info in state.channel_peers(CHANNEL).items():
+        if username == sender:
+            continue
+        try:
+            with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+                sock.settimeout(PUSH_TIMEOUT)
+                sock.connect((info["ip"], int(info["port"])))
+                sock.sendall(json.dumps(payload).encode('utf-8'))
+        except OSError:
+            # Was one POST /api/send_offline each
+            state.store_offline(username, dict(payload, is_offline=True))
+            queued += 1
+    return queued
+
+
+def server_fan_out(state, sender, payload):
+    """``/channels/broadcast``."""
+    recipients = state.channel_members(CHANNEL) - {sender}
+    peers = state.snapshot.peers
+    targets = {user: (peers[user]["ip"], peers[user]["port"])
+               for user in recipients if user in peers}
+    delivered = fan_out(targets, payload)
+    queued = [user for user in recipients if not delivered.get(user)]
+    state.store_offline_many(queued, dict(payload, is_offline=True))
+    return len(queued)
+
+
+def main(args):
+    counter = [0]
+    lock = threading.Lock()
+    live = listen(1024)
+    threading.Thread(target=reader, args=(live, counter, lock), daemon=True).start()
+    silent, _fillers = silent_listener()
+    refused_port = closed_port()
+
+    payload = {"type": "channel_message", "channel": CHANNEL, "from": "sender",
+               "message": "x" * args.size}
+    print("{} live, {} refused, {} silent, {} offline members".format(
+        args.live, args.refused, args.silent, args.offline))
+    print("{:<14} {:>9} {:>10} {:>8}".format("path", "seconds", "delivered", "queued"))
+    for name, send in (("client-driven", client_driven), ("fan-out", server_fan_out)):
+        state, sender = populate(args, live.getsockname()[1], refused_port,
+                                 silent.getsockname()[1])
+        with lock:
+            counter[0] = 0
+        start = time.perf_counter()
+        queued = send(state, sender, payload)
+        elapsed = time.perf_counter() - start
+        time.sleep(0.2)
+        with lock:
+            delivered = counter[0]
+        print("{:<14} {:>9.2f} {:>10} {:>8}".format(name, elapsed, delivered, queued))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog='bench_channel_broadcast')
+    parser.add_argument('--live', type=int, default=400)
+    parser.add_argument('--refused', type=int, default=40)
+    parser.add_argument('--silent', type=int, default=10)
+    parser.add_argument('--offline', type=int, default=50)
+    parser.add_argument('--size', type=int, default=200,
+                        help='message length in characters')
+    main(parser.parse_args())
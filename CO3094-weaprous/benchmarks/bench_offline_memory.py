@@ -0,0 +1,136 @@
+#
+# Copyright (C) 2025 pdnguyen of HCMC University of Technology VNU-HCM.
+# All rights reserved.
+# This file is part of the CO3093/CO3094 course.
+#
+# WeApRous release
+#
+# The authors hereby grant to Licensee personal permission to use
+# and modify the Licensed Source Code for the sole purpose of studying
+# while attending the course
+#
+
+"""
+benchmarks.bench_offline_memory
+~~~~~~~~~~~~~~~~~
+
+Measures the memory of an offline burst to a large channel: ``--messages``
+channel messages of ``--size`` characters, each queued for every one of
+``--users`` offline members, stored three ways:
+
+- copies: a dict per recipient, as ``/api/send_offline`` stored one copy
+  per offline member (the client sent one request per member);
+- shared: one dict shared by every queue, as the first
+  ``/channels/broadcast`` stored it (and serialised once per fetch);
+- mailbox: :class:`Mailbox <apps.tracker_state.Mailbox>`, one JSON body
+  per message and a queue of message IDs per user, read by pages and
+  acknowledged.
+
+For each layout the script reports the memory held once the burst is
+queued (``tracemalloc``), the time to queue it and to fetch every queue,
+the largest response, and the memory still held once every member fetched: the mailbox frees a
+body with the last acknowledgement.
+
+Run from the project root::
+
+    python -m benchmarks.bench_offline_memory --users 1000 10000
+"""
+
+import argparse
+import gc
+import json
+import time
+import tracemalloc
+
+from apps.tracker_state import Mailbox, StripedDict, page_json
+
+
+class DictQueues:
+    """Offline queues of dicts, in a :class:`StripedDict` as the tracker
+    kept them before the mailbox."""
+
+    def __init__(self, shared):
+        self.shared = shared
+        self.queues = StripedDict()
+
+    def put(self, recipients, payload):
+        def append(messages):
+            messages = [] if messages is None else messages
+            messages.append(payload if self.shared else dict(payload))
+            return messages
+
+        self.queues.update_many(recipients, append)
+
+    def take(self, username):
+        """:rtype int: bytes of the largest response."""
+        return len(json.dumps(self.queues.pop(username, [])).encode('utf-8'))
+
+
+class MailboxQueues:
+    def __init__(self):
+        self.mailbox = Mailbox()
+
+    def put(self, recipients, payload):
+        self.mailbox.put(recipients, payload)
+
+    def take(self, username):
+        # Page by page, each page acknowledged
+        largest = 0
+        cursor, more = 0, True
+        while more:
+            bodies, cursor, more = self.mailbox.page(username, cursor)
+            largest = max(largest, len(page_json(bodies, cursor, more)))
+            self.mailbox.ack(username, cursor)
+        return largest
+
+
+def held():
+    gc.collect()
+    return tracemalloc.get_traced_memory()[0]
+
+
+def run(factory, users, messages, size):
+    """:rtype (int, float, float, int, int): bytes held, put and take
+    seconds, bytes of the largest response, bytes left after every fetch."""
+    members = ["user{}".format(i) for i in range(users)]
+    base = held()
+    queues = factory()
+    start = time.perf_counter()
+    for i in range(messages):
+        payload = {"type": "channel_message", "channel": "big", "from": "sender",
+                   "message": "{:06d}".format(i) + "x" * size,
+                   "is_offline": True, "timestamp": time.time()}
+        queues.put(members, payload)
+        del payload
+    put = time.perf_counter() - start
+    burst = held() - base
+    start = time.perf_counter()
+    largest = max(queues.take(username) for username in members)
+    take = time.perf_counter() - start
+    left = held() - base
+    return burst, put, take, largest, left
+
+
+def main(args):
+    layouts = (("copies", lambda: DictQueues(shared=False)),
+               ("shared", lambda: DictQueues(shared=True)),
+               ("mailbox", MailboxQueues))
+    print("{} messages of {} characters per burst".format(args.messages, args.size))
+    print("{:<8} {:>7} {:>10} {:>8} {:>8} {:>9} {:>9}".format(
+        "layout", "users", "held(KiB)", "put(s)", "take(s)", "resp(KiB)", "left(KiB)"))
+    tracemalloc.start()
+    for users in args.users:
+        for name, factory in layouts:
+            burst, put, take, largest, left = run(factory, users, args.messages, args.size)
+            print("{:<8} {:>7} {:>10.0f} {:>8.3f} {:>8.3f} {:>9.0f} {:>9.0f}".format(
+                name, users, burst / 1024, put, take, largest / 1024, left / 1024))
+    tracemalloc.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog='bench_offline_memory')
+    parser.add_argument('--users', type=int, nargs='+', default=[1000, 10000])
+    parser.add_argument('--messages', type=int, default=50)
+    parser.add_argument('--size', type=int, default=200,
+                        help='message length in characters')
+    main(parser.parse_args())
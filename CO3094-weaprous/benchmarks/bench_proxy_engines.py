@@ -0,0 +1,164 @@
+#
+# Copyright (C) 2025 pdnguyen of HCMC University of Technology VNU-HCM.
+# All rights reserved.
+# This file is part of the CO3093/CO3094 course.
+#
+# WeApRous release
+#
+# The authors hereby grant to Licensee personal permission to use
+# and modify the Licensed Source Code for the sole purpose of studying
+# while attending the course
+#
+
+"""
+benchmarks.bench_proxy_engines
+~~~~~~~~~~~~~~~~~
+
+Compares the threaded and the asyncio proxy engines under many concurrent
+client connections.
+
+A stub upstream answers every request after a fixed delay, so all the
+client connections of one level are in flight through the proxy at the
+same time. For every engine and concurrency level the proxy runs in a
+fresh subprocess, and the script reports completed requests, latency
+percentiles and the peak resident memory of the proxy process.
+
+The benchmark process holds two descriptors per connection (client and
+stub upstream side), so the 10k level needs a hard ``ulimit -n`` above 20k.
+
+Run from the project root::
+
+    python -m benchmarks.bench_proxy_engines --levels 1000 5000 10000
+"""
+
+import argparse
+import asyncio
+import subprocess
+import sys
+import time
+
+from daemon.asyncproxy import raise_open_file_limit
+
+HOST = "127.0.0.1"
+
+UPSTREAM_RESPONSE = (
+    b"HTTP/1.1 200 OK\r\n"
+    b"Content-Type: text/plain\r\n"
+    b"Content-Length: 2\r\n"
+    b"Connection: close\r\n"
+    b"\r\n"
+    b"ok"
+)
+
+PROXY_SCRIPT = """
+import sys
+from daemon import create_proxy, create_async_proxy
+routes = {{'bench.local': ('{host}:{upstream}', 'round-robin', {{}})}}
+engine = create_async_proxy if '{engine}' == 'asyncio' else create_proxy
+engine('{host}', {port}, routes)
+"""
+
+
+async def start_upstream(port, delay):
+    """Starts the stub backend answering every request after ``delay``."""
+
+    async def on_request(reader, writer):
+        try:
+            await reader.readuntil(b"\r\n\r\n")
+            await asyncio.sleep(delay)
+            writer.write(UPSTREAM_RESPONSE)
+            await writer.drain()
+        except (OSError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    return await asyncio.start_server(on_request, HOST, port, backlog=16384)
+
+
+def peak_rss_kb(pid):
+    """Returns the peak resident memory (VmHWM) of a process in KB."""
+    try:
+        with open("/proc/{}/status".format(pid)) as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return 0
+
+
+async def one_client(port, timeout):
+    """Sends one request through the proxy and returns its latency."""
+    start = time.perf_counter()
+    reader, writer = await asyncio.wait_for(asyncio.open_connection(HOST, port), timeout)
+    try:
+        writer.write(b"GET / HTTP/1.1\r\nHost: bench.local\r\n\r\n")
+        await writer.drain()
+        data = await asyncio.wait_for(reader.read(), timeout)
+        if not data.startswith(b"HTTP/1.1 200"):
+            raise ValueError("bad response")
+    finally:
+        writer.close()
+    return time.perf_counter() - start
+
+
+async def run_level(engine, level, proxy_port, upstream_port, timeout):
+    """Runs one engine at one concurrency level."""
+    script = PROXY_SCRIPT.format(host=HOST, port=proxy_port,
+                                 upstream=upstream_port, engine=engine)
+    proxy = subprocess.Popen([sys.executable, "-c", script],
+                             stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        await asyncio.sleep(1.0)
+        start = time.perf_counter()
+        results = await asyncio.gather(
+            *(one_client(proxy_port, timeout) for _ in range(level)),
+            return_exceptions=True)
+        elapsed = time.perf_counter() - start
+        rss = peak_rss_kb(proxy.pid)
+    finally:
+        proxy.kill()
+        proxy.wait()
+
+    latencies = sorted(r for r in results if isinstance(r, float))
+    errors = len(results) - len(latencies)
+
+    def pct(p):
+        if not latencies:
+            return float('nan')
+        return latencies[min(len(latencies) - 1, int(p * len(latencies)))] * 1000
+
+    print("{:<9} {:>6} {:>6} {:>6} {:>8.2f} {:>9.1f} {:>9.1f} {:>9.1f}".format(
+        engine, level, len(latencies), errors, elapsed,
+        pct(0.50), pct(0.99), rss / 1024.0))
+
+
+async def main(args):
+    raise_open_file_limit()
+    upstream = await start_upstream(args.upstream_port, args.delay)
+    print("{:<9} {:>6} {:>6} {:>6} {:>8} {:>9} {:>9} {:>9}".format(
+        "engine", "conns", "ok", "errors", "wall(s)", "p50(ms)", "p99(ms)", "rss(MB)"))
+    try:
+        run = 0
+        for level in args.levels:
+            for engine in args.engines:
+                # A fresh port per run, the previous one lingers in TIME_WAIT
+                await run_level(engine, level, args.proxy_port + run,
+                                args.upstream_port, args.timeout)
+                run += 1
+    finally:
+        upstream.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog='bench_proxy_engines')
+    parser.add_argument('--levels', type=int, nargs='+', default=[1000, 5000, 10000])
+    parser.add_argument('--engines', nargs='+', default=['threaded', 'asyncio'],
+                        choices=['threaded', 'asyncio'])
+    parser.add_argument('--delay', type=float, default=1.0,
+                        help='Seconds the stub upstream holds every request.')
+    parser.add_argument('--timeout', type=float, default=60.0)
+    parser.add_argument('--proxy-port', type=int, default=18080)
+    parser.add_argument('--upstream-port', type=int, default=19000)
+    asyncio.run(main(parser.parse_args()))
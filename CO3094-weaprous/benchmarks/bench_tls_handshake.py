@@ -0,0 +1,233 @@
+#
+# Copyright (C) 2025 pdnguyen of HCMC University of Technology VNU-HCM.
+# All rights reserved.
+# This file is part of the CO3093/CO3094 course.
+#
+# WeApRous release
+#
+# The authors hereby grant to Licensee personal permission to use
+# and modify the Licensed Source Code for the sole purpose of studying
+# while attending the course
+#
+
+"""
+benchmarks.bench_tls_handshake
+~~~~~~~~~~~~~~~~~
+
+Measures the cost of TLS termination at the proxy, and what session
+resumption saves, with one new connection per request.
+
+A self-signed certificate (ECDSA P-256, or RSA 2048 with ``--key-type
+rsa``) is generated with ``openssl`` in a temporary directory. The proxy runs in a subprocess with a plaintext listener and a
+TLS listener (one shared ``SSLContext``), both routed to one WeApRous
+backend. Client threads send ``GET /ping`` in three modes:
+
+- ``plain``: plaintext listener, the baseline;
+- ``full``: TLS without a saved session, every connection runs the full
+  handshake;
+- ``resumed``: TLS offering the session of the previous connection of the
+  thread, so the proxy resumes it.
+
+The script reports handshakes (connections) per second, the handshake
+latency percentiles and the share of connections actually resumed.
+
+Run from the project root::
+
+    python -m benchmarks.bench_tls_handshake --engine threaded --requests 2000
+"""
+
+import argparse
+import os
+import shutil
+import socket
+import ssl
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from daemon.tls import generate_self_signed
+
+HOST = "127.0.0.1"
+
+BACKEND_SCRIPT = """
+from daemon.weaprous import WeApRous
+app = WeApRous()
+
+@app.route('/ping', methods=['GET'])
+def ping(headers, body):
+    return {{"pong": True}}
+
+app.prepare_address('{host}', {port})
+app.run()
+"""
+
+PROXY_SCRIPT = """
+from daemon import create_proxy, create_async_proxy
+from daemon.tls import create_server_context
+routes = {{'localhost': ('{host}:{backend}', 'round-robin', {{}})}}
+context = create_server_context({cert!r}, {key!r})
+engine = create_async_proxy if '{engine}' == 'asyncio' else create_proxy
+engine('{host}', {port}, routes, {tls_port}, context)
+"""
+
+REQUEST = b"GET /ping HTTP/1.1\r\nHost: localhost\r\n\r\n"
+
+
+def client_context(certfile, version):
+    """Client context trusting the self-signed certificate."""
+    context = ssl.create_default_context(cafile=certfile)
+    if version == "1.2":
+        context.maximum_version = ssl.TLSVersion.TLSv1_2
+    return context
+
+
+def one_request(port, context, session):
+    """
+    Opens one connection, sends one request and reads the response.
+
+    :rtype (float, float, ssl.SSLSession, bool): handshake seconds, total
+        seconds, the session to offer next time and whether it resumed.
+    """
+    start = time.perf_counter()
+    sock = socket.create_connection((HOST, port))
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    reused = False
+    try:
+        if context is not None:
+            sock = context.wrap_socket(sock, server_hostname="localhost",
+                                       session=session)
+            reused = sock.session_reused
+        handshake = time.perf_counter() - start
+        sock.sendall(REQUEST)
+        data = b""
+        while True:
+            chunk = sock.recv(65536)
+            if not chunk:
+                break
+            data += chunk
+        if context is not None:
+            # TLS 1.3 tickets arrive after the handshake, with the data
+            session = sock.session
+    finally:
+        sock.close()
+    if not data.startswith(b"HTTP/1.1 200"):
+        raise ValueError("bad response: {!r}".format(data[:40]))
+    return handshake, time.perf_counter() - start, session, reused
+
+
+def run_mode(port, context, resume, requests, concurrency):
+    """
+    Sends ``requests`` requests from ``concurrency`` threads.
+
+    :rtype (list, int, int, float): sorted handshake latencies, resumed
+                                    connections, errors and wall time.
+    """
+    handshakes = []
+    counters = [0, 0]
+    lock = threading.Lock()
+    per_thread = requests // concurrency
+
+    def worker():
+        mine = []
+        resumed = failed = 0
+        session = None
+        for _ in range(per_thread):
+            try:
+                handshake, _, saved, reused = one_request(port, context, session)
+            except (OSError, ValueError):
+                failed += 1
+                continue
+            mine.append(handshake)
+            resumed += reused
+            if resume:
+                session = saved
+        with lock:
+            handshakes.extend(mine)
+            counters[0] += resumed
+            counters[1] += failed
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return sorted(handshakes), counters[0], counters[1], time.perf_counter() - start
+
+
+def report(name, handshakes, resumed, errors, elapsed):
+    def pct(p):
+        if not handshakes:
+            return float('nan')
+        return handshakes[min(len(handshakes) - 1, int(p * len(handshakes)))] * 1000
+
+    print("{:<8} {:>6} {:>6} {:>8} {:>8.0f} {:>9.3f} {:>9.3f} {:>9.3f}".format(
+        name, len(handshakes), errors, resumed, len(handshakes) / elapsed,
+        pct(0.50), pct(0.90), pct(0.99)))
+
+
+def main(args):
+    workdir = tempfile.mkdtemp(prefix="weaprous-tls-")
+    certfile = os.path.join(workdir, "cert.pem")
+    keyfile = os.path.join(workdir, "key.pem")
+    generate_self_signed(certfile, keyfile, key_type=args.key_type)
+
+    quiet = dict(stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    backend = subprocess.Popen([sys.executable, "-c", BACKEND_SCRIPT.format(
+        host=HOST, port=args.backend_port)], **quiet)
+    proxy = subprocess.Popen([sys.executable, "-c", PROXY_SCRIPT.format(
+        host=HOST, port=args.proxy_port, tls_port=args.tls_port,
+        backend=args.backend_port, cert=certfile, key=keyfile,
+        engine=args.engine)], **quiet)
+    try:
+        time.sleep(1.5)
+        context = client_context(certfile, args.tls_version)
+        modes = [
+            ("plain", args.proxy_port, None, False),
+            ("full", args.tls_port, context, False),
+            ("resumed", args.tls_port, context, True),
+        ]
+        for _, port, ctx, resume in modes:
+            run_mode(port, ctx, resume, 100, 4)
+
+        print("{} engine, TLS {}, {} key, {} connections per round, "
+              "{} client threads".format(args.engine, args.tls_version, args.key_type,
+                                         args.requests, args.concurrency))
+        print("{:<8} {:>6} {:>6} {:>8} {:>8} {:>9} {:>9} {:>9}".format(
+            "mode", "ok", "errors", "resumed", "conn/s",
+            "hs p50ms", "hs p90ms", "hs p99ms"))
+        totals = {name: [[], 0, 0, 0.0] for name, _, _, _ in modes}
+        # Alternate the modes so drifts of the machine hit all of them
+        for _ in range(args.rounds):
+            for name, port, ctx, resume in modes:
+                handshakes, resumed, errors, elapsed = run_mode(
+                    port, ctx, resume, args.requests, args.concurrency)
+                total = totals[name]
+                total[0].extend(handshakes)
+                total[1] += resumed
+                total[2] += errors
+                total[3] += elapsed
+        for name, (handshakes, resumed, errors, elapsed) in totals.items():
+            report(name, sorted(handshakes), resumed, errors, elapsed)
+    finally:
+        proxy.kill()
+        backend.kill()
+        proxy.wait()
+        backend.wait()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog='bench_tls_handshake')
+    parser.add_argument('--engine', default='threaded', choices=['threaded', 'asyncio'])
+    parser.add_argument('--tls-version', default='1.3', choices=['1.2', '1.3'])
+    parser.add_argument('--key-type', default='ec', choices=['ec', 'rsa'])
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--rounds', type=int, default=3)
+    parser.add_argument('--proxy-port', type=int, default=18280)
+    parser.add_argument('--tls-port', type=int, default=18643)
+    parser.add_argument('--backend-port', type=int, default=19280)
+    main(parser.parse_args())
@@ -0,0 +1,238 @@
+#
+# Copyright (C) 2025 pdnguyen of HCMC University of Technology VNU-HCM.
+# All rights reserved.
+# This file is part of the CO3093/CO3094 course.
+#
+# WeApRous release
+#
+# The authors hereby grant to Licensee personal permission to use
+# and modify the Licensed Source Code for the sole purpose of studying
+# while attending the course
+#
+
+"""
+benchmarks.bench_tracker_contention
+~~~~~~~~~~~~~~~~~
+
+Measures the heartbeat throughput of the tracker state under contention,
+with one global lock versus :class:`TrackerState <TrackerState>` (a lock
+per structure, striped per-user locks).
+
+Every simulated user is logged in and registered. Worker threads run the
+``/heartbeat`` path (session lookup, then heartbeat) for random users,
+while poller threads build the ``/get-peers`` body in a loop, as the chat
+clients do every few seconds (``--poll-rate`` bodies per second each, 0
+for as fast as possible): a scan of every peer and its ``json.dumps``
+under the global lock, the cached JSON of the current snapshot for
+:class:`TrackerState <TrackerState>`. The script reports the heartbeats
+and bodies per second and the heartbeat latency percentiles for each
+layout, at each population, and the longest time a body keeps a heartbeat
+waiting: the whole scan under the global lock, none with the snapshots.
+
+Under the GIL the threads never run Python code in parallel, so the
+throughput of both layouts is bound by the interpreter; what striping
+removes is the lock wait of the heartbeats behind a scan (and, on a
+free-threaded build, the serialisation itself).
+
+Run from the project root::
+
+    python -m benchmarks.bench_tracker_contention --users 1000 10000
+"""
+
+import argparse
+import json
+import random
+import secrets
+import threading
+import time
+
+from apps.tracker_state import TrackerState
+
+HEARTBEAT_TIMEOUT = 30
+
+
+class GlobalLockState:
+    """The tracker state before striping: every structure behind one lock,
+    as the handlers of ``start_sampleapp.py`` used it."""
+
+    def __init__(self):
+        self.db_lock = threading.Lock()
+        self.users = {}
+        self.sessions = {}
+        self.peers = {}
+        self.channels = {"chung": []}
+
+    def load_users(self, users):
+        with self.db_lock:
+            self.users = dict(users)
+
+    def login(self, username, password):
+        with self.db_lock:
+            expected = self.users.get(username)
+        if not expected or expected != password:
+            return None
+        session_id = secrets.token_hex(16)
+        with self.db_lock:
+            self.sessions[session_id] = username
+        return session_id
+
+    def session_user(self, session_id):
+        with self.db_lock:
+            return self.sessions.get(session_id)
+
+    def register_peer(self, username, ip, port, now=None):
+        with self.db_lock:
+            self.peers[username] = {"ip": ip, "port": port,
+                                    "last_seen": int(time.time())}
+            if username not in self.channels["chung"]:
+                self.channels["chung"].append(username)
+
+    def heartbeat(self, username, now=None):
+        with self.db_lock:
+            if username not in self.peers:
+                return False
+            self.peers[username]['last_seen'] = int(time.time())
+        return True
+
+    def active_peers(self, now=None):
+        active = {}
+        current_time = int(time.time())
+        with self.db_lock:
+            for username, data in self.peers.copy().items():
+                if (current_time - data['last_seen']) < HEARTBEAT_TIMEOUT:
+                    active[username] = data
+                else:
+                    del self.peers[username]
+                    for members in self.channels.values():
+                        if username in members:
+                            members.remove(username)
+        return active
+
+    def peers_json(self):
+        return json.dumps(self.active_peers()).encode('utf-8')
+
+
+def peers_body(state):
+    """Builds the ``/get-peers`` body as the tracker serves it."""
+    if isinstance(state, GlobalLockState):
+        return state.peers_json()
+    return state.snapshot.peers_json()
+
+
+def populate(state, users):
+    """Logs in and registers ``users`` users, returns their session IDs."""
+    state.load_users({"user{}".format(i): "pw" for i in range(users)})
+    sessions = []
+    for i in range(users):
+        username = "user{}".format(i)
+        sessions.append(state.login(username, "pw"))
+        state.register_peer(username, "127.0.0.1", 10000 + i % 50000)
+    return sessions
+
+
+def run(state, sessions, workers, pollers, duration, poll_rate=0):
+    """
+    Runs heartbeat workers and ``/get-peers`` pollers for ``duration``,
+    each poller building at most ``poll_rate`` bodies per second (0 for
+    no limit).
+
+    :rtype (list, int, float): sorted heartbeat latencies, bodies built
+                               and the measured seconds.
+    """
+    stop = threading.Event()
+    latencies = []
+    scans = [0]
+    lock = threading.Lock()
+
+    def worker(seed):
+        rng = random.Random(seed)
+        mine = []
+        while not stop.is_set():
+            session_id = sessions[rng.randrange(len(sessions))]
+            start = time.perf_counter()
+            username = state.session_user(session_id)
+            state.heartbeat(username)
+            mine.append(time.perf_counter() - start)
+        with lock:
+            latencies.extend(mine)
+
+    def poller():
+        done = 0
+        period = 1.0 / poll_rate if poll_rate else 0.0
+        due = time.perf_counter()
+        while not stop.is_set():
+            peers_body(state)
+            done += 1
+            if period:
+                due += period
+                delay = due - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+        with lock:
+            scans[0] += done
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(workers)]
+    threads += [threading.Thread(target=poller) for _ in range(pollers)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    time.sleep(duration)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    return sorted(latencies), scans[0], time.perf_counter() - start
+
+
+def scan_hold(state):
+    """
+    Returns the longest time one ``/get-peers`` scan holds a lock the
+    heartbeats need, in seconds.
+    """
+    if isinstance(state, GlobalLockState):
+        start = time.perf_counter()
+        with state.db_lock:
+            list(state.peers.copy().items())
+        return time.perf_counter() - start
+    # Snapshot readers take no lock
+    return 0.0
+
+
+def report(name, users, latencies, scans, elapsed, hold):
+    def pct(p):
+        if not latencies:
+            return float('nan')
+        return latencies[min(len(latencies) - 1, int(p * len(latencies)))] * 1e6
+
+    print("{:<8} {:>7} {:>10.0f} {:>8.0f} {:>9.1f} {:>9.1f} {:>10.1f} {:>9.1f}".format(
+        name, users, len(latencies) / elapsed, scans / elapsed,
+        pct(0.50), pct(0.99), pct(0.999), hold * 1e6))
+
+
+def main(args):
+    print("{} heartbeat threads, {} get-peers pollers at {} bodies/s, {}s per run".format(
+        args.workers, args.pollers, args.poll_rate or "unlimited", args.duration))
+    print("{:<8} {:>7} {:>10} {:>8} {:>9} {:>9} {:>10} {:>9}".format(
+        "layout", "users", "beats/s", "bodies/s", "p50(us)", "p99(us)", "p99.9(us)",
+        "hold(us)"))
+    for users in args.users:
+        for name, factory in (("global", GlobalLockState),
+                              ("striped", lambda: TrackerState(args.stripes))):
+            state = factory()
+            sessions = populate(state, users)
+            hold = max(scan_hold(state) for _ in range(20))
+            latencies, scans, elapsed = run(state, sessions, args.workers,
+                                            args.pollers, args.duration,
+                                            args.poll_rate)
+            report(name, users, latencies, scans, elapsed, hold)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog='bench_tracker_contention')
+    parser.add_argument('--users', type=int, nargs='+', default=[1000, 10000])
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--pollers', type=int, default=2)
+    # 2 x 200 bodies/s: 2000 clients polling every 5 s
+    parser.add_argument('--poll-rate', type=float, default=200)
+    parser.add_argument('--stripes', type=int, default=64)
+    parser.add_argument('--duration', type=float, default=3.0)
+    main(parser.parse_args())
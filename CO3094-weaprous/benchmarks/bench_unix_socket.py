@@ -0,0 +1,177 @@
+#
+# Copyright (C) 2025 pdnguyen of HCMC University of Technology VNU-HCM.
+# All rights reserved.
+# This file is part of the CO3093/CO3094 course.
+#
+# WeApRous release
+#
+# The authors hereby grant to Licensee personal permission to use
+# and modify the Licensed Source Code for the sole purpose of studying
+# while attending the course
+#
+
+"""
+benchmarks.bench_unix_socket
+~~~~~~~~~~~~~~~~~
+
+Compares loopback TCP and a Unix domain socket for the proxy to backend
+hop, through the full client -> proxy -> WeApRous backend path.
+
+One WeApRous backend listens on both a TCP port and a Unix domain socket
+(``run(unix_socket=...)``). The proxy runs in a subprocess with two hosts
+routed to the same backend: ``tcp.local`` (``proxy_pass http://...``) and
+``uds.local`` (``proxy_pass unix:...``). Client threads send requests to
+each host in turn, and the script reports the throughput and latency
+percentiles of each transport.
+
+Run from the project root::
+
+    python -m benchmarks.bench_unix_socket --engine threaded --requests 5000
+"""
+
+import argparse
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+HOST = "127.0.0.1"
+
+BACKEND_SCRIPT = """
+from daemon.weaprous import WeApRous
+app = WeApRous()
+
+@app.route('/ping', methods=['GET'])
+def ping(headers, body):
+    return {{"pong": True}}
+
+app.prepare_address('{host}', {port})
+app.run({path!r})
+"""
+
+PROXY_SCRIPT = """
+from daemon import create_proxy, create_async_proxy
+routes = {{
+    'tcp.local': ('{host}:{backend}', 'round-robin', {{}}),
+    'uds.local': ('unix:{path}', 'round-robin', {{}}),
+}}
+engine = create_async_proxy if '{engine}' == 'asyncio' else create_proxy
+engine('{host}', {port}, routes)
+"""
+
+
+def one_request(port, hostname):
+    """Sends one request through the proxy and returns its latency."""
+    start = time.perf_counter()
+    conn = socket.create_connection((HOST, port))
+    try:
+        conn.sendall("GET /ping HTTP/1.1\r\nHost: {}\r\n\r\n".format(hostname).encode())
+        data = b""
+        while True:
+            chunk = conn.recv(65536)
+            if not chunk:
+                break
+            data += chunk
+    finally:
+        conn.close()
+    if not data.startswith(b"HTTP/1.1 200"):
+        raise ValueError("bad response: {!r}".format(data[:40]))
+    return time.perf_counter() - start
+
+
+def run_transport(port, hostname, requests, concurrency):
+    """
+    Sends ``requests`` requests to ``hostname`` from ``concurrency`` threads.
+
+    :rtype (list, int, float): sorted latencies, errors and wall time.
+    """
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+    per_thread = requests // concurrency
+
+    def worker():
+        mine = []
+        failed = 0
+        for _ in range(per_thread):
+            try:
+                mine.append(one_request(port, hostname))
+            except (OSError, ValueError):
+                failed += 1
+        with lock:
+            latencies.extend(mine)
+            errors[0] += failed
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return sorted(latencies), errors[0], time.perf_counter() - start
+
+
+def report(name, latencies, errors, elapsed):
+    def pct(p):
+        if not latencies:
+            return float('nan')
+        return latencies[min(len(latencies) - 1, int(p * len(latencies)))] * 1000
+
+    print("{:<5} {:>7} {:>6} {:>9.0f} {:>9.3f} {:>9.3f} {:>9.3f}".format(
+        name, len(latencies), errors, len(latencies) / elapsed,
+        pct(0.50), pct(0.90), pct(0.99)))
+
+
+def main(args):
+    path = os.path.join(tempfile.mkdtemp(prefix="weaprous-"), "backend.sock")
+    quiet = dict(stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    backend = subprocess.Popen([sys.executable, "-c", BACKEND_SCRIPT.format(
+        host=HOST, port=args.backend_port, path=path)], **quiet)
+    proxy = subprocess.Popen([sys.executable, "-c", PROXY_SCRIPT.format(
+        host=HOST, port=args.proxy_port, backend=args.backend_port,
+        path=path, engine=args.engine)], **quiet)
+    try:
+        time.sleep(1.5)
+        # Warm up both paths (thread pools, caches of the OS)
+        run_transport(args.proxy_port, "tcp.local", 200, 4)
+        run_transport(args.proxy_port, "uds.local", 200, 4)
+
+        print("{} engine, {} requests per round, {} client threads".format(
+            args.engine, args.requests, args.concurrency))
+        print("{:<5} {:>7} {:>6} {:>9} {:>9} {:>9} {:>9}".format(
+            "hop", "ok", "errors", "req/s", "p50(ms)", "p90(ms)", "p99(ms)"))
+        totals = {"tcp": [[], 0, 0.0], "uds": [[], 0, 0.0]}
+        # Alternate the transports so drifts of the machine hit both
+        for _ in range(args.rounds):
+            for name in ("tcp", "uds"):
+                latencies, errors, elapsed = run_transport(
+                    args.proxy_port, name + ".local", args.requests, args.concurrency)
+                totals[name][0].extend(latencies)
+                totals[name][1] += errors
+                totals[name][2] += elapsed
+        for name, (latencies, errors, elapsed) in totals.items():
+            report(name, sorted(latencies), errors, elapsed)
+    finally:
+        proxy.kill()
+        backend.kill()
+        proxy.wait()
+        backend.wait()
+        try:
+            os.unlink(path)
+            os.rmdir(os.path.dirname(path))
+        except OSError:
+            pass
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog='bench_unix_socket')
+    parser.add_argument('--engine', default='threaded', choices=['threaded', 'asyncio'])
+    parser.add_argument('--requests', type=int, default=5000)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--rounds', type=int, default=3)
+    parser.add_argument('--proxy-port', type=int, default=18180)
+    parser.add_argument('--backend-port', type=int, default=19180)
+    main(parser.parse_args())
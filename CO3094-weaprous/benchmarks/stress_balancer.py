@@ -0,0 +1,90 @@
+#
+# Copyright (C) 2025 pdnguyen of HCMC University of Technology VNU-HCM.
+# All rights reserved.
+# This file is part of the CO3093/CO3094 course.
+#
+# WeApRous release
+#
+# The authors hereby grant to Licensee personal permission to use
+# and modify the Licensed Source Code for the sole purpose of studying
+# while attending the course
+#
+
+"""
+benchmarks.stress_balancer
+~~~~~~~~~~~~~~~~~
+
+Concurrency stress check of the proxy balancers. Many threads hammer one
+shared :class:`RoundRobinBalancer <RoundRobinBalancer>` and the resulting
+distribution must stay even, i.e. no selection is lost or duplicated.
+
+Run from the project root::
+
+    python -m benchmarks.stress_balancer --threads 64 --calls 20000
+"""
+
+import argparse
+import sys
+import threading
+import time
+from collections import Counter
+
+from daemon.balancer import RoundRobinBalancer
+
+
+def stress(balancer, threads, calls):
+    """
+    Calls ``balancer.select`` from ``threads`` threads at once.
+
+    :params balancer (Balancer): the shared balancer.
+    :params threads (int): number of concurrent threads.
+    :params calls (int): selections per thread.
+
+    :rtype (Counter, float): selections per backend and elapsed seconds.
+    """
+    counters = [Counter() for _ in range(threads)]
+    barrier = threading.Barrier(threads)
+
+    def worker(counter):
+        barrier.wait()
+        select = balancer.select
+        for _ in range(calls):
+            counter[select()] += 1
+
+    workers = [threading.Thread(target=worker, args=(c,)) for c in counters]
+    start = time.perf_counter()
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+    elapsed = time.perf_counter() - start
+
+    total = Counter()
+    for c in counters:
+        total.update(c)
+    return total, elapsed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog='stress_balancer')
+    parser.add_argument('--threads', type=int, default=64)
+    parser.add_argument('--calls', type=int, default=20000)
+    parser.add_argument('--backends', type=int, default=3)
+    args = parser.parse_args()
+
+    targets = ["10.0.0.{}:9000".format(i + 1) for i in range(args.backends)]
+    total, elapsed = stress(RoundRobinBalancer(targets), args.threads, args.calls)
+
+    expected = args.threads * args.calls
+    for target in targets:
+        print("{:<16} {}".format(target, total[target]))
+    print("{} selections in {:.3f}s ({:.0f}/s)".format(
+        sum(total.values()), elapsed, expected / elapsed))
+
+    # An atomic counter hands out every index exactly once, so the spread
+    # between the busiest and the idlest backend is at most one.
+    spread = max(total.values()) - min(total.values())
+    if sum(total.values()) != expected or spread > 1:
+        print("FAIL: uneven distribution (spread {})".format(spread))
+        sys.exit(1)
+    print("OK: spread {}".format(spread))
@@ -0,0 +1,99 @@
+#
+# Copyright (C) 2025 pdnguyen of HCMC University of Technology VNU-HCM.
+# All rights reserved.
+# This file is part of the CO3093/CO3094 course.
+#
+# WeApRous release
+#
+# The authors hereby grant to Licensee personal permission to use
+# and modify the Licensed Source Code for the sole purpose of studying
+# while attending the course
+#
+
+"""
+benchmarks.stress_ratelimit
+~~~~~~~~~~~~~~~~~
+
+Stress check of the proxy rate limiter table with many distinct clients.
+
+Every simulated second a new wave of clients sends a few requests, on a
+simulated clock. The check fails unless the buckets of idle clients are
+expired by the timing wheel, i.e. the table stays at about the clients
+active in the last ``burst / rate`` seconds instead of growing with every
+client ever seen. It also reports the cost of one ``take``.
+
+Run from the project root::
+
+    python -m benchmarks.stress_ratelimit --clients 100000
+"""
+
+import argparse
+import sys
+import time
+import tracemalloc
+
+from daemon.ratelimit import TokenBucketTable
+
+
+def stress(table, clients, per_second, requests):
+    """
+    Feeds ``clients`` distinct keys to ``table``, ``per_second`` new keys
+    per simulated second, each sending ``requests`` requests.
+
+    :rtype (int, float, float): peak number of buckets, seconds spent in
+                                take() and the final simulated clock.
+    """
+    peak = 0
+    spent = 0.0
+    now = 1000.0
+    client = 0
+    while client < clients:
+        wave = ["10.{}.{}.{}".format(i >> 16, (i >> 8) & 255, i & 255)
+                for i in range(client, min(clients, client + per_second))]
+        start = time.perf_counter()
+        for _ in range(requests):
+            for key in wave:
+                table.take(key, now)
+        spent += time.perf_counter() - start
+        peak = max(peak, len(table))
+        client += per_second
+        now += 1.0
+    return peak, spent, now
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog='stress_ratelimit')
+    parser.add_argument('--clients', type=int, default=100000)
+    parser.add_argument('--per-second', type=int, default=5000)
+    parser.add_argument('--requests', type=int, default=3)
+    parser.add_argument('--rate', type=float, default=10.0)
+    parser.add_argument('--burst', type=float, default=20.0)
+    args = parser.parse_args()
+
+    table = TokenBucketTable(args.rate, args.burst)
+    peak, spent, now = stress(table, args.clients, args.per_second, args.requests)
+
+    # Second run for the memory only, tracemalloc slows every allocation
+    tracemalloc.start()
+    stress(TokenBucketTable(args.rate, args.burst), args.clients,
+           args.per_second, args.requests)
+    _, peak_bytes = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    # Every client went idle: one more turn of the wheel empties the table
+    table.take("probe", now + 120.0)
+    left = len(table) - 1
+
+    calls = args.clients * args.requests
+    print("{} clients, {} take() in {:.3f}s ({:.2f} us/take)".format(
+        args.clients, calls, spent, spent / calls * 1e6))
+    print("peak buckets {}, peak memory {:.1f} MB, left after idle {}".format(
+        peak, peak_bytes / 1048576.0, left))
+
+    # A bucket refills in burst / rate seconds, plus one wheel tick of delay
+    bound = args.per_second * (int(args.burst / args.rate) + 2)
+    if peak > bound or left != 0:
+        print("FAIL: table kept idle clients (peak {} > {} or {} left)".format(
+            peak, bound, left))
+        sys.exit(1)
+    print("OK: table bounded by the active clients ({} <= {})".format(peak, bound))
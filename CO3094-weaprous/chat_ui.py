@@ -15,7 +15,8 @@ from queue import Queue
 # -----------------------------------------------------
 TRACKER_URL = "http://127.0.0.1:8080"
 HEARTBEAT_INTERVAL = 15
-AUTO_REFRESH_INTERVAL = 5000 
+EVENTS_READ_TIMEOUT = 35 # /events giữ tối đa 25 giây phía Tracker
+EVENTS_RETRY_DELAY = 2
 
 class ChatClientGUI:
     def __init__(self):
@@ -33,6 +34,9 @@ class ChatClientGUI:
         self.unread_messages = {}
         self.channels = ["chung"] 
         self.peers = {}
+        self.peers_version = 0 # Version Tracker cua self.peers / self.channels
+        self.peers_lock = threading.Lock() # Thread /events và thread gửi tin cùng cập nhật
+        self.offline_cursor = 0 # ID tin nhắn offline cuối cùng đã nhận (và xác nhận)
 
         # Xây dựng GUI
         self.root = tk.Tk()
@@ -174,6 +178,8 @@ class ChatClientGUI:
             ctx, msg = self.message_queue.get()
             if ctx == "[SYSTEM]": 
                 print(f"[LOG] {msg['message']}")
+            elif ctx == "[CONTACTS]":
+                self._update_contact_list_display()
             else:
                 if ctx not in self.chat_history: self.chat_history[ctx] = []
                 self.chat_history[ctx].append(msg)
@@ -184,11 +190,26 @@ class ChatClientGUI:
                     self._update_contact_list_display()
         self.root.after(200, self._check_incoming_messages)
 
-    def _auto_refresh_loop(self):
-        if self.username:
-            self._refresh_contacts()
-            threading.Thread(target=self._fetch_offline_messages, daemon=True).start()
-        self.root.after(AUTO_REFRESH_INTERVAL, self._auto_refresh_loop)
+    def _events_thread(self):
+        """Long-poll /events: Tracker trả về ngay khi có peer vào / ra, kênh mới
+        hoặc tin nhắn offline, thay cho việc poll định kỳ."""
+        session = requests.Session()
+        session.cookies = self.session.cookies
+        while True:
+            try:
+                resp = session.get(f"{self.tracker_url}/events",
+                                   params={"since": self.peers_version, "after": self.offline_cursor},
+                                   timeout=EVENTS_READ_TIMEOUT)
+                if resp.status_code == 200:
+                    event = resp.json()
+                    if event.get("changes"):
+                        self._apply_peers_delta(event["changes"])
+                        self.message_queue.put(("[CONTACTS]", None))
+                    # Còn trang sau ("more") thì /events kế tiếp trả về ngay
+                    self._deliver_offline_messages(event.get("messages", []), event.get("cursor"), session)
+                elif resp.status_code != 204:
+                    time.sleep(EVENTS_RETRY_DELAY)
+            except: time.sleep(EVENTS_RETRY_DELAY)
 
     # =============================================================
     # NETWORK & LOGIC (STORE AND FORWARD - ĐÃ FIX)
@@ -222,17 +243,19 @@ class ChatClientGUI:
                 {"from": "System", "message": f"LỖI MẠNG: Không gửi được lên Server: {e}"}
             ))
 
-    def _fetch_offline_messages(self):
+    def _deliver_offline_messages(self, msgs, cursor, session=None):
+        """Hiển thị một trang tin nhắn offline rồi xác nhận ``cursor`` để Tracker xóa chúng."""
+        if msgs:
+            print(f"[INFO] Nhận được {len(msgs)} tin nhắn offline.")
+            for msg in msgs:
+                ctx = f"dm_{msg.get('from')}" if msg.get("type") == "direct_message" else msg.get("channel")
+                if ctx: self.message_queue.put((ctx, msg))
+        if not cursor or cursor <= self.offline_cursor: return
+        self.offline_cursor = cursor
         try:
-            resp = self.session.get(f"{self.tracker_url}/api/fetch_offline")
-            if resp.status_code == 200:
-                msgs = resp.json().get("messages", [])
-                if msgs:
-                    print(f"[INFO] Nhận được {len(msgs)} tin nhắn offline.")
-                    for msg in msgs:
-                        ctx = f"dm_{msg.get('from')}" if msg.get("type") == "direct_message" else msg.get("channel")
-                        if ctx: self.message_queue.put((ctx, msg))
-        except: pass
+            # Không xác nhận được thì tin nhắn vẫn còn trên Server, lần đăng nhập sau nhận lại
+            (session or self.session).post(f"{self.tracker_url}/api/ack_offline", json={"cursor": cursor})
+        except Exception as e: print(f"[ERR] Ack offline fail: {e}")
 
     def _p2p_listener_thread(self):
         try:
@@ -274,28 +297,72 @@ class ChatClientGUI:
         else: self._send_offline_to_server(target, payload)
 
     def _broadcast_to_channel(self, channel, payload):
+        """Một request: Tracker tự đẩy tới các peer đang sống và lưu offline cho phần còn lại."""
         try:
-            resp = self.session.post(f"{self.tracker_url}/channels/peers", json={"channel_name": channel})
+            resp = self.session.post(f"{self.tracker_url}/channels/broadcast",
+                                     json={"channel_name": channel, "payload": payload})
+            if resp.status_code == 403:
+                # Chỉ thành viên được gửi: tham gia kênh rồi gửi lại một lần
+                self.session.post(f"{self.tracker_url}/channels/join", json={"channel_name": channel})
+                resp = self.session.post(f"{self.tracker_url}/channels/broadcast",
+                                         json={"channel_name": channel, "payload": payload})
             if resp.status_code == 200:
-                peers = resp.json()
-                for user, info in peers.items():
-                    if user != self.username:
-                        if not self._send_p2p(info['ip'], info['port'], payload):
-                            self._send_offline_to_server(user, payload)
-        except: pass
+                queued = resp.json().get("queued", 0)
+                if queued:
+                    self.message_queue.put((channel, {"from": "System", "message": f"{queued} thành viên offline. Đã lưu tin nhắn lên Server."}))
+            else:
+                print(f"[ERR] Broadcast rejected: {resp.status_code} {resp.text}")
+                self.message_queue.put((channel, {"from": "System", "message": f"LỖI: Server không gửi được tin nhắn (Code {resp.status_code})."}))
+        except Exception as e:
+            print(f"[ERR] Broadcast Fail: {e}")
+            self.message_queue.put((channel, {"from": "System", "message": f"LỖI MẠNG: Không gửi được lên Server: {e}"}))
 
     def _refresh_peers_data(self):
+        """Chỉ tải các thay đổi (peer, kênh) kể từ version đã có; 304 = không đổi."""
         try:
-            resp = self.session.get(f"{self.tracker_url}/get-peers")
-            if resp.status_code == 200: self.peers = resp.json()
+            resp = self.session.get(f"{self.tracker_url}/get-peers", params={"since": self.peers_version})
+            if resp.status_code == 200: self._apply_peers_delta(resp.json())
         except: pass
 
+    def _apply_peers_delta(self, delta):
+        with self.peers_lock:
+            # Delta cũ hơn bản đang có (đến muộn) thì bỏ qua
+            if not delta.get("full") and delta.get("version", 0) < self.peers_version: return
+            # Dict/list mới rồi mới gán, các thread khác đang đọc bản cũ không bị ảnh hưởng
+            if delta.get("full"):
+                peers = delta.get("peers", {})
+                channels = delta.get("channels", ["chung"])
+            else:
+                peers = dict(self.peers)
+                peers.update(delta.get("peers", {}))
+                for user in delta.get("left", []): peers.pop(user, None)
+                channels = self.channels + [ch for ch in delta.get("channels", []) if ch not in self.channels]
+            self.peers, self.channels = peers, channels
+            self.peers_version = delta.get("version", 0)
+
+    def _bootstrap(self):
+        """Đăng ký, vào kênh chung, tải danh sách peer / kênh và tin nhắn offline: một request /batch."""
+        ops = [
+            {"op": "register", "port": self.p2p_port},
+            {"op": "channels/join", "channel_name": "chung"},
+            {"op": "get-peers", "since": self.peers_version},
+            {"op": "fetch_offline"},
+        ]
+        try:
+            resp = self.session.post(f"{self.tracker_url}/batch", json=ops)
+            results = {r["op"]: r for r in resp.json().get("results", [])} if resp.status_code == 200 else {}
+        except: results = {}
+        if results.get("get-peers", {}).get("status") == 200:
+            self._apply_peers_delta(results["get-peers"]["body"])
+        if results.get("fetch_offline", {}).get("status") == 200:
+            page = results["fetch_offline"]["body"]
+            # Các trang còn lại do /events trả về
+            self._deliver_offline_messages(page.get("messages", []), page.get("cursor"))
+        self._update_contact_list_display()
+
     def _refresh_contacts(self):
+        # Danh sách kênh đi kèm delta của /get-peers
         self._refresh_peers_data()
-        try:
-            resp = self.session.get(f"{self.tracker_url}/channels/list")
-            self.channels = resp.json().get("channels", ["chung"]) if resp.status_code == 200 else ["chung"]
-        except: self.channels = ["chung"]
         self._update_contact_list_display()
 
     def _update_contact_list_display(self):
@@ -352,12 +419,9 @@ class ChatClientGUI:
                     self.root.deiconify()
                     self.root.title(f"Chat: {self.username} (Port: {self.p2p_port})")
                     
-                    self.session.post(f"{self.tracker_url}/register", json={"port": self.p2p_port})
-                    self.session.post(f"{self.tracker_url}/channels/join", json={"channel_name": "chung"})
-                    
-                    self._refresh_contacts()
+                    self._bootstrap()
                     self._check_incoming_messages() 
-                    self._auto_refresh_loop()
+                    threading.Thread(target=self._events_thread, daemon=True).start()
                     threading.Thread(target=self._heartbeat_thread, daemon=True).start()
                 else:
                     try:
@@ -12,8 +12,11 @@
 
 from .backend import create_backend
 from .proxy import create_proxy
+from .asyncproxy import create_async_proxy
+from .routing import Router
 from .weaprous import WeApRous
-from .response import Response
+from .response import Response, JSONBytes
+from .longpoll import LongPoll
 from .request import Request
 from .backend import create_backend
 from .httpadapter import HttpAdapter
@@ -0,0 +1,651 @@
+#
+# Copyright (C) 2025 pdnguyen of HCMC University of Technology VNU-HCM.
+# All rights reserved.
+# This file is part of the CO3093/CO3094 course.
+#
+# WeApRous release
+#
+# The authors hereby grant to Licensee personal permission to use
+# and modify the Licensed Source Code for the sole purpose of studying
+# while attending the course
+#
+
+"""
+daemon.asyncproxy
+~~~~~~~~~~~~~~~~~
+
+This module implements an asyncio engine of the reverse proxy. It serves the
+same routes as :mod:`daemon.proxy` (as returned by ``parse_virtual_hosts``)
+and picks backends with the same ``resolve_routing_policy``, but every client
+connection is a coroutine on a single event loop instead of an OS thread, so
+tens of thousands of idle or slow connections only cost a few KB each.
+
+Requirement:
+-----------------
+- asyncio: provides the event loop and the stream API.
+- proxy: request parsing, routing, caching helpers shared with the threaded engine.
+- singleflight: :class: `AsyncSingleFlight <AsyncSingleFlight>` request coalescing.
+- failover: retry plan, retry budget and hedging delay shared with the threaded engine.
+- timeouts: connect, first-byte and end-to-end deadlines.
+- metrics: request, upstream and balancer metrics shared with the threaded engine.
+- routing: the reloadable routing table and location tries.
+- ratelimit: per-client token buckets and connection caps.
+- tunnel: full-duplex relays for ``Upgrade`` and event-stream requests.
+- tracing: ``X-Request-ID``, ``X-Forwarded-For`` and ``Server-Timing`` spans.
+- tls: optional TLS listener sharing one resumption-enabled ``SSLContext``.
+- proxylog: the log, queued for a writer thread instead of printed on the loop.
+
+"""
+import asyncio
+import time
+
+from .proxy import (
+    RESPONSE_CACHE,
+    DEFAULT_COALESCE_WINDOW,
+    CLIENT_TIMEOUT,
+    MAX_HEADER_SIZE,
+    RequestRejected,
+    content_length,
+    parse_duration,
+    parse_request_head,
+    get_host_options,
+    is_cacheable_request,
+    should_coalesce,
+    extract_affinity_key,
+    learn_session_cookie,
+    resolve_routing_policy,
+    route_balancer,
+    upstream_error_response,
+)
+from .routing import Router, locate_route
+from .proxylog import debug, log
+from .ratelimit import (
+    CONNECTION_LIMITER,
+    UPSTREAM_LIMITER,
+    check_rate_limits,
+    connection_limit,
+    too_many_requests,
+    upstream_limit,
+)
+from .tunnel import is_tunnel_request, tunnel_async
+from .tls import record_handshake
+from .tracing import (
+    TRACER,
+    Trace,
+    activate,
+    add_span,
+    deactivate,
+    request_id,
+    trace_sample_rate,
+    with_forwarded_headers,
+)
+from .singleflight import AsyncSingleFlight
+from .metrics import (
+    IN_FLIGHT,
+    UPSTREAM_ACTIVE,
+    UPSTREAM_CONNECT,
+    UPSTREAM_RESPONSE,
+    inc,
+    observe,
+    record_response,
+    record_tunnel,
+    register_collector,
+    route_label,
+    stats_family,
+)
+from .timeouts import (
+    Deadline,
+    first_byte_timeout,
+    total_timeout,
+    with_budget_header,
+)
+from .failover import (
+    RETRY_BUDGET,
+    DeadlineExceeded,
+    UpstreamBusy,
+    UpstreamError,
+    UNIX_HOST,
+    failover_plan,
+    hedge_delay,
+    open_upstream_connection,
+    split_target,
+)
+
+#: Pending connections queued by the kernel before ``accept``.
+LISTEN_BACKLOG = 4096
+
+#: Response sent when no backend answers.
+NOT_FOUND = (
+    "HTTP/1.1 404 Not Found\r\n"
+    "Content-Type: text/plain\r\n"
+    "Content-Length: 13\r\n"
+    "Connection: close\r\n"
+    "\r\n"
+    "404 Not Found"
+).encode('utf-8')
+
+#: Coalesces identical concurrent GETs on the event loop.
+ASYNC_COALESCER = AsyncSingleFlight()
+
+register_collector(lambda: [stats_family(
+    "proxy_async_coalescer", "gauge",
+    "Request coalescing counters of the asyncio engine.", ASYNC_COALESCER.stats())])
+
+#: Background tasks (cache revalidation), referenced until they finish.
+_background_tasks = set()
+
+
+def raise_open_file_limit():
+    """
+    Raises the soft limit of open files to the hard limit, each client
+    connection holds one descriptor (two while talking to the backend).
+    """
+    try:
+        import resource
+    except ImportError:
+        return
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < hard:
+        try:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+        except (ValueError, OSError):
+            pass
+
+
+async def send_to_client(writer, data):
+    """
+    Writes to a client, which has ``CLIENT_TIMEOUT`` seconds to read it.
+
+    :raise asyncio.TimeoutError: when the client does not read.
+    """
+    writer.write(data)
+    await asyncio.wait_for(writer.drain(), CLIENT_TIMEOUT)
+
+
+async def read_request(reader):
+    """
+    Reads one HTTP request, header section and ``Content-Length`` body.
+
+    :params reader (asyncio.StreamReader): client stream.
+
+    :rtype bytes: the raw request, or empty bytes if the client went away.
+
+    :raise RequestRejected: for an invalid or too large ``Content-Length``,
+                            before any of the body is read.
+    """
+    try:
+        head = await reader.readuntil(b"\r\n\r\n")
+    except (asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+        return b""
+    length = content_length(head)
+    if length == 0:
+        return head
+    try:
+        return head + await reader.readexactly(length)
+    except asyncio.IncompleteReadError as e:
+        return head + e.partial
+
+
+async def send_upstream_async(host, port, request, connect_timeout=None,
+                              first_byte_timeout=None, deadline=None):
+    """
+    Sends an HTTP request to a backend server and reads the response until
+    the backend closes the connection.
+
+    :params host (str): IP address of the backend server.
+    :params port (int): port number of the backend server.
+    :params request (bytes): raw HTTP request.
+    :params connect_timeout (float): seconds allowed to connect.
+    :params first_byte_timeout (float): seconds allowed until the first
+                                        response byte.
+    :params deadline (Deadline): budget of the whole request.
+
+    :rtype bytes: raw HTTP response.
+
+    :raise UpstreamError: when the backend is unreachable, too slow or sends
+                          nothing; :class:`DeadlineExceeded` when the
+                          budget ran out.
+    """
+    if deadline is not None:
+        connect_timeout = deadline.cap(connect_timeout)
+        request = with_budget_header(request, deadline.remaining())
+    upstream = (host + ":" + str(port),)
+    started = time.monotonic()
+    try:
+        reader, writer = await asyncio.wait_for(
+            open_upstream_connection(host, port), connect_timeout)
+    except asyncio.TimeoutError:
+        raise UpstreamError("connect to {}:{} timed out".format(host, port), timed_out=True)
+    except OSError as e:
+        raise UpstreamError("connect to {}:{} failed: {!r}".format(host, port, e))
+    connected = time.monotonic()
+    observe(UPSTREAM_CONNECT, upstream, connected - started)
+    add_span("connect", connected - started)
+    inc(UPSTREAM_ACTIVE, upstream)
+    try:
+        writer.write(request)
+        await writer.drain()
+        chunks = []
+        timeout = first_byte_timeout
+        while True:
+            if deadline is not None:
+                timeout = deadline.cap(timeout, sent=True)
+            chunk = await asyncio.wait_for(reader.read(65536), timeout)
+            if not chunk:
+                break
+            chunks.append(chunk)
+            # After the first byte only the total budget applies
+            timeout = None
+    except asyncio.TimeoutError:
+        if deadline is not None and deadline.expired():
+            raise DeadlineExceeded("timeout budget exhausted on {}:{}".format(host, port),
+                                   sent=True)
+        raise UpstreamError("{}:{} sent no response in time".format(host, port),
+                            sent=True, timed_out=True)
+    except OSError as e:
+        raise UpstreamError("exchange with {}:{} failed: {}".format(host, port, e), sent=True)
+    finally:
+        writer.close()
+        inc(UPSTREAM_ACTIVE, upstream, -1)
+        add_span("upstream", time.monotonic() - connected)
+    observe(UPSTREAM_RESPONSE, upstream, time.monotonic() - connected)
+    response = b"".join(chunks)
+    if not response:
+        raise UpstreamError("{}:{} closed without answering".format(host, port), sent=True)
+    return response
+
+
+async def forward_request_async(host, port, request):
+    """
+    Forwards an HTTP request to a backend server and reads the response
+    until the backend closes the connection.
+
+    :params host (str): IP address of the backend server.
+    :params port (int): port number of the backend server.
+    :params request (bytes): raw HTTP request.
+
+    :rtype bytes: raw HTTP response, or a 404 Not Found response when the
+                  backend is unreachable.
+    """
+    try:
+        return await send_upstream_async(host, port, request)
+    except UpstreamError as e:
+        log("Socket error: {}".format(e))
+        return NOT_FOUND
+
+
+async def forward_with_failover_async(balancer, first, request, method, options,
+                                      deadline=None):
+    """
+    Coroutine counterpart of ``daemon.failover.forward_with_failover``:
+    retries on the next healthy backend and optionally hedges slow answers.
+
+    :params deadline (Deadline): budget of the request.
+
+    :rtype (str, bytes): the backend which answered and its response.
+
+    :raise UpstreamError: when no backend answered.
+    """
+    targets, idempotent, hedge, connect_timeout = failover_plan(
+        balancer, first, method, options)
+    RETRY_BUDGET.deposit()
+    loop = asyncio.get_running_loop()
+    first_byte = first_byte_timeout(options)
+    limit = upstream_limit(options)
+
+    async def attempt(target):
+        host, port = split_target(target)
+        if limit is not None and not UPSTREAM_LIMITER.acquire(target, limit):
+            raise UpstreamBusy("{} is at proxy_max_conns".format(target))
+        try:
+            start = loop.time()
+            response = await send_upstream_async(host, port, request, connect_timeout,
+                                                 first_byte, deadline)
+            return response, loop.time() - start
+        finally:
+            if limit is not None:
+                UPSTREAM_LIMITER.release(target)
+
+    #: task -> backend it talks to.
+    attempts = {}
+
+    def launch():
+        nonlocal next_index
+        target = targets[next_index]
+        next_index += 1
+        task = asyncio.create_task(attempt(target))
+        attempts[task] = target
+        return task
+
+    next_index, hedged = 0, not hedge
+    pending = {launch()}
+    last_error = UpstreamError("no upstream available")
+    try:
+        while pending:
+            timeout = None
+            if not hedged and next_index < len(targets):
+                timeout = hedge_delay(balancer)
+            done, pending = await asyncio.wait(
+                pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                # No answer by the p95: send a duplicate to the next backend
+                hedged = True
+                if RETRY_BUDGET.withdraw():
+                    pending.add(launch())
+                continue
+
+            for task in done:
+                target = attempts[task]
+                error = task.exception()
+                if error is None:
+                    response, elapsed = task.result()
+                    balancer.mark_ok(target)
+                    balancer.latency.add(elapsed)
+                    return target, response
+                if isinstance(error, DeadlineExceeded):
+                    raise error
+                log("[Proxy] Upstream {} failed: {}".format(target, error))
+                if not isinstance(error, UpstreamBusy):
+                    balancer.mark_failed(target)
+                last_error = error
+                if getattr(error, 'sent', True) and not idempotent:
+                    continue
+                if next_index < len(targets) and RETRY_BUDGET.withdraw():
+                    pending.add(launch())
+        raise last_error
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+async def forward_to_host_async(hostname, target, request, method, options, balancers,
+                                deadline=None):
+    """
+    Coroutine counterpart of ``daemon.proxy.forward_to_host``.
+
+    :rtype (str, bytes): the backend which answered and its response, a
+                         503 Service Unavailable response when every backend
+                         was at ``proxy_max_conns``, a 504 Gateway Timeout
+                         response when they were too slow or a 404 Not
+                         Found response when none could be reached.
+    """
+    balancer = route_balancer(hostname, target, balancers)
+    if deadline is None:
+        deadline = Deadline(total_timeout(options))
+    try:
+        return await forward_with_failover_async(balancer, target, request, method,
+                                                 options, deadline)
+    except UpstreamError as e:
+        log("Socket error: {}".format(e))
+        return target, upstream_error_response(e)
+
+
+async def tunnel_to_host_async(reader, writer, hostname, target, raw, options,
+                               balancers, label):
+    """
+    Coroutine counterpart of ``daemon.proxy.tunnel_to_host``.
+
+    :params raw (bytes): incoming HTTP request.
+    """
+    try:
+        target, sent, received, status = await tunnel_async(
+            reader, writer, raw, route_balancer(hostname, target, balancers),
+            target, options)
+    except UpstreamError as e:
+        log("Socket error: {}".format(e))
+        if e.sent:
+            return
+        response = upstream_error_response(e)
+        record_response(label, target, len(raw), response)
+        await send_to_client(writer, response)
+        return
+    debug("[Proxy] Tunnel to {} closed, {} bytes up, {} bytes down".format(
+        target, sent, received))
+    record_tunnel(label, target, status, sent, received)
+
+
+async def revalidate_cached_async(hostname, path, headers, request, routes,
+                                  balancers, affinity_key, key, route_key=None):
+    """
+    Refreshes a stale cache entry in the background
+    (``stale-while-revalidate``).
+    """
+    route_key = hostname if route_key is None else route_key
+    try:
+        target_host, target_port = resolve_routing_policy(
+            route_key, routes, affinity_key, balancers)
+        if target_host:
+            _, response = await forward_to_host_async(
+                route_key, "{}:{}".format(target_host, target_port), request,
+                'GET', get_host_options(route_key, routes), balancers)
+            RESPONSE_CACHE.store(hostname, path, headers, response)
+    except Exception as e:
+        log("[Proxy] Revalidation of {}{} failed: {}".format(hostname, path, e))
+    finally:
+        RESPONSE_CACHE.end_revalidate(key)
+
+
+async def reply_async(writer, response, trace, label, upstream, request_size,
+                      method, path):
+    """
+    Coroutine counterpart of ``daemon.proxy.reply``: records, stamps and
+    sends one response, then logs its trace.
+    """
+    record_response(label, upstream, request_size, response)
+    await send_to_client(writer, trace.stamp(response))
+    trace.lap("send")
+    TRACER.write(trace, method=method, path=path, route=label, upstream=upstream,
+                 status=response[9:12].decode('latin-1'))
+
+
+async def handle_client_async(ip, port, reader, writer, routes, balancers,
+                              locations=None):
+    """
+    Handles one client connection on the event loop, the coroutine
+    counterpart of ``daemon.proxy.handle_client``.
+
+    :params ip (str): IP address of the proxy server.
+    :params port (int): port number of the proxy server.
+    :params reader (asyncio.StreamReader): client input stream.
+    :params writer (asyncio.StreamWriter): client output stream.
+    :params routes (dict): dictionary mapping hostnames and location.
+    :params balancers (dict): route key -> :class:`Balancer <Balancer>`.
+    :params locations (dict): hostname -> :class:`LocationTrie <LocationTrie>`.
+    """
+    addr = writer.get_extra_info('peername') or ('', 0)
+    start = time.monotonic()
+    conn_key = None
+    label = None
+    token = None
+    try:
+        try:
+            raw = await asyncio.wait_for(read_request(reader), CLIENT_TIMEOUT)
+        except asyncio.TimeoutError:
+            raw = b""
+        except RequestRejected as e:
+            log("[Proxy] Rejecting request of {}: {}".format(addr, e))
+            await send_to_client(writer, e.response)
+            return
+        if not raw:
+            debug("[Proxy] Dropping idle or incomplete client {}".format(addr))
+            return
+        request = raw.decode('latin-1')
+
+        method, path, headers = parse_request_head(request)
+        hostname = headers.get('host', "{}:{}".format(ip, port))
+        debug("[Proxy] {} at Host: {}".format(addr, hostname))
+        affinity_key = extract_affinity_key(request, addr)
+        route_key = locate_route(hostname, path, locations)
+        route = route_label(route_key, routes)
+
+        options = get_host_options(route_key, routes)
+        deadline = Deadline(total_timeout(options, headers), start)
+
+        trace = Trace(request_id(headers), "proxy",
+                      TRACER.sample(trace_sample_rate(options)), start)
+        trace.lap("accept")
+        request_size = len(raw)
+        raw = with_forwarded_headers(request, trace, addr[0]).encode('latin-1')
+        trace.lap("parse")
+
+        wait = check_rate_limits(route_key, options, addr[0], headers)
+        max_conns = connection_limit(options)
+        if wait or (max_conns is not None
+                    and not CONNECTION_LIMITER.acquire((route_key, addr[0]), max_conns)):
+            debug("[Proxy] Limited {} on {}".format(addr[0], hostname))
+            await reply_async(writer, too_many_requests(wait or 1), trace, route, "-",
+                              request_size, method, path)
+            return
+        if max_conns is not None:
+            conn_key = (route_key, addr[0])
+        label = route
+        inc(IN_FLIGHT, (label,))
+        token = activate(trace)
+
+        cacheable = (is_cacheable_request(method, headers, options)
+                     and not is_tunnel_request(headers))
+        if cacheable and 'no-cache' not in headers.get('cache-control', ''):
+            cached, state = RESPONSE_CACHE.lookup(hostname, path, headers)
+            if cached is not None:
+                if state == 'STALE':
+                    key = RESPONSE_CACHE.begin_revalidate(hostname, path, headers)
+                    if key is not None:
+                        task = asyncio.create_task(revalidate_cached_async(
+                            hostname, path, headers, raw, routes, balancers,
+                            affinity_key, key, route_key))
+                        _background_tasks.add(task)
+                        task.add_done_callback(_background_tasks.discard)
+                trace.lap("route")
+                await reply_async(writer, cached, trace, label, "cache",
+                                  request_size, method, path)
+                return
+
+        resolved_host, resolved_port = resolve_routing_policy(
+            route_key, routes, affinity_key, balancers)
+        try:
+            resolved_port = int(resolved_port)
+        except (TypeError, ValueError):
+            if resolved_host != UNIX_HOST:
+                log("Not a valid integer")
+        trace.lap("route")
+
+        if not resolved_host:
+            await reply_async(writer, NOT_FOUND, trace, label, "-",
+                              request_size, method, path)
+            return
+
+        target = "{}:{}".format(resolved_host, resolved_port)
+        if is_tunnel_request(headers):
+            await tunnel_to_host_async(reader, writer, route_key, target, raw,
+                                       options, balancers, label)
+            return
+        shared = False
+        if should_coalesce(method, path, options):
+            window = parse_duration(options.get('proxy_coalesce_window'),
+                                    DEFAULT_COALESCE_WINDOW)
+            (target, response), shared = await ASYNC_COALESCER.do(
+                (hostname, path),
+                lambda: forward_to_host_async(route_key, target, raw, method,
+                                              options, balancers, deadline),
+                window)
+        else:
+            target, response = await forward_to_host_async(
+                route_key, target, raw, method, options, balancers, deadline)
+        trace.skip()
+        learn_session_cookie((balancers or {}).get(route_key), target, response)
+        if cacheable and not shared:
+            RESPONSE_CACHE.store(hostname, path, headers, response)
+
+        await reply_async(writer, response, trace, label, target,
+                          request_size, method, path)
+    except (OSError, asyncio.CancelledError):
+        pass
+    except Exception as e:
+        log("[Proxy] Unexpected error with {}: {}".format(addr, e))
+    finally:
+        if token is not None:
+            deactivate(token)
+        if label is not None:
+            inc(IN_FLIGHT, (label,), -1)
+        if conn_key is not None:
+            CONNECTION_LIMITER.release(conn_key)
+        writer.close()
+
+
+async def serve_async_proxy(ip, port, routes, ssl_context=None):
+    """
+    Listens for client connections and serves them until cancelled.
+
+    :params ip (str): IP address to bind the proxy server.
+    :params port (int): port number to listen on.
+    :params routes (dict or Router): dictionary mapping hostnames and
+                                     location, or a reloadable router.
+    :params ssl_context (ssl.SSLContext): terminates TLS on this listener
+                                          when given.
+    """
+    router = routes if isinstance(routes, Router) else Router(routes)
+
+    async def on_client(reader, writer):
+        ssl_object = writer.get_extra_info('ssl_object')
+        if ssl_object is not None:
+            record_handshake(ssl_object)
+        with router.use() as table:
+            await handle_client_async(ip, port, reader, writer, table.routes,
+                                      table.balancers, table.locations)
+
+    tls = {}
+    if ssl_context is not None:
+        # The loop runs the handshake, a client stalling it is dropped
+        tls = dict(ssl=ssl_context, ssl_handshake_timeout=CLIENT_TIMEOUT)
+    server = await asyncio.start_server(
+        on_client, ip, port,
+        backlog=LISTEN_BACKLOG, limit=MAX_HEADER_SIZE, reuse_address=True, **tls)
+    print("[Proxy] Listening on IP {} port {} (asyncio engine{})".format(
+        ip, port, ", TLS" if ssl_context is not None else ""))
+    async with server:
+        await server.serve_forever()
+
+
+async def serve_async_listeners(ip, port, routes, tls_port=None, ssl_context=None):
+    """
+    Serves the plaintext listener, and the TLS one when configured, on
+    the same event loop and routing table.
+    """
+    router = routes if isinstance(routes, Router) else Router(routes)
+    listeners = [serve_async_proxy(ip, port, router)]
+    if tls_port and ssl_context is not None:
+        listeners.append(serve_async_proxy(ip, tls_port, router, ssl_context))
+    await asyncio.gather(*listeners)
+
+
+def run_async_proxy(ip, port, routes, tls_port=None, ssl_context=None):
+    """
+    Starts the asyncio proxy engine and blocks until interrupted.
+
+    :params ip (str): IP address to bind the proxy server.
+    :params port (int): port number to listen on.
+    :params routes (dict or Router): routes or a reloadable router.
+    :params tls_port (int): also listen for TLS clients on this port.
+    :params ssl_context (ssl.SSLContext): context of the TLS listener.
+    """
+    raise_open_file_limit()
+    try:
+        asyncio.run(serve_async_listeners(ip, port, routes, tls_port, ssl_context))
+    except OSError as e:
+        print("Socket error: {}".format(e))
+    except KeyboardInterrupt:
+        pass
+
+
+def create_async_proxy(ip, port, routes, tls_port=None, ssl_context=None):
+    """
+    Entry point for launching the asyncio proxy engine.
+
+    :params ip (str): IP address to bind the proxy server.
+    :params port (int): port number to listen on.
+    :params routes (dict or Router): routes or a reloadable router.
+    :params tls_port (int): also listen for TLS clients on this port.
+    :params ssl_context (ssl.SSLContext): context of the TLS listener.
+    """
+
+    run_async_proxy(ip, port, routes, tls_port, ssl_context)
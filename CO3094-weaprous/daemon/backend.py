@@ -31,6 +31,8 @@ Requirements:
 Notes:
 ------
 - The server create daemon threads for client handling.
+- With ``unix_socket`` the server also listens on a Unix domain socket, so
+  a co-located proxy (``proxy_pass unix:/path.sock;``) skips the TCP stack.
 - The current implementation error handling is minimal, socket errors are printed to the console.
 - The actual request processing is delegated to the HttpAdapter class.
 
@@ -40,7 +42,9 @@ Usage Example:
 
 """
 
+import os
 import socket
+import stat
 import threading
 import argparse
 
@@ -63,7 +67,57 @@ def handle_client(ip, port, conn, addr, routes):
     # Handle client
     daemon.handle_client(conn, addr, routes)
 
-def run_backend(ip, port, routes):
+def accept_clients(ip, port, server, routes):
+    """
+    Accepts the connections of a listening socket and spawns a thread for
+    each client.
+
+    :param ip (str): IP address of the server.
+    :param port (int): Port number the server is listening on.
+    :param server (socket.socket): the listening socket.
+    :param routes (dict): Dictionary of route handlers.
+    """
+    while True:
+        conn, addr = server.accept()
+        # Unix domain socket peers have no address
+        if not addr:
+            addr = ("unix", 0)
+        #
+        #  TODO: implement the step of the client incomping connection
+        #        using multi-thread programming with the
+        #        provided handle_client routine
+        #
+        # new thread for the connection
+        client_thread = threading.Thread(
+            target=handle_client, 
+            args=(ip, port, conn, addr, routes) 
+        )
+        
+        client_thread.daemon = True 
+        client_thread.start()
+
+
+def listen_unix_socket(path):
+    """
+    Binds a listening Unix domain socket, replacing the socket file a
+    previous run left behind.
+
+    :param path (str): path of the socket file.
+
+    :rtype socket.socket: the listening socket.
+    """
+    try:
+        if stat.S_ISSOCK(os.stat(path).st_mode):
+            os.unlink(path)
+    except OSError:
+        pass
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(path)
+    server.listen(50)
+    return server
+
+
+def run_backend(ip, port, routes, unix_socket=None):
     """
     Starts the backend server, binds to the specified IP and port, and listens for incoming
     connections. Each connection is handled in a separate thread. The backend accepts incoming
@@ -73,42 +127,42 @@ def run_backend(ip, port, routes):
     :param ip (str): IP address to bind the server.
     :param port (int): Port number to listen on.
     :param routes (dict): Dictionary of route handlers.
+    :param unix_socket (str): path of a Unix domain socket to listen on as
+                              well, for a proxy on the same host.
     """
     server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
 
     try:
+        if unix_socket:
+            if hasattr(socket, 'AF_UNIX'):
+                local = listen_unix_socket(unix_socket)
+                print("[Backend] Listening on unix:{}".format(unix_socket))
+                threading.Thread(target=accept_clients,
+                                 args=(ip, port, local, routes),
+                                 daemon=True).start()
+            else:
+                print("[Backend] Unix domain sockets are not supported here")
+
         server.bind((ip, port))
         server.listen(50)
         print("[Backend] Listening on port {}".format(port))
         if routes != {}:
             print("[Backend] route settings {}".format(routes))
 
-        while True:
-            conn, addr = server.accept()
-            #
-            #  TODO: implement the step of the client incomping connection
-            #        using multi-thread programming with the
-            #        provided handle_client routine
-            #
-            # new thread for the connection
-            client_thread = threading.Thread(
-                target=handle_client, 
-                args=(ip, port, conn, addr, routes) 
-            )
-            
-            client_thread.daemon = True 
-            client_thread.start()
+        accept_clients(ip, port, server, routes)
             
     except socket.error as e:
       print("Socket error: {}".format(e))
 
-def create_backend(ip, port, routes={}):
+def create_backend(ip, port, routes={}, unix_socket=None):
     """
     Entry point for creating and running the backend server.
 
     :param ip (str): IP address to bind the server.
     :param port (int): Port number to listen on.
     :param routes (dict, optional): Dictionary of route handlers. Defaults to empty dict.
+    :param unix_socket (str, optional): path of a Unix domain socket to
+                                        listen on as well.
     """
 
-    run_backend(ip, port, routes)
\ No newline at end of file
+    run_backend(ip, port, routes, unix_socket)
@@ -0,0 +1,349 @@
+#
+# Copyright (C) 2025 pdnguyen of HCMC University of Technology VNU-HCM.
+# All rights reserved.
+# This file is part of the CO3093/CO3094 course.
+#
+# WeApRous release
+#
+# The authors hereby grant to Licensee personal permission to use
+# and modify the Licensed Source Code for the sole purpose of studying
+# while attending the course
+#
+
+"""
+daemon.balancer
+~~~~~~~~~~~~~~~~~
+
+This module provides the load balancers used by the proxy to pick a backend
+among the ``proxy_pass`` entries of a host. One balancer object is built per
+host from the parsed config, so the per-request path only calls
+:meth:`select` and never touches shared module state.
+
+Balancer state is safe to share between client threads: the round-robin
+counter is an ``itertools.count`` whose ``next()`` is atomic under the GIL,
+the hash ring is read-only once built and its session pins are updated
+under a lock (an insert, its move to the end and the evictions form one
+step, a lone ``OrderedDict`` call is not enough).
+
+The :class:`HashRing <HashRing>` implements consistent hashing with virtual
+nodes. A key (the ``session_id`` cookie or the client IP) always maps to the
+same backend, and adding or removing one of N backends only moves about 1/N
+of the keys to a different backend.
+"""
+
+import bisect
+import hashlib
+import itertools
+import threading
+import time
+from collections import OrderedDict, deque
+
+#: Number of virtual nodes placed on the ring for every backend.
+DEFAULT_VNODES = 160
+
+#: Upper bound of remembered session -> backend pins.
+MAX_PINS = 100000
+
+#: Seconds a backend is skipped after a failed connect or read.
+FAIL_TIMEOUT = 10.0
+
+#: Latency samples kept per host to estimate the p95.
+LATENCY_SAMPLES = 256
+
+#: Samples needed before the p95 estimate is trusted.
+MIN_LATENCY_SAMPLES = 20
+
+
+def hash_key(key):
+    """
+    Hashes a routing key to a position on the ring.
+
+    :params key (str): the key to hash.
+
+    :rtype int: 64 bit position on the ring.
+    """
+    digest = hashlib.md5(key.encode('utf-8')).digest()
+    return int.from_bytes(digest[:8], 'big')
+
+
+class HashRing:
+    """The :class:`HashRing <HashRing>` object, a consistent hash ring with
+    virtual nodes.
+
+    Each backend is placed ``vnodes`` times on the ring. A key is served by
+    the first virtual node clockwise from its hash.
+
+    Sessions created before the client had a ``session_id`` cookie (the
+    login request itself is routed by client IP) are pinned to the backend
+    that issued the cookie, so the follow up requests land on the node that
+    actually stores the session.
+
+    Usage::
+
+      >>> ring = HashRing(['10.0.0.1:9000', '10.0.0.2:9000'])
+      >>> ring.get('5f2b...')
+      '10.0.0.2:9000'
+    """
+
+    __attrs__ = [
+        "vnodes",
+        "nodes",
+        "pins",
+    ]
+
+    def __init__(self, nodes=None, vnodes=DEFAULT_VNODES):
+        """
+        Initializes a new :class:`HashRing <HashRing>` object.
+
+        :params nodes (list): backend addresses in ``host:port`` form.
+        :params vnodes (int): virtual nodes per backend.
+        """
+        #: Virtual nodes per backend.
+        self.vnodes = vnodes
+        #: Backends placed on the ring.
+        self.nodes = []
+        #: Pinned keys, most recently used last.
+        self.pins = OrderedDict()
+        self._pins_lock = threading.Lock()
+        self._hashes = []
+        self._owners = []
+        for node in nodes or []:
+            self.add(node)
+
+    def add(self, node):
+        """
+        Places a backend on the ring.
+
+        :params node (str): backend address in ``host:port`` form.
+        """
+        if node in self.nodes:
+            return
+        self.nodes.append(node)
+        for i in range(self.vnodes):
+            point = hash_key("{}#{}".format(node, i))
+            index = bisect.bisect(self._hashes, point)
+            self._hashes.insert(index, point)
+            self._owners.insert(index, node)
+
+    def remove(self, node):
+        """
+        Removes a backend and all of its virtual nodes from the ring.
+
+        :params node (str): backend address in ``host:port`` form.
+        """
+        if node not in self.nodes:
+            return
+        self.nodes.remove(node)
+        kept = [(h, o) for h, o in zip(self._hashes, self._owners) if o != node]
+        self._hashes = [h for h, _ in kept]
+        self._owners = [o for _, o in kept]
+
+    def pin(self, key, node):
+        """
+        Remembers that ``key`` must be served by ``node``.
+
+        :params key (str): routing key, usually a session id.
+        :params node (str): backend address that owns the key.
+        """
+        with self._pins_lock:
+            self.pins[key] = node
+            self.pins.move_to_end(key)
+            while len(self.pins) > MAX_PINS:
+                self.pins.popitem(last=False)
+
+    def get(self, key):
+        """
+        Returns the backend serving ``key``.
+
+        :params key (str): routing key.
+
+        :rtype str: backend address, or None if the ring is empty.
+        """
+        if not self._hashes:
+            return None
+        node = self.pins.get(key)
+        if node in self.nodes:
+            return node
+        index = bisect.bisect(self._hashes, hash_key(key)) % len(self._hashes)
+        return self._owners[index]
+
+
+class LatencyWindow:
+    """Sliding window of the last upstream response times of a host."""
+
+    def __init__(self, size=LATENCY_SAMPLES):
+        self.samples = deque(maxlen=size)
+
+    def add(self, seconds):
+        """Records one response time (``deque.append`` is atomic)."""
+        self.samples.append(seconds)
+
+    def percentile(self, p):
+        """
+        Returns the ``p`` percentile of the window.
+
+        :params p (float): percentile in [0, 1], e.g. 0.95.
+
+        :rtype float: response time in seconds, or None while the window
+                      holds too few samples.
+        """
+        samples = sorted(list(self.samples))
+        if len(samples) < MIN_LATENCY_SAMPLES:
+            return None
+        return samples[min(len(samples) - 1, int(p * len(samples)))]
+
+
+class Balancer:
+    """The :class:`Balancer <Balancer>` base object, which picks one of the
+    backends of a host.
+
+    Backends whose connect or read failed are skipped for ``FAIL_TIMEOUT``
+    seconds, and the response times are kept to drive hedged requests.
+
+    :attrs targets (tuple): backend addresses in ``host:port`` form.
+    :attrs policy (str): name of the ``dist_policy``.
+    :attrs latency (LatencyWindow): recent upstream response times.
+    """
+
+    policy = None
+
+    def __init__(self, targets):
+        """
+        Initializes a new balancer.
+
+        :params targets (list): backend addresses in ``host:port`` form.
+        """
+        self.targets = tuple(t.strip() for t in targets)
+        self.latency = LatencyWindow()
+        #: backend -> time until which it is considered down.
+        self._failed_until = {}
+
+    def is_healthy(self, target):
+        """Tells whether ``target`` is not in its failure cool-down."""
+        until = self._failed_until.get(target)
+        return until is None or until <= time.monotonic()
+
+    def mark_failed(self, target):
+        """Takes ``target`` out of rotation for ``FAIL_TIMEOUT`` seconds."""
+        self._failed_until[target] = time.monotonic() + FAIL_TIMEOUT
+
+    def mark_ok(self, target):
+        """Puts ``target`` back in rotation after a successful exchange."""
+        self._failed_until.pop(target, None)
+
+    def failover_order(self, first):
+        """
+        Returns the backends to try for one request: ``first``, then the
+        other healthy backends, then the ones still cooling down.
+
+        :params first (str): the backend chosen by :meth:`select`.
+
+        :rtype list: backend addresses in try order.
+        """
+        others = [t for t in self.targets if t != first]
+        healthy = [t for t in others if self.is_healthy(t)]
+        down = [t for t in others if t not in healthy]
+        return [first] + healthy + down
+
+    def select(self, affinity_key=None):
+        """
+        Returns the backend to forward the next request to.
+
+        :params affinity_key (str): session id or client IP of the request.
+
+        :rtype str: backend address, or None if there is no backend.
+        """
+        if not self.targets:
+            return None
+        return self.targets[0]
+
+    def pin(self, key, target):
+        """
+        Remembers that ``key`` belongs to ``target``. Only meaningful for
+        balancers with affinity, a no-op otherwise.
+        """
+        return
+
+
+class RoundRobinBalancer(Balancer):
+    """Hands out backends in turn using a lock-free atomic counter,
+    skipping the ones cooling down after a failure."""
+
+    policy = 'round-robin'
+
+    def __init__(self, targets):
+        super().__init__(targets)
+        self._counter = itertools.count()
+
+    def select(self, affinity_key=None):
+        if not self.targets:
+            return None
+        for _ in range(len(self.targets)):
+            target = self.targets[next(self._counter) % len(self.targets)]
+            if self.is_healthy(target):
+                return target
+        return target
+
+
+class FallbackBalancer(Balancer):
+    """Prefers the first healthy backend in config order."""
+
+    policy = 'fallback'
+
+    def select(self, affinity_key=None):
+        for target in self.targets:
+            if self.is_healthy(target):
+                return target
+        return super().select(affinity_key)
+
+
+class StickyBalancer(Balancer):
+    """Routes by the affinity key over a :class:`HashRing <HashRing>`."""
+
+    policy = 'sticky'
+
+    def __init__(self, targets, vnodes=DEFAULT_VNODES):
+        super().__init__(targets)
+        self.ring = HashRing(self.targets, vnodes)
+
+    def select(self, affinity_key=None):
+        return self.ring.get(affinity_key or '')
+
+    def pin(self, key, target):
+        self.ring.pin(key, target)
+
+
+#: Balancer class of every supported ``dist_policy``.
+BALANCERS = {
+    'round-robin': RoundRobinBalancer,
+    'fallback': FallbackBalancer,
+    'sticky': StickyBalancer,
+}
+
+
+def create_balancer(proxy_map, policy):
+    """
+    Builds the balancer of one host.
+
+    :params proxy_map (list or str): backend address(es) of the host.
+    :params policy (str): the ``dist_policy`` of the host. Unknown policies
+                          behave like ``fallback``.
+
+    :rtype Balancer: the balancer of the host.
+    """
+    if isinstance(proxy_map, str):
+        proxy_map = [proxy_map]
+    return BALANCERS.get(policy, FallbackBalancer)(proxy_map or [])
+
+
+def build_balancers(routes):
+    """
+    Builds one balancer per host from the parsed config.
+
+    :params routes (dict): hostname -> (proxy_map, policy, options) mapping
+                           as returned by ``parse_virtual_hosts``.
+
+    :rtype dict: hostname -> :class:`Balancer <Balancer>`.
+    """
+    return {host: create_balancer(route[0], route[1])
+            for host, route in routes.items()}
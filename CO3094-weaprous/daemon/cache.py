@@ -0,0 +1,327 @@
+#
+# Copyright (C) 2025 pdnguyen of HCMC University of Technology VNU-HCM.
+# All rights reserved.
+# This file is part of the CO3093/CO3094 course.
+#
+# WeApRous release
+#
+# The authors hereby grant to Licensee personal permission to use
+# and modify the Licensed Source Code for the sole purpose of studying
+# while attending the course
+#
+
+"""
+daemon.cache
+~~~~~~~~~~~~~~~~~
+
+This module provides the in-proxy HTTP response cache used for cacheable GET
+requests (static assets, repeated ``/channels/list`` calls, ...).
+
+Entries are keyed by host, path and the request headers named in the
+backend ``Vary`` header. Freshness follows the backend ``Cache-Control``
+(``max-age``, ``s-maxage``, ``stale-while-revalidate``) or ``Expires``
+headers. The cache is bounded in bytes and entries, least recently used
+entries are evicted first.
+
+Usage::
+
+  >>> cache = ResponseCache(max_bytes=1 << 20)
+  >>> cache.store("app1.local", "/css/styles.css", req_headers, raw_response)
+  >>> response, state = cache.lookup("app1.local", "/css/styles.css", req_headers)
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from email.utils import parsedate_to_datetime
+
+#: Default upper bound of the cached bytes.
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+
+#: Default upper bound of the cached entries.
+DEFAULT_MAX_ENTRIES = 10000
+
+#: Status codes which may be stored (RFC 9111 heuristically cacheable).
+CACHEABLE_STATUS = (200, 203, 204, 301, 404, 410)
+
+
+def parse_response_head(response):
+    """
+    Splits a raw HTTP response into its status code and headers.
+
+    :params response (bytes): raw HTTP response.
+
+    :rtype (int, dict): status code and lower-cased header mapping.
+    """
+    head = response.split(b"\r\n\r\n", 1)[0].decode('latin-1')
+    lines = head.split("\r\n")
+    try:
+        status = int(lines[0].split()[1])
+    except (IndexError, ValueError):
+        status = 0
+    headers = {}
+    for line in lines[1:]:
+        if ':' in line:
+            key, val = line.split(':', 1)
+            headers[key.strip().lower()] = val.strip()
+    return status, headers
+
+
+def parse_cache_control(value):
+    """
+    Parses a ``Cache-Control`` header value.
+
+    :params value (str): header value, e.g. ``public, max-age=60``.
+
+    :rtype dict: directive -> argument (None for bare directives).
+    """
+    directives = {}
+    for part in (value or '').split(','):
+        name, _, arg = part.strip().partition('=')
+        if name:
+            directives[name.lower()] = arg.strip('"') if arg else None
+    return directives
+
+
+def freshness(headers, now):
+    """
+    Computes how long a response stays fresh, then usable while stale.
+
+    :params headers (dict): lower-cased response headers.
+    :params now (float): current time.
+
+    :rtype (float, float): fresh lifetime and stale-while-revalidate window
+                           in seconds, or (None, 0) if the response must not
+                           be stored.
+    """
+    cc = parse_cache_control(headers.get('cache-control'))
+    if 'no-store' in cc or 'private' in cc or 'no-cache' in cc:
+        return None, 0
+
+    swr = 0
+    try:
+        swr = max(0, int(cc.get('stale-while-revalidate') or 0))
+    except ValueError:
+        pass
+
+    for name in ('s-maxage', 'max-age'):
+        if cc.get(name) is not None:
+            try:
+                return max(0, int(cc[name])), swr
+            except ValueError:
+                return None, 0
+
+    if 'expires' in headers:
+        try:
+            expires = parsedate_to_datetime(headers['expires']).timestamp()
+            date = now
+            if 'date' in headers:
+                date = parsedate_to_datetime(headers['date']).timestamp()
+            return max(0, expires - date), swr
+        except (TypeError, ValueError):
+            return None, 0
+
+    return None, 0
+
+
+def add_header(response, name, value):
+    """
+    Inserts a header right after the status line of a raw response.
+
+    :params response (bytes): raw HTTP response.
+    :params name (str): header name.
+    :params value (str): header value.
+
+    :rtype bytes: the response with the header added.
+    """
+    status_line, sep, rest = response.partition(b"\r\n")
+    if not sep:
+        return response
+    return b"".join((status_line, sep,
+                     "{}: {}\r\n".format(name, value).encode('latin-1'), rest))
+
+
+class CacheEntry:
+    """One stored response and its freshness deadlines."""
+
+    __slots__ = ("key", "response", "stored_at", "expires_at", "stale_until")
+
+    def __init__(self, key, response, stored_at, expires_at, stale_until):
+        self.key = key
+        self.response = response
+        self.stored_at = stored_at
+        self.expires_at = expires_at
+        self.stale_until = stale_until
+
+
+class ResponseCache:
+    """The :class:`ResponseCache <ResponseCache>` object, a size-bounded LRU
+    cache of raw backend responses shared by every client thread.
+
+    :attrs max_bytes (int): upper bound of cached response bytes.
+    :attrs max_entries (int): upper bound of cached responses.
+    :attrs hits (int): lookups served from a fresh entry.
+    :attrs stale_hits (int): lookups served from a stale entry while it is
+                             revalidated in the background.
+    :attrs misses (int): lookups with no usable entry.
+    :attrs stores (int): responses stored.
+    :attrs evictions (int): entries dropped to stay within the bounds.
+    """
+
+    __attrs__ = [
+        "max_bytes",
+        "max_entries",
+        "hits",
+        "stale_hits",
+        "misses",
+        "stores",
+        "evictions",
+    ]
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES, max_entries=DEFAULT_MAX_ENTRIES):
+        """
+        Initializes a new :class:`ResponseCache <ResponseCache>` object.
+
+        :params max_bytes (int): upper bound of cached response bytes.
+        :params max_entries (int): upper bound of cached responses.
+        """
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+        self.size = 0
+        self._lock = threading.Lock()
+        #: variant key -> CacheEntry, least recently used first.
+        self._entries = OrderedDict()
+        #: (host, path) -> header names listed in the backend Vary header.
+        self._vary = OrderedDict()
+        #: variant keys currently being revalidated.
+        self._revalidating = set()
+
+    def _variant_key(self, host, path, req_headers, vary):
+        values = tuple(req_headers.get(name, '') for name in vary)
+        return (host, path, values)
+
+    def lookup(self, host, path, req_headers):
+        """
+        Looks up a cached response.
+
+        :params host (str): request host.
+        :params path (str): request target, query string included.
+        :params req_headers (dict): lower-cased request headers.
+
+        :rtype (bytes, str): the response with ``Age`` and ``X-Cache``
+                             headers added and its state (``HIT`` or
+                             ``STALE``), or (None, ``MISS``).
+        """
+        now = time.time()
+        with self._lock:
+            vary = self._vary.get((host, path))
+            entry = None
+            if vary is not None:
+                key = self._variant_key(host, path, req_headers, vary)
+                entry = self._entries.get(key)
+            if entry is None or now >= entry.stale_until:
+                if entry is not None:
+                    self._drop(entry.key)
+                self.misses += 1
+                return None, 'MISS'
+            self._entries.move_to_end(entry.key)
+            if now < entry.expires_at:
+                self.hits += 1
+                state = 'HIT'
+            else:
+                self.stale_hits += 1
+                state = 'STALE'
+            response = entry.response
+            age = int(now - entry.stored_at)
+
+        response = add_header(response, 'Age', age)
+        return add_header(response, 'X-Cache', state), state
+
+    def store(self, host, path, req_headers, response):
+        """
+        Stores a backend response if its headers allow it.
+
+        :params host (str): request host.
+        :params path (str): request target, query string included.
+        :params req_headers (dict): lower-cased request headers.
+        :params response (bytes): raw HTTP response from the backend.
+
+        :rtype bool: True if the response was stored.
+        """
+        status, headers = parse_response_head(response)
+        if status not in CACHEABLE_STATUS or 'set-cookie' in headers:
+            return False
+        vary = tuple(sorted(
+            v.strip().lower() for v in headers.get('vary', '').split(',') if v.strip()))
+        if '*' in vary or len(response) > self.max_bytes:
+            return False
+
+        now = time.time()
+        ttl, swr = freshness(headers, now)
+        if ttl is None or ttl + swr <= 0:
+            return False
+
+        with self._lock:
+            self._vary[(host, path)] = vary
+            self._vary.move_to_end((host, path))
+            key = self._variant_key(host, path, req_headers, vary)
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = CacheEntry(key, response, now, now + ttl, now + ttl + swr)
+            self.size += len(response)
+            self.stores += 1
+            while self.size > self.max_bytes or len(self._entries) > self.max_entries:
+                oldest = next(iter(self._entries))
+                self._drop(oldest)
+                self.evictions += 1
+            while len(self._vary) > self.max_entries:
+                self._vary.popitem(last=False)
+        return True
+
+    def begin_revalidate(self, host, path, req_headers):
+        """
+        Claims the background revalidation of a stale entry, so only one
+        client thread refreshes it.
+
+        :rtype tuple: the claimed key to hand to :meth:`end_revalidate`, or
+                      None if another thread is already revalidating.
+        """
+        with self._lock:
+            vary = self._vary.get((host, path), ())
+            key = self._variant_key(host, path, req_headers, vary)
+            if key in self._revalidating:
+                return None
+            self._revalidating.add(key)
+            return key
+
+    def end_revalidate(self, key):
+        """Releases a revalidation claimed by :meth:`begin_revalidate`."""
+        with self._lock:
+            self._revalidating.discard(key)
+
+    def _drop(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.size -= len(entry.response)
+
+    def stats(self):
+        """
+        Returns the cache counters.
+
+        :rtype dict: hit/miss/store/eviction counters and current size.
+        """
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "stale_hits": self.stale_hits,
+                "misses": self.misses,
+                "stores": self.stores,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "bytes": self.size,
+            }
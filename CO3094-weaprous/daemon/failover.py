@@ -0,0 +1,358 @@
+#
+# Copyright (C) 2025 pdnguyen of HCMC University of Technology VNU-HCM.
+# All rights reserved.
+# This file is part of the CO3093/CO3094 course.
+#
+# WeApRous release
+#
+# The authors hereby grant to Licensee personal permission to use
+# and modify the Licensed Source Code for the sole purpose of studying
+# while attending the course
+#
+
+"""
+daemon.failover
+~~~~~~~~~~~~~~~~~
+
+This module provides upstream failover for the proxy: retries on the next
+healthy backend, hedged requests and a global retry budget.
+
+- On a connect error or timeout the request is retried on the next backend
+  of the host, within ``proxy_next_upstream_tries`` attempts. A request the
+  backend may already have processed is only retried when its method is
+  idempotent.
+- With ``proxy_hedge on;`` an idempotent request which has not been
+  answered after the host p95 response time is duplicated to a second
+  backend. The first answer wins.
+- Every retry or hedge spends a token of the process-wide
+  :class:`RetryBudget <RetryBudget>`, which only earns a fraction of a token
+  per request. A failing backend therefore cannot turn into a retry storm.
+
+Backends are ``host:port`` addresses, or ``unix:/path.sock`` for a
+co-located backend listening on a Unix domain socket
+(``proxy_pass unix:/tmp/tracker.sock;``), which skips the TCP stack.
+
+Usage::
+
+  >>> target, response = forward_with_failover(balancer, first, request,
+  ...                                          'GET', options, send_upstream)
+"""
+
+import asyncio
+import contextvars
+import queue
+import socket
+import threading
+import time
+
+from .utils import parse_duration
+from .proxylog import log
+
+#: Methods which may be sent twice without changing the outcome.
+IDEMPOTENT_METHODS = ('GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE', 'TRACE')
+
+#: Upstream connect timeout used when the host sets no ``proxy_connect_timeout``.
+DEFAULT_CONNECT_TIMEOUT = 5.0
+
+#: Hedge delay used while the host has too few latency samples for a p95.
+DEFAULT_HEDGE_DELAY = 0.1
+
+#: Host part of the ``unix:/path.sock`` backends, their port is the path.
+UNIX_HOST = "unix"
+
+
+class UpstreamError(Exception):
+    """A backend could not be reached or did not answer.
+
+    :attrs sent (bool): True if the request may have reached the backend.
+    :attrs timed_out (bool): True if the backend was too slow rather than
+                             unreachable.
+    """
+
+    def __init__(self, message, sent=False, timed_out=False):
+        super().__init__(message)
+        self.sent = sent
+        self.timed_out = timed_out
+
+
+class UpstreamBusy(UpstreamError):
+    """The backend already holds its ``proxy_max_conns`` connections. The
+    next backend is tried, but this one is not marked failed."""
+
+
+class DeadlineExceeded(UpstreamError):
+    """The timeout budget of the request ran out. The backend is not to
+    blame, so it is neither marked failed nor retried."""
+
+    def __init__(self, message, sent=False):
+        super().__init__(message, sent, timed_out=True)
+
+
+class RetryBudget:
+    """The :class:`RetryBudget <RetryBudget>` object, a token bucket capping
+    retries and hedges to a ratio of the regular traffic.
+
+    Each request deposits ``ratio`` tokens, each retry withdraws one. A small
+    time based allowance (``min_per_second``) keeps failover working when the
+    traffic is low.
+
+    :attrs retries (int): retries and hedges allowed.
+    :attrs rejected (int): retries refused because the budget was empty.
+    """
+
+    __attrs__ = [
+        "ratio",
+        "min_per_second",
+        "retries",
+        "rejected",
+    ]
+
+    def __init__(self, ratio=0.2, min_per_second=10.0, burst=20.0):
+        """
+        :params ratio (float): retries allowed per regular request.
+        :params min_per_second (float): retries always allowed per second.
+        :params burst (float): upper bound of saved tokens.
+        """
+        self.ratio = ratio
+        self.min_per_second = min_per_second
+        self.burst = burst
+        self.retries = 0
+        self.rejected = 0
+        self._tokens = burst
+        self._stamp = time.monotonic()
+        self._lock = threading.Lock()
+
+    def deposit(self):
+        """Records one regular request."""
+        with self._lock:
+            self._tokens = min(self.burst, self._tokens + self.ratio)
+
+    def withdraw(self):
+        """
+        Asks for one retry.
+
+        :rtype bool: True if the retry may be sent.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst,
+                               self._tokens + (now - self._stamp) * self.min_per_second)
+            self._stamp = now
+            if self._tokens >= 1.0:
+                self._tokens -= 1.0
+                self.retries += 1
+                return True
+            self.rejected += 1
+            return False
+
+    def stats(self):
+        """
+        Returns the budget counters.
+
+        :rtype dict: retries allowed, retries rejected and tokens left.
+        """
+        with self._lock:
+            return {
+                "retries": self.retries,
+                "rejected": self.rejected,
+                "tokens": self._tokens,
+            }
+
+
+#: Retry budget shared by every host of the proxy.
+RETRY_BUDGET = RetryBudget()
+
+
+def split_target(target):
+    """
+    Splits a ``host:port`` or ``unix:/path.sock`` backend address.
+
+    :rtype (str, int): host and port, or ``"unix"`` and the socket path.
+    """
+    host, port = target.split(":", 1)
+    if host.strip() == UNIX_HOST:
+        return UNIX_HOST, port.strip()
+    return host.strip(), int(port)
+
+
+def connect_upstream(host, port, timeout=None):
+    """
+    Connects to a backend, over a Unix domain socket for ``unix`` hosts.
+
+    :params host (str): IP address of the backend, or ``"unix"``.
+    :params port (int or str): port number, or the socket path.
+    :params timeout (float): seconds allowed to connect.
+
+    :rtype socket.socket: the connected socket.
+
+    :raise socket.error: when the backend cannot be reached.
+    """
+    if host != UNIX_HOST:
+        return socket.create_connection((host, port), timeout=timeout)
+    if not hasattr(socket, 'AF_UNIX'):
+        raise socket.error("Unix domain sockets are not supported here")
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.settimeout(timeout)
+        sock.connect(port)
+    except socket.error:
+        sock.close()
+        raise
+    return sock
+
+
+async def open_upstream_connection(host, port):
+    """
+    Coroutine counterpart of :func:`connect_upstream`.
+
+    :rtype (asyncio.StreamReader, asyncio.StreamWriter): the backend streams.
+    """
+    if host != UNIX_HOST:
+        return await asyncio.open_connection(host, port)
+    if not hasattr(asyncio, 'open_unix_connection'):
+        raise OSError("Unix domain sockets are not supported here")
+    return await asyncio.open_unix_connection(port)
+
+
+def failover_plan(balancer, first, method, options):
+    """
+    Computes the backends one request may use and how.
+
+    :params balancer (Balancer): balancer of the host.
+    :params first (str): backend chosen by the routing policy.
+    :params method (str): request method.
+    :params options (dict): directives of the host block.
+
+    :rtype (list, bool, bool, float): backends in try order, whether the
+                                      request is idempotent, whether to hedge
+                                      and the connect timeout.
+    """
+    targets = balancer.failover_order(first)
+    try:
+        tries = int(options.get('proxy_next_upstream_tries', len(targets)))
+    except ValueError:
+        tries = len(targets)
+    targets = targets[:max(1, tries)]
+
+    idempotent = method in IDEMPOTENT_METHODS
+    hedge = (idempotent and len(targets) > 1
+             and options.get('proxy_hedge') == 'on')
+
+    connect_timeout = parse_duration(options.get('proxy_connect_timeout'),
+                                     DEFAULT_CONNECT_TIMEOUT)
+    return targets, idempotent, hedge, connect_timeout
+
+
+def hedge_delay(balancer):
+    """Returns how long to wait for the first answer before hedging."""
+    p95 = balancer.latency.percentile(0.95)
+    return DEFAULT_HEDGE_DELAY if p95 is None else p95
+
+
+def forward_with_failover(balancer, first, request, method, options, send):
+    """
+    Forwards a request, failing over to the next healthy backend on
+    connect errors and timeouts, optionally hedging slow answers.
+
+    :params balancer (Balancer): balancer of the host.
+    :params first (str): backend chosen by the routing policy.
+    :params request (str): incoming HTTP request.
+    :params method (str): request method.
+    :params options (dict): directives of the host block.
+    :params send (callable): ``send(host, port, request, connect_timeout)``
+                             returning the raw response or raising
+                             :class:`UpstreamError <UpstreamError>`.
+
+    :rtype (str, bytes): the backend which answered and its response.
+
+    :raise UpstreamError: when no backend answered.
+    """
+    targets, idempotent, hedge, connect_timeout = failover_plan(
+        balancer, first, method, options)
+    RETRY_BUDGET.deposit()
+
+    if hedge:
+        return _forward_hedged(balancer, targets, request, connect_timeout, send)
+
+    last_error = UpstreamError("no upstream available")
+    for attempt, target in enumerate(targets):
+        if attempt > 0:
+            if not RETRY_BUDGET.withdraw():
+                log("[Proxy] Retry budget exhausted, not retrying on {}".format(target))
+                break
+            log("[Proxy] Retrying on {}".format(target))
+        host, port = split_target(target)
+        start = time.monotonic()
+        try:
+            response = send(host, port, request, connect_timeout)
+        except DeadlineExceeded:
+            raise
+        except UpstreamError as e:
+            log("[Proxy] Upstream {} failed: {}".format(target, e))
+            if not isinstance(e, UpstreamBusy):
+                balancer.mark_failed(target)
+            last_error = e
+            if e.sent and not idempotent:
+                break
+            continue
+        balancer.mark_ok(target)
+        balancer.latency.add(time.monotonic() - start)
+        return target, response
+    raise last_error
+
+
+def _forward_hedged(balancer, targets, request, connect_timeout, send):
+    """Races the first backend against a late duplicate on the next one."""
+    results = queue.Queue()
+
+    def attempt(target):
+        host, port = split_target(target)
+        start = time.monotonic()
+        try:
+            response = send(host, port, request, connect_timeout)
+            results.put((target, response, None, time.monotonic() - start))
+        except UpstreamError as e:
+            results.put((target, None, e, 0))
+
+    def launch(target):
+        # The attempt runs in the context of the request: its spans join
+        # the trace of the request
+        ctx = contextvars.copy_context()
+        threading.Thread(target=ctx.run, args=(attempt, target), daemon=True).start()
+
+    launch(targets[0])
+    pending, next_index, hedged = 1, 1, False
+    last_error = UpstreamError("no upstream available")
+    while pending:
+        timeout = None
+        if not hedged and next_index < len(targets):
+            timeout = hedge_delay(balancer)
+        try:
+            target, response, error, elapsed = results.get(timeout=timeout)
+        except queue.Empty:
+            # No answer by the p95: send a duplicate to the next backend
+            hedged = True
+            if RETRY_BUDGET.withdraw():
+                log("[Proxy] Hedging request to {}".format(targets[next_index]))
+                launch(targets[next_index])
+                next_index += 1
+                pending += 1
+            continue
+
+        pending -= 1
+        if error is None:
+            balancer.mark_ok(target)
+            balancer.latency.add(elapsed)
+            return target, response
+        if isinstance(error, DeadlineExceeded):
+            raise error
+
+        log("[Proxy] Upstream {} failed: {}".format(target, error))
+        if not isinstance(error, UpstreamBusy):
+            balancer.mark_failed(target)
+        last_error = error
+        if next_index < len(targets) and RETRY_BUDGET.withdraw():
+            launch(targets[next_index])
+            next_index += 1
+            pending += 1
+    raise last_error
@@ -18,11 +18,23 @@ This module provides a http adapter object to manage and persist
 http settings (headers, bodies). The adapter supports both
 raw URL paths and RESTful route definitions, and integrates with
 Request and Response objects to handle client-server communication.
+
+Every response echoes the ``X-Request-ID`` of its request, and sampled
+requests (``X-Trace-Sampled: 1`` from the proxy) report the accept, parse,
+handler and serialise spans in ``Server-Timing``.
+
+A hook returning a :class:`LongPoll <LongPoll>` is answered later: the
+connection is parked in the shared event loop of ``daemon.longpoll`` and
+the client thread returns.
 """
 
+import time
+
 from .request import Request
 from .response import Response
 from .dictionary import CaseInsensitiveDict
+from .longpoll import PARKER, LongPoll
+from .tracing import TRACER, Trace, request_id
 
 
 class HttpAdapter:
@@ -98,6 +110,8 @@ class HttpAdapter:
         req = self.request
         # Response handler
         resp = self.response
+        start = time.monotonic()
+        parked = False
 
         try:
             ############################
@@ -130,9 +144,15 @@ class HttpAdapter:
                     break
                 body_data += chunk
                 
+            # Trace the request with the ID and sampling decision of the proxy
+            trace = Trace(request_id(temp_req.headers), "backend",
+                          TRACER.sampled(temp_req.headers), start)
+            trace.lap("accept")
+
             # 4. Chuẩn bị lại request CHÍNH THỨC với body đầy đủ
             msg = header_data.decode('utf-8', 'ignore') + "\r\n\r\n" + body_data.decode('utf-8', 'ignore')
             req.prepare(msg, routes) # req.hook được gán ở đây
+            trace.lap("parse")
 
             if not req.method:
                  print("[HttpAdapter] Request loi, dong ket noi.")
@@ -158,11 +178,23 @@ class HttpAdapter:
             if req.hook:
                 print(f"[HttpAdapter] Hooking to route: {req.method} {req.path}")
                 try:
-                    hook_response = req.hook(headers=req.headers, body=req.body) 
+                    if getattr(req.hook, '_route_query', False):
+                        hook_response = req.hook(headers=req.headers, body=req.body,
+                                                 query=req.query)
+                    else:
+                        hook_response = req.hook(headers=req.headers, body=req.body) 
                     
+                    # Kịch bản 0: Long-poll, trả lời sau trên event loop chung
+                    if isinstance(hook_response, LongPoll):
+                        trace.lap("handler")
+                        PARKER.park(hook_response, conn,
+                                    lambda result: self.respond_later(req, resp, trace, result))
+                        parked = True
+                        return
+
                     # Kịch bản 1: Lỗi 401 (API trả về lỗi, ví dụ: /index.html)
                     # (Kiểm tra xem hook_response có phải là tuple (401, ...))
-                    if isinstance(hook_response, tuple) and hook_response[0] == 401:
+                    elif isinstance(hook_response, tuple) and hook_response[0] == 401:
                         print("[HttpAdapter] Hook tra ve 401. Dang phuc vu trang 401.html")
                         resp.status_code = 401
                         req.path = '/401.html' # Đổi path sang trang lỗi
@@ -209,14 +241,39 @@ class HttpAdapter:
                 # Không cần làm gì. 
                 # response.py sẽ tự động tìm file và gán status 200
             
+            trace.lap("handler")
+
             # 3. BUILD RESPONSE
             response_bytes = resp.build_response(req)
-            conn.sendall(response_bytes)
+            trace.lap("serialise")
+            conn.sendall(trace.stamp(response_bytes))
+            trace.lap("send")
+            TRACER.write(trace, method=req.method, path=req.path,
+                         status=response_bytes[9:12].decode('latin-1'))
 
         except Exception as e:
             print(f"[HttpAdapter] Loi khong ngo toi: {e}")
         finally:
-            conn.close()
+            if not parked:
+                conn.close()
+
+    def respond_later(self, req, resp, trace, result):
+        """
+        Builds the response of a parked :class:`LongPoll <LongPoll>`.
+
+        :params req (Request): the parked request.
+        :params resp (Response): its response object.
+        :params trace (Trace): its trace.
+        :params result: what the poll answered, as a hook returns it.
+
+        :rtype bytes: the raw HTTP response.
+        """
+        req.hook_response = result
+        response_bytes = resp.build_response(req)
+        trace.lap("serialise")
+        TRACER.write(trace, method=req.method, path=req.path,
+                     status=response_bytes[9:12].decode('latin-1'))
+        return trace.stamp(response_bytes)
 
     # @property
     # def extract_cookies(self, req, resp):
@@ -0,0 +1,224 @@
+#
+# Copyright (C) 2025 pdnguyen of HCMC University of Technology VNU-HCM.
+# All rights reserved.
+# This file is part of the CO3093/CO3094 course.
+#
+# WeApRous release
+#
+# The authors hereby grant to Licensee personal permission to use
+# and modify the Licensed Source Code for the sole purpose of studying
+# while attending the course
+#
+
+"""
+daemon.longpoll
+~~~~~~~~~~~~~~~~~
+
+This module provides long-poll responses for the WeApRous backend.
+
+A route handler with nothing to answer yet returns a :class:`LongPoll
+<LongPoll>` instead of a response. The adapter then parks the client
+connection in the :class:`Parker <Parker>`, a single asyncio event loop
+thread shared by every waiting request, and its connection thread ends:
+a thousand waiting clients cost a thousand sockets, not a thousand
+threads.
+
+Whatever thread makes something happen calls :meth:`LongPoll.wake`, or
+:func:`wake_all` for many polls at once. The loop then calls the
+``check`` of the poll again and sends its result, unless it is still
+None. When the timeout fires first the ``expire`` result is sent. A
+client hanging up ends its poll, and the ``on_close`` callbacks of a poll
+run however it ended.
+
+Usage::
+
+  >>> poll = LongPoll(check, timeout=25, expire=lambda: (204, ""))
+  >>> state.watch(username, poll)
+  >>> poll.on_close(lambda: state.unwatch(username, poll))
+  >>> return poll
+"""
+
+import asyncio
+import threading
+
+
+class LongPoll:
+    """The :class:`LongPoll <LongPoll>` object, a response waiting for an
+    event.
+
+    ``check`` and ``expire`` return what a route handler returns (a dict,
+    or a ``(status, body[, headers])`` tuple); ``check`` returns None while
+    there is nothing to answer. Both run on the loop thread and must not
+    block.
+
+    :attrs timeout (float): seconds before the ``expire`` result is sent.
+    """
+
+    __attrs__ = [
+        "timeout",
+    ]
+
+    def __init__(self, check, timeout, expire=None):
+        """
+        :params check (callable): the response, or None to keep waiting.
+        :params timeout (float): seconds to wait at most.
+        :params expire (callable): the response on timeout, ``(204, "")``
+                                   by default.
+        """
+        self.check = check
+        self.timeout = timeout
+        self.expire = expire or (lambda: (204, ""))
+        self._closers = []
+        self._loop = None
+        self._conn = None
+        self._respond = None
+        self._timer = None
+        self._done = False
+
+    def on_close(self, callback):
+        """Runs ``callback`` once the poll ended, answered or not."""
+        self._closers.append(callback)
+
+    def wake(self):
+        """Tells the poll something happened, from any thread."""
+        loop = self._loop
+        if loop is not None and not self._done:
+            loop.call_soon_threadsafe(self._on_wake)
+
+    def _attach(self, loop, conn, respond):
+        self._loop = loop
+        self._conn = conn
+        self._respond = respond
+
+    def _start(self):
+        conn = self._conn
+        conn.setblocking(False)
+        self._loop.add_reader(conn, self._on_readable)
+        self._timer = self._loop.call_later(self.timeout, self._on_timeout)
+        # Wakes sent before the poll was parked were dropped, look now
+        self._on_wake()
+
+    def _on_wake(self):
+        if self._done:
+            return
+        try:
+            result = self.check()
+        except Exception as e:
+            print("[LongPoll] check error: {}".format(e))
+            result = (500, {"status": "error"})
+        if result is not None:
+            self._finish(result)
+
+    def _on_timeout(self):
+        if not self._done:
+            self._finish(self.expire())
+
+    def _on_readable(self):
+        # The request was read whole: anything more is the client leaving
+        try:
+            data = self._conn.recv(1024)
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError:
+            data = b""
+        if not data:
+            self._end()
+            self._conn.close()
+
+    def _end(self):
+        self._done = True
+        if self._timer is not None:
+            self._timer.cancel()
+        self._loop.remove_reader(self._conn)
+        for callback in self._closers:
+            try:
+                callback()
+            except Exception as e:
+                print("[LongPoll] close callback error: {}".format(e))
+
+    def _finish(self, result):
+        self._end()
+        try:
+            data = self._respond(result)
+        except Exception as e:
+            print("[LongPoll] response error: {}".format(e))
+            self._conn.close()
+            return
+        self._loop.create_task(self._send(data))
+
+    async def _send(self, data):
+        try:
+            await self._loop.sock_sendall(self._conn, data)
+        except OSError as e:
+            print("[LongPoll] send error: {}".format(e))
+        finally:
+            self._conn.close()
+
+
+def wake_all(polls):
+    """
+    Wakes many polls with a single hop to the loop thread, instead of one
+    per poll.
+
+    :params polls (iterable): the :class:`LongPoll <LongPoll>` objects.
+    """
+    polls = [poll for poll in polls if poll._loop is not None and not poll._done]
+    if polls:
+        polls[0]._loop.call_soon_threadsafe(_wake_each, polls)
+
+
+def _wake_each(polls):
+    for poll in polls:
+        poll._on_wake()
+
+
+class Parker:
+    """The :class:`Parker <Parker>` object, the event loop thread holding
+    the connections of the waiting :class:`LongPoll <LongPoll>` responses.
+
+    The thread starts with the first parked poll. Handlers may also run
+    coroutines on it with :meth:`submit`.
+    """
+
+    def __init__(self):
+        self._loop = None
+        self._lock = threading.Lock()
+
+    def _ensure_loop(self):
+        with self._lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="longpoll",
+                                 daemon=True).start()
+                self._loop = loop
+            return self._loop
+
+    def submit(self, coro):
+        """
+        Runs a coroutine of a handler on the loop, e.g. network calls made
+        concurrently rather than one thread each.
+
+        :params coro (coroutine): what to run.
+
+        :rtype concurrent.futures.Future: its result, for the handler
+                                          thread to wait on.
+        """
+        return asyncio.run_coroutine_threadsafe(coro, self._ensure_loop())
+
+    def park(self, poll, conn, respond):
+        """
+        Hands a client connection over to the loop until ``poll`` ends.
+
+        :params poll (LongPoll): what the handler returned.
+        :params conn (socket.socket): the client connection, closed by the
+                                      loop once answered.
+        :params respond (callable): turns a handler result into the raw
+                                    HTTP response bytes.
+        """
+        loop = self._ensure_loop()
+        poll._attach(loop, conn, respond)
+        loop.call_soon_threadsafe(poll._start)
+
+
+#: Parker of the process, shared by every backend listener.
+PARKER = Parker()
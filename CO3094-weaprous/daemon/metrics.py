@@ -0,0 +1,363 @@
+#
+# Copyright (C) 2025 pdnguyen of HCMC University of Technology VNU-HCM.
+# All rights reserved.
+# This file is part of the CO3093/CO3094 course.
+#
+# WeApRous release
+#
+# The authors hereby grant to Licensee personal permission to use
+# and modify the Licensed Source Code for the sole purpose of studying
+# while attending the course
+#
+
+"""
+daemon.metrics
+~~~~~~~~~~~~~~~~~
+
+This module provides the metrics of the proxy in the Prometheus text
+format, served by an admin listener (``start_proxy.py --metrics-port``).
+
+Recording stays off the locks. Every thread writes to its own
+:class:`Shard <Shard>` of counters and fixed-bucket histograms, and the
+shards are only merged when ``/metrics`` is scraped. The threaded engine
+runs one thread per client, so the shard of a finished thread is folded
+into a retired total when the thread ends.
+
+Point-in-time values owned by other components (cache, coalescer, retry
+budget, balancer health...) are read at scrape time by the collectors
+registered with :func:`register_collector`.
+
+Usage::
+
+  >>> inc(REQUESTS, (route, upstream, "200"))
+  >>> observe(UPSTREAM_RESPONSE, (upstream,), 0.012)
+  >>> start_metrics_server("127.0.0.1", 9100)
+"""
+
+import bisect
+import socket
+import threading
+import weakref
+
+#: Upper bounds (seconds) of the latency histogram buckets.
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25,
+                   0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+REQUESTS = "proxy_requests_total"
+IN_FLIGHT = "proxy_requests_in_flight"
+BYTES_IN = "proxy_request_bytes_total"
+BYTES_OUT = "proxy_response_bytes_total"
+UPSTREAM_CONNECT = "proxy_upstream_connect_seconds"
+UPSTREAM_RESPONSE = "proxy_upstream_response_seconds"
+UPSTREAM_ACTIVE = "proxy_upstream_active_connections"
+TUNNELS_OPEN = "proxy_tunnels_open"
+BALANCER_DECISIONS = "proxy_balancer_decisions_total"
+TLS_HANDSHAKES = "proxy_tls_handshakes_total"
+
+#: name -> (type, help, label names) of the recorded metrics.
+METRICS = {
+    REQUESTS: ("counter", "Requests answered by the proxy.",
+               ("route", "upstream", "status")),
+    IN_FLIGHT: ("gauge", "Requests being served.", ("route",)),
+    BYTES_IN: ("counter", "Request bytes read from clients.", ("route",)),
+    BYTES_OUT: ("counter", "Response bytes written to clients.", ("route",)),
+    UPSTREAM_CONNECT: ("histogram", "Time to connect to a backend.",
+                       ("upstream",)),
+    UPSTREAM_RESPONSE: ("histogram", "Time from connect to the full backend response.",
+                        ("upstream",)),
+    UPSTREAM_ACTIVE: ("gauge", "Open connections to a backend.", ("upstream",)),
+    TUNNELS_OPEN: ("gauge", "Upgrade and event-stream tunnels to a backend.",
+                   ("upstream",)),
+    BALANCER_DECISIONS: ("counter", "Backends picked by the balancers.",
+                         ("route", "policy", "upstream")),
+    TLS_HANDSHAKES: ("counter", "TLS handshakes of the clients, full, resumed or failed.",
+                     ("mode",)),
+}
+
+
+class Shard:
+    """The metrics recorded by one thread.
+
+    A histogram is a list of bucket counts, one per bound plus ``+Inf``,
+    followed by the sum of the observations.
+    """
+
+    __slots__ = ("counters", "histograms")
+
+    def __init__(self):
+        self.counters = {}
+        self.histograms = {}
+
+
+class _ShardOwner:
+    """Lives in the thread-local storage, its collection retires the shard."""
+
+    __slots__ = ("__weakref__",)
+
+
+_local = threading.local()
+# Re-entrant: a shard finalizer may run while this thread holds the lock
+_lock = threading.RLock()
+_live = set()
+_retired = Shard()
+_collectors = []
+
+
+def _new_shard():
+    shard = Shard()
+    owner = _ShardOwner()
+    _local.shard = shard
+    _local.owner = owner
+    with _lock:
+        _live.add(shard)
+    weakref.finalize(owner, _retire, shard)
+    return shard
+
+
+def _retire(shard):
+    with _lock:
+        _live.discard(shard)
+        _merge(_retired, shard)
+
+
+def _merge(into, shard):
+    # dict() and list() copies are single C calls, safe against the owner
+    # thread writing meanwhile
+    for key, value in dict(shard.counters).items():
+        into.counters[key] = into.counters.get(key, 0) + value
+    for key, buckets in dict(shard.histograms).items():
+        total = into.histograms.get(key)
+        if total is None:
+            into.histograms[key] = list(buckets)
+        else:
+            for i, value in enumerate(list(buckets)):
+                total[i] += value
+
+
+def inc(name, labels=(), value=1):
+    """
+    Adds ``value`` to a counter (or a gauge, with a negative ``value``).
+
+    :params name (str): metric name, a key of :data:`METRICS`.
+    :params labels (tuple): label values, in the order of :data:`METRICS`.
+    :params value (int or float): the increment.
+    """
+    try:
+        counters = _local.shard.counters
+    except AttributeError:
+        counters = _new_shard().counters
+    key = (name, labels)
+    counters[key] = counters.get(key, 0) + value
+
+
+def observe(name, labels, value):
+    """
+    Records one observation in a histogram.
+
+    :params name (str): metric name, a key of :data:`METRICS`.
+    :params labels (tuple): label values.
+    :params value (float): the observation, in seconds.
+    """
+    try:
+        histograms = _local.shard.histograms
+    except AttributeError:
+        histograms = _new_shard().histograms
+    key = (name, labels)
+    buckets = histograms.get(key)
+    if buckets is None:
+        buckets = histograms[key] = [0] * (len(LATENCY_BUCKETS) + 2)
+    buckets[bisect.bisect_left(LATENCY_BUCKETS, value)] += 1
+    buckets[-1] += value
+
+
+def route_label(route_key, routes):
+    """
+    Returns the ``route`` label of a request. Hosts missing from the
+    config share the ``default`` label, so a client cannot create labels
+    with made-up Host headers.
+    """
+    if route_key not in routes:
+        return "default"
+    if isinstance(route_key, tuple):
+        return " ".join(route_key)
+    return route_key
+
+
+def record_response(route, upstream, request_size, response):
+    """
+    Records one answered request.
+
+    :params route (str): the ``route`` label.
+    :params upstream (str): backend which answered, ``cache`` or ``-``.
+    :params request_size (int): bytes read from the client.
+    :params response (bytes): raw HTTP response sent to the client.
+    """
+    status = response[9:12].decode('latin-1') if len(response) >= 12 else "000"
+    inc(REQUESTS, (route, upstream, status))
+    inc(BYTES_IN, (route,), request_size)
+    inc(BYTES_OUT, (route,), len(response))
+
+
+def record_tunnel(route, upstream, status, sent, received):
+    """
+    Records one finished tunnel.
+
+    :params route (str): the ``route`` label.
+    :params upstream (str): the backend of the tunnel.
+    :params status (bytes): status code of the backend answer, if any.
+    :params sent (int): bytes relayed from the client.
+    :params received (int): bytes relayed to the client.
+    """
+    inc(REQUESTS, (route, upstream, status.decode('latin-1') if status else "000"))
+    inc(BYTES_IN, (route,), sent)
+    inc(BYTES_OUT, (route,), received)
+
+
+def register_collector(collector):
+    """
+    Registers a function called at every scrape. It returns a list of
+    ``(name, type, help, samples)`` where ``samples`` lists
+    ``(labels dict, value)`` pairs.
+    """
+    _collectors.append(collector)
+
+
+def snapshot():
+    """
+    Merges the retired and the live shards.
+
+    :rtype Shard: the totals.
+    """
+    total = Shard()
+    with _lock:
+        shards = [_retired] + list(_live)
+        for shard in shards:
+            _merge(total, shard)
+    return total
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values, extra=None):
+    pairs = ['{}="{}"'.format(n, _escape(v)) for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value):
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def render():
+    """
+    Renders every metric in the Prometheus text exposition format.
+
+    :rtype str: the ``/metrics`` body.
+    """
+    total = snapshot()
+    by_name = {}
+    for (name, labels), value in total.counters.items():
+        by_name.setdefault(name, []).append((labels, value))
+    for (name, labels), buckets in total.histograms.items():
+        by_name.setdefault(name, []).append((labels, buckets))
+
+    lines = []
+    for name, (kind, text, label_names) in METRICS.items():
+        samples = by_name.get(name)
+        if not samples:
+            continue
+        lines.append("# HELP {} {}".format(name, text))
+        lines.append("# TYPE {} {}".format(name, kind))
+        for labels, value in sorted(samples, key=lambda s: s[0]):
+            if kind != "histogram":
+                lines.append("{}{} {}".format(
+                    name, _format_labels(label_names, labels), _format_value(value)))
+                continue
+            cumulative = 0
+            for bound, count in zip(LATENCY_BUCKETS + ("+Inf",), value[:-1]):
+                cumulative += count
+                lines.append("{}_bucket{} {}".format(
+                    name, _format_labels(label_names, labels, 'le="{}"'.format(bound)),
+                    cumulative))
+            lines.append("{}_sum{} {}".format(
+                name, _format_labels(label_names, labels), _format_value(value[-1])))
+            lines.append("{}_count{} {}".format(
+                name, _format_labels(label_names, labels), cumulative))
+
+    for collector in list(_collectors):
+        try:
+            families = collector()
+        except Exception as e:
+            print("[Proxy] Metrics collector failed: {}".format(e))
+            continue
+        for name, kind, text, samples in families:
+            lines.append("# HELP {} {}".format(name, text))
+            lines.append("# TYPE {} {}".format(name, kind))
+            for labels, value in samples:
+                lines.append("{}{} {}".format(
+                    name, _format_labels(list(labels), list(labels.values())),
+                    _format_value(value)))
+    return "\n".join(lines) + "\n"
+
+
+def stats_family(name, kind, text, stats, label="kind"):
+    """
+    Turns a ``stats()`` dict of a component into a collector family with
+    one sample per key.
+
+    :rtype tuple: ``(name, type, help, samples)``.
+    """
+    return (name, kind, text,
+            [({label: key}, value) for key, value in stats.items()])
+
+
+def handle_metrics_client(conn):
+    """Answers one admin connection: ``GET /metrics`` or 404."""
+    try:
+        conn.settimeout(5.0)
+        request = conn.recv(4096).decode('latin-1')
+        parts = request.split("\r\n", 1)[0].split()
+        if len(parts) > 1 and parts[0] == 'GET' and parts[1].split('?')[0] == '/metrics':
+            status, body = "200 OK", render()
+            content_type = "text/plain; version=0.0.4"
+        else:
+            status, body, content_type = "404 Not Found", "404 Not Found", "text/plain"
+        payload = body.encode('utf-8')
+        conn.sendall((
+            "HTTP/1.1 {}\r\n"
+            "Content-Type: {}\r\n"
+            "Content-Length: {}\r\n"
+            "Connection: close\r\n"
+            "\r\n"
+        ).format(status, content_type, len(payload)).encode('latin-1') + payload)
+    except socket.error:
+        pass
+    finally:
+        conn.close()
+
+
+def start_metrics_server(ip, port):
+    """
+    Starts the admin listener serving ``/metrics`` in a daemon thread.
+
+    :params ip (str): IP address to bind the admin listener.
+    :params port (int): port number of the admin listener.
+    """
+    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    server.bind((ip, port))
+    server.listen(16)
+    print("[Proxy] Metrics on http://{}:{}/metrics".format(ip, port))
+
+    def loop():
+        while True:
+            conn, _ = server.accept()
+            handle_metrics_client(conn)
+
+    threading.Thread(target=loop, daemon=True).start()
+    return server
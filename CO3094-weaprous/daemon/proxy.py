@@ -25,13 +25,84 @@ Requirement:
 - response: customized :class: `Response <Response>` utilities.
 - httpadapter: :class: `HttpAdapter <HttpAdapter >` adapter for HTTP request processing.
 - dictionary: :class: `CaseInsensitiveDict <CaseInsensitiveDict>` for managing headers and cookies.
+- balancer: per-host :class: `Balancer <Balancer>` objects picking the backend.
+- cache: :class: `ResponseCache <ResponseCache>` for cacheable GET responses.
+- singleflight: :class: `SingleFlight <SingleFlight>` coalescing identical concurrent GETs.
+- failover: retries on the next healthy backend and hedged requests.
+- routing: :class: `Router <Router>` holding the reloadable routing table and location tries.
+- ratelimit: per-client token buckets and connection caps.
+- timeouts: connect, first-byte and end-to-end deadlines.
+- metrics: per-thread counters and histograms served to Prometheus.
+- tunnel: full-duplex relays for ``Upgrade`` and event-stream requests.
+- tracing: ``X-Request-ID``, ``X-Forwarded-For`` and ``Server-Timing`` spans.
+- tls: optional TLS listener sharing one resumption-enabled ``SSLContext``.
+- proxylog: the log, queued for a writer thread; per-request lines only with ``--verbose``.
 
 """
 import socket
 import threading
+import time
 from .response import *
 from .httpadapter import HttpAdapter
 from .dictionary import CaseInsensitiveDict
+from .balancer import create_balancer
+from .routing import Router, locate_route
+from .cache import ResponseCache
+from .singleflight import SingleFlight
+from .failover import (
+    RETRY_BUDGET,
+    UpstreamError,
+    UpstreamBusy,
+    DeadlineExceeded,
+    UNIX_HOST,
+    connect_upstream,
+    forward_with_failover,
+)
+from .timeouts import (
+    GATEWAY_TIMEOUT,
+    Deadline,
+    first_byte_timeout,
+    total_timeout,
+    with_budget_header,
+)
+from .ratelimit import (
+    CONNECTION_LIMITER,
+    SERVICE_UNAVAILABLE,
+    UPSTREAM_LIMITER,
+    stats as rate_limit_stats,
+    check_rate_limits,
+    connection_limit,
+    too_many_requests,
+    upstream_limit,
+)
+from .tunnel import is_tunnel_request, tunnel
+from .tls import accept_tls
+from .tracing import (
+    TRACER,
+    Trace,
+    activate,
+    add_span,
+    deactivate,
+    request_id,
+    trace_sample_rate,
+    with_forwarded_headers,
+)
+from .metrics import (
+    BALANCER_DECISIONS,
+    IN_FLIGHT,
+    UPSTREAM_ACTIVE,
+    UPSTREAM_CONNECT,
+    UPSTREAM_RESPONSE,
+    inc,
+    observe,
+    record_response,
+    record_tunnel,
+    register_collector,
+    route_label,
+    stats_family,
+)
+from .utils import parse_duration
+from .proxylog import debug, log
 
 #: A dictionary mapping hostnames to backend IP and port tuples.
 #: Used to determine routing targets for incoming requests.
@@ -41,7 +112,197 @@ PROXY_PASS = {
     "app2.local": ('192.168.56.103', 9002),
 }
 
-ROUND_ROBIN_STATE = {}
+#: Default route of the hosts missing from the config.
+DEFAULT_ROUTE = ('127.0.0.1:9000', 'round-robin', {})
+
+#: Response cache shared by the hosts with ``proxy_cache on``.
+RESPONSE_CACHE = ResponseCache()
+
+#: Coalesces identical concurrent GETs of the ``proxy_coalesce on`` hosts.
+COALESCER = SingleFlight()
+
+#: Default time a coalesced answer stays joinable after it arrived.
+DEFAULT_COALESCE_WINDOW = 0.05
+
+#: Seconds a client has to send its request, and for each write to it.
+#: Idle and slowloris-style clients are disconnected after it.
+CLIENT_TIMEOUT = 10.0
+
+#: Upper bound of a request header section.
+MAX_HEADER_SIZE = 64 * 1024
+
+#: Upper bound of a request body, larger ones are refused with 413.
+MAX_BODY_SIZE = 1024 * 1024
+
+
+#: Response sent when no backend answers.
+BACKEND_UNREACHABLE = (
+    "HTTP/1.1 404 Not Found\r\n"
+    "Content-Type: text/plain\r\n"
+    "Content-Length: 13\r\n"
+    "Connection: close\r\n"
+    "\r\n"
+    "404 Not Found"
+).encode('utf-8')
+
+#: Response sent for a ``Content-Length`` above ``MAX_BODY_SIZE``.
+PAYLOAD_TOO_LARGE = (
+    "HTTP/1.1 413 Payload Too Large\r\n"
+    "Content-Type: text/plain\r\n"
+    "Content-Length: 21\r\n"
+    "Connection: close\r\n"
+    "\r\n"
+    "413 Payload Too Large"
+).encode('utf-8')
+
+#: Response sent for an invalid ``Content-Length``.
+BAD_REQUEST = (
+    "HTTP/1.1 400 Bad Request\r\n"
+    "Content-Type: text/plain\r\n"
+    "Content-Length: 15\r\n"
+    "Connection: close\r\n"
+    "\r\n"
+    "400 Bad Request"
+).encode('utf-8')
+
+
+class RequestRejected(Exception):
+    """A client request refused before it is routed.
+
+    :attrs response (bytes): the raw HTTP response to send back.
+    """
+
+    def __init__(self, response):
+        super().__init__(response.split(b"\r\n", 1)[0].decode('latin-1'))
+        self.response = response
+
+
+def collect_proxy_stats():
+    """
+    Metrics collector of the components shared by the proxy threads.
+
+    :rtype list: ``(name, type, help, samples)`` metric families.
+    """
+    limits = rate_limit_stats()
+    return [
+        stats_family("proxy_cache", "gauge", "Response cache counters.",
+                     RESPONSE_CACHE.stats()),
+        stats_family("proxy_coalescer", "gauge", "Request coalescing counters.",
+                     COALESCER.stats()),
+        stats_family("proxy_retry_budget", "gauge", "Retry budget counters.",
+                     RETRY_BUDGET.stats()),
+        stats_family("proxy_connection_limiter", "gauge",
+                     "Per-client connection cap counters.", limits["connections"]),
+        stats_family("proxy_upstream_limiter", "gauge",
+                     "Per-backend connection cap counters.", limits["upstreams"]),
+        ("proxy_rate_limit", "gauge", "Per-client token bucket counters.",
+         [({"table": table, "kind": kind}, value)
+          for table, counters in limits["buckets"].items()
+          for kind, value in counters.items()]),
+        ("proxy_threads", "gauge", "Threads of the proxy process.",
+         [({}, threading.active_count())]),
+    ]
+
+
+def balancer_collector(router):
+    """
+    Returns the metrics collector of the balancers of ``router``.
+
+    :params router (Router): the proxy router.
+
+    :rtype callable: the collector.
+    """
+    def collect():
+        table = router.table
+        samples = []
+        for key, balancer in table.balancers.items():
+            for target in balancer.targets:
+                samples.append(({"route": route_label(key, table.routes),
+                                 "upstream": target},
+                                1 if balancer.is_healthy(target) else 0))
+        return [
+            ("proxy_upstream_healthy", "gauge",
+             "1 unless the backend is in its failure cool-down.", samples),
+            ("proxy_routing_table_version", "gauge",
+             "Reload generation of the routing table.", [({}, table.version)]),
+        ]
+    return collect
+
+
+register_collector(collect_proxy_stats)
+
+
+def send_upstream(host, port, request, connect_timeout=None,
+                  first_byte_timeout=None, deadline=None):
+    """
+    Sends an HTTP request to a backend server and reads the response until
+    the backend closes the connection.
+
+    :params host (str): IP address of the backend server, or ``"unix"``.
+    :params port (int or str): port number of the backend server, or the
+                               path of its Unix domain socket.
+    :params request (str): incoming HTTP request.
+    :params connect_timeout (float): seconds allowed to connect, None waits
+                                     for the operating system.
+    :params first_byte_timeout (float): seconds allowed until the first
+                                        response byte, None for no limit.
+    :params deadline (Deadline): budget of the whole request. It caps every
+                                 wait and is sent in ``X-Timeout-Budget-Ms``.
+
+    :rtype bytes: Raw HTTP response from the backend server.
+
+    :raise UpstreamError: when the backend is unreachable, too slow or sends
+                          nothing; :class:`DeadlineExceeded` when the
+                          budget ran out.
+    """
+    payload = request.encode('utf-8', 'surrogateescape')
+    if deadline is not None:
+        connect_timeout = deadline.cap(connect_timeout)
+        payload = with_budget_header(payload, deadline.remaining())
+    upstream = (host + ":" + str(port),)
+    started = time.monotonic()
+    try:
+        backend = connect_upstream(host, port, connect_timeout)
+    except socket.timeout:
+        raise UpstreamError("connect to {}:{} timed out".format(host, port), timed_out=True)
+    except socket.error as e:
+        raise UpstreamError("connect to {}:{} failed: {}".format(host, port, e))
+    connected = time.monotonic()
+    observe(UPSTREAM_CONNECT, upstream, connected - started)
+    add_span("connect", connected - started)
+    inc(UPSTREAM_ACTIVE, upstream)
+
+    try:
+        backend.settimeout(None)
+        backend.sendall(payload)
+        chunks = []
+        timeout = first_byte_timeout
+        while True:
+            backend.settimeout(deadline.cap(timeout, sent=True)
+                               if deadline is not None else timeout)
+            chunk = backend.recv(4096)
+            if not chunk:
+                break
+            chunks.append(chunk)
+            # After the first byte only the total budget applies
+            timeout = None
+    except socket.timeout:
+        if deadline is not None and deadline.expired():
+            raise DeadlineExceeded("timeout budget exhausted on {}:{}".format(host, port),
+                                   sent=True)
+        raise UpstreamError("{}:{} sent no response in time".format(host, port),
+                            sent=True, timed_out=True)
+    except socket.error as e:
+        raise UpstreamError("exchange with {}:{} failed: {}".format(host, port, e), sent=True)
+    finally:
+        backend.close()
+        inc(UPSTREAM_ACTIVE, upstream, -1)
+        add_span("upstream", time.monotonic() - connected)
+    observe(UPSTREAM_RESPONSE, upstream, time.monotonic() - connected)
+    response = b"".join(chunks)
+    if not response:
+        raise UpstreamError("{}:{} closed without answering".format(host, port), sent=True)
+    return response
 
 
 def forward_request(host, port, request):
@@ -56,31 +317,334 @@ def forward_request(host, port, request):
                   fails, returns a 404 Not Found response.
     """
 
-    backend = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    try:
+        return send_upstream(host, port, request)
+    except UpstreamError as e:
+      log("Socket error: {}".format(e))
+      return BACKEND_UNREACHABLE
+
+
+def upstream_error_response(error):
+    """
+    Returns the response sent to the client when no backend answered.
+
+    :params error (UpstreamError): the last upstream error.
+
+    :rtype bytes: 503 when every backend was at ``proxy_max_conns``, 504
+                  when they were too slow, else 404.
+    """
+    if isinstance(error, UpstreamBusy):
+        return SERVICE_UNAVAILABLE
+    return GATEWAY_TIMEOUT if error.timed_out else BACKEND_UNREACHABLE
+
+
+def route_balancer(hostname, target, balancers):
+    """
+    Returns the balancer of a route, or a single-backend one for ``target``
+    when the route has none (unknown host, default route).
+    """
+    balancer = (balancers or {}).get(hostname)
+    if balancer is None or target not in balancer.targets:
+        balancer = create_balancer([target], 'fallback')
+    return balancer
+
+
+def forward_to_host(hostname, target, request, method, options, balancers,
+                    deadline=None):
+    """
+    Forwards a request to the backend chosen by the routing policy and fails
+    over to the other backends of the host when it cannot be reached.
+
+    :params hostname (str or tuple): route key of the request, its host or
+                                   its location.
+    :params target (str): backend chosen by ``resolve_routing_policy``.
+    :params request (str): incoming HTTP request.
+    :params method (str): request method.
+    :params options (dict): directives of the host block.
+    :params balancers (dict): hostname -> :class:`Balancer <Balancer>`.
+    :params deadline (Deadline): budget of the request, a fresh
+                                 ``proxy_timeout`` budget by default.
+
+    :rtype (str, bytes): the backend which answered and its response, or
+                         the :func:`upstream_error_response` of the last
+                         failure.
+    """
+    balancer = route_balancer(hostname, target, balancers)
+    if deadline is None:
+        deadline = Deadline(total_timeout(options))
+    first_byte = first_byte_timeout(options)
+    limit = upstream_limit(options)
+
+    def send(host, port, request, connect_timeout):
+        backend = "{}:{}".format(host, port)
+        if limit is not None and not UPSTREAM_LIMITER.acquire(backend, limit):
+            raise UpstreamBusy("{} is at proxy_max_conns".format(backend))
+        try:
+            return send_upstream(host, port, request, connect_timeout,
+                                 first_byte, deadline)
+        finally:
+            if limit is not None:
+                UPSTREAM_LIMITER.release(backend)
 
     try:
-        backend.connect((host, port))
-        backend.sendall(request.encode())
-        response = b""
-        while True:
-            chunk = backend.recv(4096)
-            if not chunk:
-                break
-            response += chunk
-        return response
-    except socket.error as e:
-      print("Socket error: {}".format(e))
-      return (
-            "HTTP/1.1 404 Not Found\r\n"
-            "Content-Type: text/plain\r\n"
-            "Content-Length: 13\r\n"
-            "Connection: close\r\n"
-            "\r\n"
-            "404 Not Found"
-        ).encode('utf-8')
+        return forward_with_failover(balancer, target, request, method, options, send)
+    except UpstreamError as e:
+        log("Socket error: {}".format(e))
+        return target, upstream_error_response(e)
+
+
+def tunnel_to_host(conn, hostname, target, request, options, balancers, label):
+    """
+    Relays an ``Upgrade`` or event-stream request through a tunnel to the
+    backend chosen by the routing policy, until the tunnel ends.
+
+    :params conn (socket.socket): client connection socket.
+    :params hostname (str or tuple): route key of the request.
+    :params target (str): backend chosen by ``resolve_routing_policy``.
+    :params request (str): incoming HTTP request.
+    :params options (dict): directives of the route.
+    :params balancers (dict): route key -> :class:`Balancer <Balancer>`.
+    :params label (str): the ``route`` metrics label.
+    """
+    payload = request.encode('utf-8', 'surrogateescape')
+    try:
+        target, sent, received, status = tunnel(
+            conn, payload, route_balancer(hostname, target, balancers), target, options)
+    except UpstreamError as e:
+        log("Socket error: {}".format(e))
+        if e.sent:
+            return
+        response = upstream_error_response(e)
+        record_response(label, target, len(request), response)
+        conn.sendall(response)
+        return
+    debug("[Proxy] Tunnel to {} closed, {} bytes up, {} bytes down".format(
+        target, sent, received))
+    record_tunnel(label, target, status, sent, received)
+
+
+def content_length(head):
+    """
+    Returns the ``Content-Length`` of a request header section.
 
+    :params head (bytes): the header section.
 
-def resolve_routing_policy(hostname, routes):
+    :rtype int: the body length, 0 without the header.
+
+    :raise RequestRejected: 400 for an invalid, negative or repeated
+                            conflicting length, 413 above ``MAX_BODY_SIZE``.
+    """
+    lengths = set()
+    for line in head.split(b"\r\n"):
+        if line.lower().startswith(b"content-length:"):
+            value = line.split(b":", 1)[1].strip()
+            if not value.isdigit():
+                raise RequestRejected(BAD_REQUEST)
+            lengths.add(int(value))
+    if len(lengths) > 1:
+        raise RequestRejected(BAD_REQUEST)
+    length = lengths.pop() if lengths else 0
+    if length > MAX_BODY_SIZE:
+        raise RequestRejected(PAYLOAD_TOO_LARGE)
+    return length
+
+
+def read_client_request(conn, timeout=CLIENT_TIMEOUT):
+    """
+    Reads one HTTP request, header section and ``Content-Length`` body.
+
+    The client has ``timeout`` seconds in total to send it, so a client
+    sending nothing, or a byte now and then, cannot hold the thread. The
+    length is checked before any of the body is read.
+
+    :params conn (socket.socket): client connection socket.
+    :params timeout (float): seconds allowed for the whole request.
+
+    :rtype str: the request, or an empty string when the client went
+                away, was too slow or sent an oversized header.
+
+    :raise RequestRejected: for an invalid or too large ``Content-Length``.
+    """
+    deadline = time.monotonic() + timeout
+
+    def receive():
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise socket.timeout("client too slow")
+        conn.settimeout(remaining)
+        chunk = conn.recv(4096)
+        if not chunk:
+            raise ConnectionError("client closed")
+        return chunk
+
+    data = bytearray()
+    try:
+        end = -1
+        while end < 0:
+            if len(data) > MAX_HEADER_SIZE:
+                return ""
+            # The terminator may straddle the previous chunk
+            start = max(0, len(data) - 3)
+            data += receive()
+            end = data.find(b"\r\n\r\n", start)
+        head = bytes(data[:end])
+        length = content_length(head)
+        chunks = [bytes(data[end + 4:])]
+        received = len(chunks[0])
+        while received < length:
+            chunk = receive()
+            chunks.append(chunk)
+            received += len(chunk)
+        # Writes to the client get the same allowance
+        conn.settimeout(timeout)
+    except socket.error:
+        return ""
+    return (head + b"\r\n\r\n" + b"".join(chunks)).decode('utf-8', 'surrogateescape')
+
+
+def parse_request_head(request):
+    """
+    Extracts the request line and headers of an HTTP request.
+
+    :params request (str): incoming HTTP request.
+
+    :rtype (str, str, dict): method, request target and lower-cased headers.
+    """
+    lines = request.split("\r\n\r\n", 1)[0].split("\r\n")
+    parts = lines[0].split()
+    method = parts[0].upper() if parts else ''
+    path = parts[1] if len(parts) > 1 else '/'
+    headers = {}
+    for line in lines[1:]:
+        if ':' in line:
+            key, val = line.split(':', 1)
+            headers[key.strip().lower()] = val.strip()
+    return method, path, headers
+
+
+def get_host_options(hostname, routes):
+    """
+    Returns the extra directives of a host block (``proxy_cache``, ...).
+
+    :params hostname (str): the request host.
+    :params routes (dict): dictionary mapping hostnames and location.
+
+    :rtype dict: directive name -> value.
+    """
+    route = routes.get(hostname, DEFAULT_ROUTE)
+    return route[2] if len(route) > 2 else {}
+
+
+def is_cacheable_request(method, headers, options):
+    """
+    Tells whether a request may be answered from / stored in the cache.
+
+    :params method (str): request method.
+    :params headers (dict): lower-cased request headers.
+    :params options (dict): directives of the host block.
+
+    :rtype bool: True for GETs of a ``proxy_cache on`` host without
+                 credentials.
+    """
+    return (method == 'GET'
+            and options.get('proxy_cache') == 'on'
+            and 'authorization' not in headers)
+
+
+def should_coalesce(method, path, options):
+    """
+    Tells whether a request takes part in single-flight coalescing.
+
+    Only GETs of a ``proxy_coalesce on`` host whose path is listed in
+    ``proxy_coalesce_paths`` are coalesced. The listed routes must answer
+    the same bytes to every caller. An entry ending in ``*`` matches a
+    path prefix.
+
+    :params method (str): request method.
+    :params path (str): request target.
+    :params options (dict): directives of the host block.
+
+    :rtype bool: True if the request may share an upstream call.
+    """
+    if method != 'GET' or options.get('proxy_coalesce') != 'on':
+        return False
+    route = path.split('?', 1)[0]
+    for allowed in options.get('proxy_coalesce_paths', '').split():
+        if allowed.endswith('*'):
+            if route.startswith(allowed[:-1]):
+                return True
+        elif route == allowed:
+            return True
+    return False
+
+
+def revalidate_cached(hostname, path, headers, request, routes, balancers,
+                      affinity_key, key, route_key=None):
+    """
+    Refreshes a stale cache entry in the background
+    (``stale-while-revalidate``).
+
+    :params key (tuple): the revalidation claimed on the cache.
+    :params route_key (str or tuple): route serving the request, the host
+                                      route by default.
+    """
+    route_key = hostname if route_key is None else route_key
+    try:
+        target_host, target_port = resolve_routing_policy(
+            route_key, routes, affinity_key, balancers)
+        if target_host:
+            _, response = forward_to_host(
+                route_key, "{}:{}".format(target_host, target_port), request,
+                'GET', get_host_options(route_key, routes), balancers)
+            RESPONSE_CACHE.store(hostname, path, headers, response)
+    except Exception as e:
+        log("[Proxy] Revalidation of {}{} failed: {}".format(hostname, path, e))
+    finally:
+        RESPONSE_CACHE.end_revalidate(key)
+
+
+def extract_affinity_key(request, addr):
+    """
+    Extracts the key used by the ``sticky`` policy: the ``session_id``
+    cookie when present, otherwise the client IP.
+
+    :params request (str): incoming HTTP request.
+    :params addr (tuple): client address (IP, port).
+
+    :rtype str: the affinity key.
+    """
+    for line in request.split("\r\n\r\n", 1)[0].splitlines():
+        if line.lower().startswith('cookie:'):
+            for pair in line.split(':', 1)[1].split(';'):
+                key, _, value = pair.strip().partition('=')
+                if key == 'session_id' and value:
+                    return value
+    return addr[0]
+
+
+def learn_session_cookie(balancer, target, response):
+    """
+    Pins a freshly issued ``session_id`` to the backend that issued it.
+
+    The login request carries no cookie yet, so it is routed by client IP.
+    Pinning the new session keeps the following requests on the backend
+    which actually stores it.
+
+    :params balancer (Balancer): balancer of the host the request was sent to.
+    :params target (str): backend address in ``host:port`` form.
+    :params response (bytes): raw HTTP response from the backend.
+    """
+    if balancer is None or balancer.policy != 'sticky':
+        return
+    head = response.split(b"\r\n\r\n", 1)[0].decode('latin-1')
+    for line in head.splitlines():
+        if line.lower().startswith('set-cookie:'):
+            key, _, value = line.split(':', 1)[1].strip().partition('=')
+            if key == 'session_id':
+                balancer.pin(value.split(';', 1)[0], target)
+
+
+def resolve_routing_policy(hostname, routes, affinity_key=None, balancers=None):
     """
     Handles an routing policy to return the matching proxy_pass.
     It determines the target backend to forward the request to.
@@ -88,25 +652,29 @@ def resolve_routing_policy(hostname, routes):
     :params host (str): IP address of the request target server.
     :params port (int): port number of the request target server.
     :params routes (dict): dictionary mapping hostnames and location.
+    :params affinity_key (str): session id or client IP used by the
+                                ``sticky`` policy.
+    :params balancers (dict): hostname -> :class:`Balancer <Balancer>` built
+                              once per routing table. Without it a
+                              throw-away balancer is built for this call.
     """
 
-    print(hostname)
-    proxy_map, policy = routes.get(hostname,('127.0.0.1:9000','round-robin'))
-    print(proxy_map)
-    print(policy)
+    # The routes and their policies are logged once, when the table is built
+    route = routes.get(hostname, DEFAULT_ROUTE)
+    proxy_map, policy = route[0], route[1]
 
     proxy_host = ''
     proxy_port = '9000'
     
     # No found map config
     if proxy_map is None:
-        print("[Proxy] No mapping found for hostname {}".format(hostname))
+        log("[Proxy] No mapping found for hostname {}".format(hostname))
         return None, None
     
     if isinstance(proxy_map, list):
         if len(proxy_map) == 0:
-            print("[Proxy] Emtpy resolved routing of hostname {}".format(hostname))
-            print("Empty proxy_map result")
+            log("[Proxy] Emtpy resolved routing of hostname {}".format(hostname))
+            log("Empty proxy_map result")
             # TODO: implement the error handling for non mapped host
             #       the policy is design by team, but it can be 
             #       basic default host in your self-defined system
@@ -121,26 +689,45 @@ def resolve_routing_policy(hostname, routes):
         #   proxy_map
         #   policy
         else:
-            target = proxy_map[0]
-            if policy == 'round-robin':
-                index = ROUND_ROBIN_STATE.get(hostname, 0)
-                target = proxy_map[index % len(proxy_map)]
-                ROUND_ROBIN_STATE[hostname] = index + 1
-            elif policy == 'fallback':
-                # Prefer the first available backend
-                target = proxy_map[0]
+            balancer = (balancers or {}).get(hostname)
+            if balancer is None:
+                balancer = create_balancer(proxy_map, policy)
+            target = balancer.select(affinity_key)
+            inc(BALANCER_DECISIONS,
+                (route_label(hostname, routes), balancer.policy, target))
             proxy_host, proxy_port = target.split(":", 1)
             proxy_host = proxy_host.strip()
             proxy_port = proxy_port.strip()
     else:
-        print("[Proxy] resolve route of hostname {} is a singular".format(hostname))
+        debug("[Proxy] resolve route of hostname {} is a singular".format(hostname))
         proxy_host, proxy_port = proxy_map.split(":", 1)
         proxy_host = proxy_host.strip()
         proxy_port = proxy_port.strip()
 
     return proxy_host, proxy_port
 
-def handle_client(ip, port, conn, addr, routes):
+def reply(conn, response, trace, label, upstream, request_size, method, path):
+    """
+    Sends one response to the client: records its metrics, stamps its
+    ``X-Request-ID`` / ``Server-Timing`` headers and logs its trace.
+
+    :params conn (socket.socket): client connection socket.
+    :params response (bytes): raw HTTP response.
+    :params trace (Trace): trace of the request.
+    :params label (str): the ``route`` metrics label.
+    :params upstream (str): backend which answered, ``cache`` or ``-``.
+    :params request_size (int): bytes read from the client.
+    :params method (str): request method, for the trace log.
+    :params path (str): request path, for the trace log.
+    """
+    record_response(label, upstream, request_size, response)
+    conn.sendall(trace.stamp(response))
+    trace.lap("send")
+    TRACER.write(trace, method=method, path=path, route=label, upstream=upstream,
+                 status=response[9:12].decode('latin-1'))
+
+
+def handle_client(ip, port, conn, addr, routes, balancers=None, locations=None):
     """
     Handles an individual client connection by parsing the request,
     determining the target backend, and forwarding the request.
@@ -157,42 +744,158 @@ def handle_client(ip, port, conn, addr, routes):
     :params conn (socket.socket): client connection socket.
     :params addr (tuple): client address (IP, port).
     :params routes (dict): dictionary mapping hostnames and location.
+    :params balancers (dict): route key -> :class:`Balancer <Balancer>`.
+    :params locations (dict): hostname -> :class:`LocationTrie <LocationTrie>`.
     """
-    # may need to increase buffer size for larger requests
-    request = conn.recv(1024).decode()
+    start = time.monotonic()
+    try:
+        request = read_client_request(conn)
+    except RequestRejected as e:
+        log("[Proxy] Rejecting request of {}: {}".format(addr, e))
+        try:
+            conn.sendall(e.response)
+        except socket.error:
+            pass
+        conn.close()
+        return
+    if not request:
+        debug("[Proxy] Dropping idle or incomplete client {}".format(addr))
+        conn.close()
+        return
 
     # Extract hostname
-    hostname = "{}:{}".format(ip, port)
-    for line in request.splitlines():
-        if line.lower().startswith('host:'):
-            hostname = line.split(':', 1)[1].strip()
+    method, path, headers = parse_request_head(request)
+    hostname = headers.get('host', "{}:{}".format(ip, port))
+
+    debug("[Proxy] {} at Host: {}".format(addr, hostname))
+    affinity_key = extract_affinity_key(request, addr)
+    # The location block serving the path, or the host block itself
+    route_key = locate_route(hostname, path, locations)
+    label = route_label(route_key, routes)
+
+    options = get_host_options(route_key, routes)
+    # End-to-end budget, counted from the accept of the connection
+    deadline = Deadline(total_timeout(options, headers), start)
+
+    # Correlation ID and sampled span timings, passed on to the backend
+    trace = Trace(request_id(headers), "proxy",
+                  TRACER.sample(trace_sample_rate(options)), start)
+    trace.lap("accept")
+    request_size = len(request)
+    request = with_forwarded_headers(request, trace, addr[0])
+    trace.lap("parse")
+
+    # Per-client limits of the route, refused with 429 + Retry-After
+    wait = check_rate_limits(route_key, options, addr[0], headers)
+    max_conns = connection_limit(options)
+    conn_key = (route_key, addr[0])
+    if wait or (max_conns is not None
+                and not CONNECTION_LIMITER.acquire(conn_key, max_conns)):
+        debug("[Proxy] Limited {} on {}".format(addr[0], hostname))
+        try:
+            reply(conn, too_many_requests(wait or 1), trace, label, "-",
+                  request_size, method, path)
+        except socket.error:
+            pass
+        conn.close()
+        return
+
+    inc(IN_FLIGHT, (label,))
+    token = activate(trace)
+    try:
+        # Serve cacheable GETs from the response cache when possible
+        cacheable = (is_cacheable_request(method, headers, options)
+                     and not is_tunnel_request(headers))
+        if cacheable and 'no-cache' not in headers.get('cache-control', ''):
+            cached, state = RESPONSE_CACHE.lookup(hostname, path, headers)
+            if cached is not None:
+                debug("[Proxy] Cache {} for {}{}".format(state, hostname, path))
+                if state == 'STALE':
+                    key = RESPONSE_CACHE.begin_revalidate(hostname, path, headers)
+                    if key is not None:
+                        threading.Thread(
+                            target=revalidate_cached,
+                            args=(hostname, path, headers, request, routes, balancers,
+                                  affinity_key, key, route_key),
+                            daemon=True
+                        ).start()
+                trace.lap("route")
+                reply(conn, cached, trace, label, "cache", request_size, method, path)
+                return
+
+        # Resolve the matching destination in routes and need conver port
+        # to integer value
+        resolved_host, resolved_port = resolve_routing_policy(
+            route_key, routes, affinity_key, balancers)
+        try:
+            resolved_port = int(resolved_port)
+        except ValueError:
+            # unix:/path.sock backends have a path instead of a port
+            if resolved_host != UNIX_HOST:
+                log("Not a valid integer")
+        trace.lap("route")
+
+        target = "-"
+        if resolved_host and is_tunnel_request(headers):
+            # Upgrades and event streams bypass the cache and the
+            # coalescer: bytes are relayed both ways until one side is done
+            tunnel_to_host(conn, route_key, "{}:{}".format(resolved_host, resolved_port),
+                           request, options, balancers, label)
+            return
+        if resolved_host:
+            debug("[Proxy] Host name {} is forwarded to {}:{}".format(hostname, resolved_host, resolved_port))
+            target = "{}:{}".format(resolved_host, resolved_port)
+            shared = False
+            if should_coalesce(method, path, options):
+                window = parse_duration(options.get('proxy_coalesce_window'),
+                                        DEFAULT_COALESCE_WINDOW)
+                (target, response), shared = COALESCER.do(
+                    (hostname, path),
+                    lambda: forward_to_host(route_key, target, request, method,
+                                            options, balancers, deadline),
+                    window)
+                if shared:
+                    debug("[Proxy] Coalesced {}{} onto an in-flight request".format(hostname, path))
+            else:
+                target, response = forward_to_host(route_key, target, request, method,
+                                                   options, balancers, deadline)
+            # connect and upstream spans were added by send_upstream
+            trace.skip()
+            learn_session_cookie((balancers or {}).get(route_key), target, response)
+            if cacheable and not shared:
+                RESPONSE_CACHE.store(hostname, path, headers, response)
+        else:
+            response = BACKEND_UNREACHABLE
+        reply(conn, response, trace, label, target, request_size, method, path)
+    except socket.error as e:
+        log("[Proxy] Client {} dropped: {}".format(addr, e))
+    finally:
+        deactivate(token)
+        conn.close()
+        inc(IN_FLIGHT, (label,), -1)
+        if max_conns is not None:
+            CONNECTION_LIMITER.release(conn_key)
 
-    print("[Proxy] {} at Host: {}".format(addr, hostname))
 
-    # Resolve the matching destination in routes and need conver port
-    # to integer value
-    resolved_host, resolved_port = resolve_routing_policy(hostname, routes)
-    try:
-        resolved_port = int(resolved_port)
-    except ValueError:
-        print("Not a valid integer")
+def serve_client(ip, port, conn, addr, router, ssl_context=None):
+    """
+    Serves one client with the routing table current at accept time. The
+    connection keeps that table until it is closed, even across a reload.
 
-    if resolved_host:
-        print("[Proxy] Host name {} is forwarded to {}:{}".format(hostname, resolved_host, resolved_port))
-        response = forward_request(resolved_host, resolved_port, request)        
-    else:
-        response = (
-            "HTTP/1.1 404 Not Found\r\n"
-            "Content-Type: text/plain\r\n"
-            "Content-Length: 13\r\n"
-            "Connection: close\r\n"
-            "\r\n"
-            "404 Not Found"
-        ).encode('utf-8')
-    conn.sendall(response)
-    conn.close()
-
-def run_proxy(ip, port, routes):
+    :params router (Router): the proxy router.
+    :params ssl_context (ssl.SSLContext): context of a TLS listener, the
+                                          handshake then runs first.
+    """
+    if ssl_context is not None:
+        conn = accept_tls(conn, ssl_context, CLIENT_TIMEOUT)
+        if conn is None:
+            return
+    with router.use() as table:
+        handle_client(ip, port, conn, addr, table.routes, table.balancers,
+                      table.locations)
+
+
+def run_proxy(ip, port, routes, ssl_context=None):
     """
     Starts the proxy server and listens for incoming connections. 
 
@@ -203,16 +906,23 @@ def run_proxy(ip, port, routes):
 
     :params ip (str): IP address to bind the proxy server.
     :params port (int): port number to listen on.
-    :params routes (dict): dictionary mapping hostnames and location.
+    :params routes (dict or Router): dictionary mapping hostnames and
+                                     location, or a reloadable router.
+    :params ssl_context (ssl.SSLContext): terminates TLS on this listener
+                                          when given.
 
     """
 
     proxy = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    # The routing table and its balancers are compiled once and shared by
+    # every client thread; a reload swaps in a new table
+    router = routes if isinstance(routes, Router) else Router(routes)
 
     try:
         proxy.bind((ip, port))
         proxy.listen(50)
-        print("[Proxy] Listening on IP {} port {}".format(ip,port))
+        print("[Proxy] Listening on IP {} port {}{}".format(
+            ip, port, " (TLS)" if ssl_context is not None else ""))
         while True:
             conn, addr = proxy.accept()
             #
@@ -221,21 +931,28 @@ def run_proxy(ip, port, routes):
             #        provided handle_client routine
             #
             client_thread = threading.Thread(
-                target=handle_client,
-                args=(ip, port, conn, addr, routes)
+                target=serve_client,
+                args=(ip, port, conn, addr, router, ssl_context)
             )
             client_thread.daemon = True
             client_thread.start()
     except socket.error as e:
       print("Socket error: {}".format(e))
 
-def create_proxy(ip, port, routes):
+def create_proxy(ip, port, routes, tls_port=None, ssl_context=None):
     """
     Entry point for launching the proxy server.
 
     :params ip (str): IP address to bind the proxy server.
     :params port (int): port number to listen on.
-    :params routes (dict): dictionary mapping hostnames and location.
+    :params routes (dict or Router): dictionary mapping hostnames and
+                                     location, or a reloadable router.
+    :params tls_port (int): also listen for TLS clients on this port.
+    :params ssl_context (ssl.SSLContext): context of the TLS listener.
     """
 
-    run_proxy(ip, port, routes)
+    router = routes if isinstance(routes, Router) else Router(routes)
+    if tls_port and ssl_context is not None:
+        threading.Thread(target=run_proxy, args=(ip, tls_port, router, ssl_context),
+                         daemon=True).start()
+    run_proxy(ip, port, router)
@@ -0,0 +1,90 @@
+#
+# Copyright (C) 2025 pdnguyen of HCMC University of Technology VNU-HCM.
+# All rights reserved.
+# This file is part of the CO3093/CO3094 course.
+#
+# WeApRous release
+#
+# The authors hereby grant to Licensee personal permission to use
+# and modify the Licensed Source Code for the sole purpose of studying
+# while attending the course
+#
+
+"""
+daemon.proxylog
+~~~~~~~~~~~~~~~~~
+
+This module provides the log of the proxy, off its request path.
+
+A ``print`` is a synchronous write to stdout: each client thread waits
+for it, and on the asyncio engine every connection of the loop waits.
+:func:`log` only queues the line, a writer thread prints the queued
+lines in batches.
+
+Lines written for every request (the host, the backend picked, cache
+and coalescing hits) go through :func:`debug` and are dropped unless the
+proxy runs with ``--verbose``. Errors, retries and lifecycle events go
+through :func:`log` and are always written.
+
+Usage::
+
+  >>> log("[Proxy] Upstream {} failed: {}".format(target, error))
+  >>> debug("[Proxy] {} at Host: {}".format(addr, hostname))
+"""
+
+import queue
+import sys
+import threading
+
+#: Lines waiting for the writer thread.
+_lines = queue.SimpleQueue()
+_writer = None
+_writer_lock = threading.Lock()
+_verbose = False
+
+
+def configure(verbose=False):
+    """
+    Sets whether the per-request lines of :func:`debug` are written.
+
+    :params verbose (bool): write them.
+    """
+    global _verbose
+    _verbose = verbose
+
+
+def _write():
+    while True:
+        lines = [_lines.get()]
+        # Whatever queued up meanwhile goes in the same write
+        while True:
+            try:
+                lines.append(_lines.get_nowait())
+            except queue.Empty:
+                break
+        try:
+            sys.stdout.write("\n".join(lines) + "\n")
+            sys.stdout.flush()
+        except (OSError, ValueError):
+            pass
+
+
+def _ensure_writer():
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = threading.Thread(target=_write, name="proxylog", daemon=True)
+            _writer.start()
+
+
+def log(message):
+    """Queues a line for the writer thread, without waiting for stdout."""
+    if _writer is None:
+        _ensure_writer()
+    _lines.put(message)
+
+
+def debug(message):
+    """Queues a per-request line, only with ``--verbose``."""
+    if _verbose:
+        log(message)
@@ -0,0 +1,370 @@
+#
+# Copyright (C) 2025 pdnguyen of HCMC University of Technology VNU-HCM.
+# All rights reserved.
+# This file is part of the CO3093/CO3094 course.
+#
+# WeApRous release
+#
+# The authors hereby grant to Licensee personal permission to use
+# and modify the Licensed Source Code for the sole purpose of studying
+# while attending the course
+#
+
+"""
+daemon.ratelimit
+~~~~~~~~~~~~~~~~~
+
+This module provides the per-client limits of the proxy, configured per
+host (or location) block of ``proxy.conf``:
+
+- ``limit_req 10r/s burst=20;``: token bucket per client IP.
+- ``limit_req_session 5r/s burst=10;``: token bucket per ``session_id``
+  cookie.
+- ``limit_conn 20;``: concurrent connections per client IP.
+- ``proxy_max_conns 100;``: open connections per backend, tunnels
+  included. A saturated backend is skipped like a failed one, and the
+  client gets ``503 Service Unavailable`` when every backend is full.
+
+A request over a per-client limit is answered ``429 Too Many Requests``
+with a ``Retry-After`` header.
+
+A bucket left alone refills, and a full bucket is the same as no bucket.
+Each bucket is therefore dropped once it is full again. A timing wheel
+finds those buckets without scanning the table, so the table only holds
+the clients active in the last seconds, even with 100k distinct ones.
+
+Usage::
+
+  >>> wait = check_rate_limits(route_key, options, addr[0], headers)
+  >>> if wait:
+  ...     conn.sendall(too_many_requests(wait))
+"""
+
+import math
+import re
+import threading
+import time
+from functools import lru_cache
+
+#: Seconds per slot of the expiry wheel.
+WHEEL_TICK = 1.0
+
+#: Slots of the expiry wheel. Buckets due later are re-checked each turn.
+WHEEL_SLOTS = 64
+
+LIMIT_RE = re.compile(r'^\s*([\d.]+)\s*r/([sm])(?:\s+burst=(\d+))?\s*$')
+
+
+class Bucket:
+    """The token bucket of one client."""
+
+    __slots__ = ("tokens", "stamp")
+
+    def __init__(self, tokens, stamp):
+        self.tokens = tokens
+        self.stamp = stamp
+
+
+class TokenBucketTable:
+    """The :class:`TokenBucketTable <TokenBucketTable>` object, the token
+    buckets of every client of one limit, expired by a timing wheel.
+
+    :attrs rate (float): tokens added per second.
+    :attrs burst (float): bucket capacity.
+    :attrs rejected (int): requests refused.
+    :attrs expired (int): buckets dropped after refilling.
+    """
+
+    __attrs__ = [
+        "rate",
+        "burst",
+        "rejected",
+        "expired",
+    ]
+
+    def __init__(self, rate, burst, tick=WHEEL_TICK, slots=WHEEL_SLOTS):
+        """
+        :params rate (float): tokens added per second.
+        :params burst (float): bucket capacity.
+        :params tick (float): seconds per wheel slot.
+        :params slots (int): number of wheel slots.
+        """
+        self.rate = rate
+        self.burst = burst
+        self.rejected = 0
+        self.expired = 0
+        self.tick = tick
+        self._buckets = {}
+        self._wheel = [[] for _ in range(slots)]
+        self._cursor = None
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._buckets)
+
+    def take(self, key, now=None):
+        """
+        Takes one token from the bucket of ``key``.
+
+        :params key (hashable): the client.
+        :params now (float): current ``time.monotonic()``.
+
+        :rtype float: 0.0 if the request may go on, otherwise the seconds
+                      until the next token.
+        """
+        if now is None:
+            now = time.monotonic()
+        with self._lock:
+            self._advance(now)
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = Bucket(self.burst - 1.0, now)
+                self._buckets[key] = bucket
+                self._schedule(key, bucket)
+                return 0.0
+            bucket.tokens = min(self.burst,
+                                bucket.tokens + (now - bucket.stamp) * self.rate)
+            bucket.stamp = now
+            if bucket.tokens >= 1.0:
+                bucket.tokens -= 1.0
+                return 0.0
+            self.rejected += 1
+            return (1.0 - bucket.tokens) / self.rate
+
+    def _full_at(self, bucket):
+        return bucket.stamp + (self.burst - bucket.tokens) / self.rate
+
+    def _schedule(self, key, bucket):
+        # Buckets are only scheduled when created, and re-scheduled when
+        # their slot comes up too early, so a request costs no wheel work
+        tick = int(self._full_at(bucket) / self.tick) + 1
+        tick = min(max(tick, self._cursor + 1), self._cursor + len(self._wheel))
+        self._wheel[tick % len(self._wheel)].append(key)
+
+    def _advance(self, now):
+        current = int(now / self.tick)
+        if self._cursor is None:
+            self._cursor = current
+            return
+        steps = min(current - self._cursor, len(self._wheel))
+        self._cursor = current - steps
+        for _ in range(steps):
+            self._cursor += 1
+            slot = self._cursor % len(self._wheel)
+            keys, self._wheel[slot] = self._wheel[slot], []
+            for key in keys:
+                bucket = self._buckets.get(key)
+                if bucket is None:
+                    continue
+                if self._full_at(bucket) <= now:
+                    del self._buckets[key]
+                    self.expired += 1
+                else:
+                    self._schedule(key, bucket)
+
+    def stats(self):
+        """
+        Returns the table counters.
+
+        :rtype dict: live buckets, refused requests and expired buckets.
+        """
+        with self._lock:
+            return {
+                "buckets": len(self._buckets),
+                "rejected": self.rejected,
+                "expired": self.expired,
+            }
+
+
+class ConnectionLimiter:
+    """The :class:`ConnectionLimiter <ConnectionLimiter>` object, which
+    counts the open connections of every client. Clients without an open
+    connection are not stored.
+
+    :attrs rejected (int): connections refused.
+    """
+
+    __attrs__ = [
+        "rejected",
+    ]
+
+    def __init__(self):
+        self.rejected = 0
+        self._counts = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, key, limit):
+        """
+        Registers a connection of ``key`` unless it already has ``limit``.
+
+        :rtype bool: True if the connection may go on.
+        """
+        with self._lock:
+            count = self._counts.get(key, 0)
+            if count >= limit:
+                self.rejected += 1
+                return False
+            self._counts[key] = count + 1
+            return True
+
+    def release(self, key):
+        """Registers the end of a connection of ``key``."""
+        with self._lock:
+            count = self._counts.get(key, 1) - 1
+            if count > 0:
+                self._counts[key] = count
+            else:
+                self._counts.pop(key, None)
+
+    def stats(self):
+        """
+        Returns the limiter counters.
+
+        :rtype dict: clients with open connections and refused connections.
+        """
+        with self._lock:
+            return {
+                "clients": len(self._counts),
+                "rejected": self.rejected,
+            }
+
+
+#: Open connections per (route, client IP), shared by every host.
+CONNECTION_LIMITER = ConnectionLimiter()
+
+#: Open connections per backend address, shared by every host.
+UPSTREAM_LIMITER = ConnectionLimiter()
+
+#: Response sent when every backend of a route is at ``proxy_max_conns``.
+SERVICE_UNAVAILABLE = (
+    "HTTP/1.1 503 Service Unavailable\r\n"
+    "Content-Type: text/plain\r\n"
+    "Content-Length: 23\r\n"
+    "Retry-After: 1\r\n"
+    "Connection: close\r\n"
+    "\r\n"
+    "503 Service Unavailable"
+).encode('utf-8')
+
+_tables = {}
+_tables_lock = threading.Lock()
+
+
+@lru_cache(maxsize=256)
+def parse_limit(value):
+    """
+    Parses a ``limit_req`` value such as ``10r/s burst=20`` or ``30r/m``.
+
+    :rtype (float, float): rate per second and burst, or None if invalid.
+    """
+    match = LIMIT_RE.match(value or '')
+    if match is None:
+        return None
+    rate = float(match.group(1))
+    if match.group(2) == 'm':
+        rate /= 60.0
+    if rate <= 0:
+        return None
+    burst = float(match.group(3)) if match.group(3) else max(1.0, rate)
+    return rate, burst
+
+
+def bucket_table(route_key, kind, rate, burst):
+    """
+    Returns the bucket table of one limit of one route, updated to the
+    current rate and burst after a config reload.
+
+    :rtype TokenBucketTable: the table.
+    """
+    table = _tables.get((route_key, kind))
+    if table is None:
+        with _tables_lock:
+            table = _tables.get((route_key, kind))
+            if table is None:
+                table = TokenBucketTable(rate, burst)
+                _tables[(route_key, kind)] = table
+    if table.rate != rate or table.burst != burst:
+        table.rate, table.burst = rate, burst
+    return table
+
+
+def session_id(headers):
+    """Returns the ``session_id`` cookie of a request, or None."""
+    for pair in headers.get('cookie', '').split(';'):
+        key, _, value = pair.strip().partition('=')
+        if key == 'session_id' and value:
+            return value
+    return None
+
+
+def check_rate_limits(route_key, options, client_ip, headers):
+    """
+    Applies the ``limit_req`` and ``limit_req_session`` limits of a route.
+
+    :params route_key (str or tuple): route serving the request.
+    :params options (dict): directives of the route.
+    :params client_ip (str): the client address.
+    :params headers (dict): lower-cased request headers.
+
+    :rtype float: 0.0 if the request may go on, otherwise the seconds the
+                  client should wait.
+    """
+    limit = parse_limit(options.get('limit_req'))
+    if limit is not None:
+        wait = bucket_table(route_key, 'ip', *limit).take(client_ip)
+        if wait:
+            return wait
+    limit = parse_limit(options.get('limit_req_session'))
+    if limit is not None:
+        sid = session_id(headers)
+        if sid is not None:
+            return bucket_table(route_key, 'session', *limit).take(sid)
+    return 0.0
+
+
+def connection_limit(options, name='limit_conn'):
+    """Returns the ``limit_conn`` (or ``name``) of a route, or None."""
+    try:
+        return int(options[name])
+    except (KeyError, ValueError):
+        return None
+
+
+def upstream_limit(options):
+    """Returns the ``proxy_max_conns`` of a route, or None."""
+    return connection_limit(options, 'proxy_max_conns')
+
+
+def too_many_requests(retry_after):
+    """
+    Builds the ``429 Too Many Requests`` response.
+
+    :params retry_after (float): seconds the client should wait.
+
+    :rtype bytes: the raw HTTP response.
+    """
+    body = "429 Too Many Requests"
+    return (
+        "HTTP/1.1 429 Too Many Requests\r\n"
+        "Content-Type: text/plain\r\n"
+        "Content-Length: {}\r\n"
+        "Retry-After: {}\r\n"
+        "Connection: close\r\n"
+        "\r\n"
+        "{}"
+    ).format(len(body), max(1, int(math.ceil(retry_after))), body).encode('utf-8')
+
+
+def stats():
+    """
+    Returns the counters of every limit.
+
+    :rtype dict: per ``route/kind`` table stats and the connection limiters.
+    """
+    tables = dict(_tables)
+    return {
+        "buckets": {"{}/{}".format(key, kind): table.stats()
+                    for (key, kind), table in tables.items()},
+        "connections": CONNECTION_LIMITER.stats(),
+        "upstreams": UPSTREAM_LIMITER.stats(),
+    }
@@ -19,6 +19,7 @@ request settings (cookies, auth, proxies).
 """
 import base64
 import json
+from urllib.parse import parse_qsl
 from .dictionary import CaseInsensitiveDict
 from daemon.utils import get_auth_from_url
 
@@ -48,6 +49,7 @@ class Request():
         "body",
         "routes",
         "hook",
+        "query",
     ]
 
     def __init__(self):
@@ -59,6 +61,8 @@ class Request():
         self.headers = None
         #: HTTP path
         self.path = None        
+        #: query string parameters, name -> last value
+        self.query = {}
         # The cookies set used to create Cookie header
         self.cookies = None
         #: request body to send to the server.
@@ -73,12 +77,15 @@ class Request():
             lines = request.splitlines()
             first_line = lines[0]
             method, path, version = first_line.split()
+            # Routes and files are matched without the query string
+            path, _, query = path.partition('?')
 
             if path == '/':
                 path = '/index.html'
         except Exception:
             return None, None
 
+        self.query = dict(parse_qsl(query))
         return method, path, version
              
     def prepare_headers(self, header_data):
@@ -28,21 +28,36 @@ from .dictionary import CaseInsensitiveDict
 
 BASE_DIR = ""
 
+#: Cache-Control of the assets served from ``static/``, lets the proxy
+#: cache (and browsers) keep them instead of asking the backend again.
+STATIC_CACHE_CONTROL = "public, max-age=3600"
+
 STATUS_REASONS = {
     200: "OK",
     201: "Created",
     204: "No Content",
     301: "Moved Permanently",
     302: "Found",
+    304: "Not Modified",
     400: "Bad Request",
     401: "Unauthorized",
     403: "Forbidden",
     404: "Not Found",
+    413: "Payload Too Large",
     500: "Internal Server Error",
     502: "Bad Gateway",
     503: "Service Unavailable",
 }
-    
+
+
+class JSONBytes(bytes):
+    """A JSON body serialised ahead of time, e.g. cached for many readers.
+
+    A hook returning one (``return (200, JSONBytes(body))``) has it sent
+    as is with ``Content-Type: application/json``, without ``json.dumps``.
+    """
+    __slots__ = ()
+
 
 class Response():   
     """The :class:`Response <Response>` object, which contains a
@@ -358,8 +373,13 @@ class Response():
                 status_code = body_content
                 body_content = ''
 
+            # json, serialised already
+            if isinstance(body_content, JSONBytes):
+                body_bytes = body_content
+                self.headers['Content-Type'] = 'application/json'
+
             # json
-            if isinstance(body_content, (dict, list)):
+            elif isinstance(body_content, (dict, list)):
                 body_bytes = json.dumps(body_content)
                 self.headers['Content-Type'] = 'application/json'
             
@@ -380,12 +400,15 @@ class Response():
 
             if not isinstance(body_bytes, (str, bytes)):
                 body_bytes = str(body_bytes)
+            if isinstance(body_bytes, str):
+                body_bytes = body_bytes.encode('utf-8')
 
+            # Content-Length counts the encoded bytes
             self._content = body_bytes
             self.status_code = status_code
             self.reason = STATUS_REASONS.get(status_code, "Unknown Status")
             self._header = self.build_response_header(request)
-            return self._header + body_bytes.encode('utf-8')
+            return self._header + body_bytes
 
         path = request.path
         mime_type = self.get_mime_type(path)
@@ -429,6 +452,8 @@ class Response():
 
         self._content = content
         self.headers['Content-Length'] = str(content_length)
+        if self.status_code == 200 and base_dir == BASE_DIR+"static/":
+            self.headers['Cache-Control'] = STATIC_CACHE_CONTROL
         self._header = self.build_response_header(request)
         print(f"[Response] {self.status_code}-{self.reason}, Content-Length: {content_length}")
 
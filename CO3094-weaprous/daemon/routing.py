@@ -0,0 +1,341 @@
+#
+# Copyright (C) 2025 pdnguyen of HCMC University of Technology VNU-HCM.
+# All rights reserved.
+# This file is part of the CO3093/CO3094 course.
+#
+# WeApRous release
+#
+# The authors hereby grant to Licensee personal permission to use
+# and modify the Licensed Source Code for the sole purpose of studying
+# while attending the course
+#
+
+"""
+daemon.routing
+~~~~~~~~~~~~~~~~~
+
+This module provides the compiled routing table of the proxy and its hot
+reload.
+
+A :class:`RoutingTable <RoutingTable>` is built once from the parsed config
+(``parse_virtual_hosts``) with the balancer of every host pre-built, and is
+never modified afterwards. The :class:`Router <Router>` holds the current
+table in a single attribute: a reload compiles a new table and rebinds the
+attribute, which is atomic, so the per-request lookup takes no lock.
+
+The ``location`` blocks of a host are compiled into a
+:class:`LocationTrie <LocationTrie>`, so picking the location of a request
+walks its path once instead of testing every location.
+
+A client connection keeps the table it started with until it is done.
+Retired tables are watched until their last connection finished.
+
+Usage::
+
+  >>> router = Router(lambda: parse_virtual_hosts("config/proxy.conf"))
+  >>> with router.use() as table:
+  ...     route_key = locate_route(hostname, path, table.locations)
+  ...     resolve_routing_policy(route_key, table.routes, key, table.balancers)
+  >>> router.reload()
+"""
+
+import itertools
+import os
+import threading
+import time
+from contextlib import contextmanager
+from types import MappingProxyType
+
+from .balancer import create_balancer
+
+#: Seconds between two checks of the retired tables / watched config file.
+POLL_INTERVAL = 1.0
+
+
+def freeze_route(route):
+    """
+    Returns a read-only copy of a ``(proxy_map, policy, options)`` route.
+
+    :params route (tuple): route as returned by ``parse_virtual_hosts``.
+
+    :rtype tuple: the route with a copied backend list and read-only options.
+    """
+    proxy_map, policy = route[0], route[1]
+    options = route[2] if len(route) > 2 else {}
+    if isinstance(proxy_map, list):
+        proxy_map = list(proxy_map)
+    return (proxy_map, policy, MappingProxyType(dict(options)))
+
+
+def location_key(hostname, modifier, path):
+    """
+    Returns the key of a location route in :attr:`RoutingTable.routes`.
+
+    :rtype tuple: ``(hostname, "/prefix")`` or ``(hostname, "= /exact")``.
+    """
+    return (hostname, "{} {}".format(modifier, path).strip())
+
+
+class LocationTrie:
+    """The :class:`LocationTrie <LocationTrie>` object, the compiled
+    ``location`` blocks of one host.
+
+    Prefix locations live in a character trie: a lookup walks the request
+    path once and keeps the deepest location seen, which is the longest
+    matching prefix. Exact (``=``) locations are a plain dict, checked
+    first.
+    """
+
+    __attrs__ = [
+        "exact",
+    ]
+
+    def __init__(self):
+        self.exact = {}
+        self._root = {}
+
+    def add(self, path, value, exact=False):
+        """
+        Adds a location.
+
+        :params path (str): the location path.
+        :params value (object): returned by :meth:`match` for this location.
+        :params exact (bool): match ``path`` only instead of its prefixes.
+        """
+        if exact:
+            self.exact[path] = value
+            return
+        node = self._root
+        for char in path:
+            node = node.setdefault(char, {})
+        # None is never a path character, it marks the end of a location
+        node[None] = value
+
+    def match(self, path):
+        """
+        Returns the value of the location serving ``path``.
+
+        :params path (str): request path, without query string.
+
+        :rtype object: the value of the exact match, else of the longest
+                       matching prefix, else None.
+        """
+        value = self.exact.get(path)
+        if value is not None:
+            return value
+        node = self._root
+        best = node.get(None)
+        for char in path:
+            node = node.get(char)
+            if node is None:
+                break
+            best = node.get(None, best)
+        return best
+
+
+def locate_route(hostname, path, locations):
+    """
+    Returns the key of the route serving a request: the location route
+    matching ``path``, or the host route itself.
+
+    :params hostname (str): the request host.
+    :params path (str): the request target.
+    :params locations (dict): hostname -> :class:`LocationTrie <LocationTrie>`.
+
+    :rtype str or tuple: a key of :attr:`RoutingTable.routes`.
+    """
+    trie = locations.get(hostname) if locations else None
+    if trie is None:
+        return hostname
+    key = trie.match(path.split('?', 1)[0])
+    return hostname if key is None else key
+
+
+class RoutingTable:
+    """The :class:`RoutingTable <RoutingTable>` object, an immutable compiled
+    view of the proxy config.
+
+    :attrs version (int): reload generation of the table.
+    :attrs routes (mappingproxy): hostname -> (proxy_map, policy, options).
+    :attrs balancers (mappingproxy): route key -> :class:`Balancer <Balancer>`.
+    :attrs locations (mappingproxy): hostname -> :class:`LocationTrie
+                                     <LocationTrie>` of the hosts with
+                                     ``location`` blocks.
+
+    Location routes are stored in ``routes`` and ``balancers`` next to the
+    host routes, under the keys built by :func:`location_key`.
+    """
+
+    __attrs__ = [
+        "version",
+        "routes",
+        "balancers",
+        "locations",
+    ]
+
+    def __init__(self, routes, version=1, previous=None):
+        """
+        Compiles a routing table.
+
+        Balancers of the hosts whose backends and policy did not change are
+        taken over from ``previous``, so round-robin position, failure
+        cool-downs, latency samples and sticky session pins survive a reload.
+
+        :params routes (dict): hostname -> route, from ``parse_virtual_hosts``.
+                               A fourth route item lists the host's
+                               ``(modifier, path, route)`` locations.
+        :params version (int): reload generation.
+        :params previous (RoutingTable): the table being replaced, if any.
+        """
+        frozen = {}
+        locations = {}
+        for host, route in routes.items():
+            frozen[host] = freeze_route(route)
+            if len(route) > 3 and route[3]:
+                trie = LocationTrie()
+                for modifier, path, location_route in route[3]:
+                    key = location_key(host, modifier, path)
+                    frozen[key] = freeze_route(location_route)
+                    trie.add(path, key, exact=(modifier == '='))
+                locations[host] = trie
+
+        balancers = {}
+        for host, (proxy_map, policy, _) in frozen.items():
+            old = previous.balancers.get(host) if previous else None
+            new = create_balancer(proxy_map, policy)
+            if old is not None and old.policy == new.policy and old.targets == new.targets:
+                new = old
+            balancers[host] = new
+
+        self.version = version
+        self.routes = MappingProxyType(frozen)
+        self.balancers = MappingProxyType(balancers)
+        self.locations = MappingProxyType(locations)
+        # Connections in flight, tracked without a lock: next() on
+        # itertools.count and set add/discard are atomic.
+        self._tokens = itertools.count()
+        self._active = set()
+
+    def enter(self):
+        """
+        Registers one connection served by this table.
+
+        :rtype int: token to hand back to :meth:`leave`.
+        """
+        token = next(self._tokens)
+        self._active.add(token)
+        return token
+
+    def leave(self, token):
+        """Registers the end of a connection served by this table."""
+        self._active.discard(token)
+
+    @property
+    def inflight(self):
+        """Connections still served by this table."""
+        return len(self._active)
+
+
+class Router:
+    """The :class:`Router <Router>` object, which owns the current
+    :class:`RoutingTable <RoutingTable>` and swaps it on reload.
+
+    :attrs table (RoutingTable): the table new connections use.
+    """
+
+    __attrs__ = [
+        "table",
+        "loader",
+    ]
+
+    def __init__(self, routes_or_loader):
+        """
+        :params routes_or_loader (dict or callable): parsed routes, or a
+                                                     function re-parsing
+                                                     them for reloads.
+        """
+        if callable(routes_or_loader):
+            self.loader = routes_or_loader
+            routes = routes_or_loader()
+        else:
+            self.loader = None
+            routes = routes_or_loader
+        self.table = RoutingTable(routes)
+        self._retired = []
+        self._reload_lock = threading.Lock()
+        self._drainer = None
+
+    @contextmanager
+    def use(self):
+        """
+        Pins the current table for the duration of one connection.
+
+        :rtype RoutingTable: the current table.
+        """
+        table = self.table
+        token = table.enter()
+        try:
+            yield table
+        finally:
+            table.leave(token)
+
+    def reload(self):
+        """
+        Re-parses the config and atomically swaps in a new table. Errors
+        keep the current table.
+
+        :rtype bool: True if a new table is in place.
+        """
+        if self.loader is None:
+            return False
+        with self._reload_lock:
+            try:
+                routes = self.loader()
+            except Exception as e:
+                print("[Proxy] Reload failed, keeping routing table v{}: {}".format(
+                    self.table.version, e))
+                return False
+            old = self.table
+            self.table = RoutingTable(routes, old.version + 1, old)
+            self._retired.append(old)
+            print("[Proxy] Routing table v{} active ({} routes), v{} draining {} connection(s)".format(
+                self.table.version, len(self.table.routes), old.version, old.inflight))
+            if self._drainer is None:
+                self._drainer = threading.Thread(target=self._drain_loop, daemon=True)
+                self._drainer.start()
+        return True
+
+    def _drain_loop(self):
+        while True:
+            time.sleep(POLL_INTERVAL)
+            with self._reload_lock:
+                for table in list(self._retired):
+                    if table.inflight <= 0:
+                        print("[Proxy] Routing table v{} drained".format(table.version))
+                        self._retired.remove(table)
+
+    def watch(self, path, interval=POLL_INTERVAL):
+        """
+        Reloads the table whenever the modification time of ``path``
+        changes. Runs in a daemon thread.
+
+        :params path (str): the config file to watch.
+        :params interval (float): seconds between two checks.
+        """
+        def loop():
+            try:
+                last = os.stat(path).st_mtime
+            except OSError:
+                last = None
+            while True:
+                time.sleep(interval)
+                try:
+                    mtime = os.stat(path).st_mtime
+                except OSError:
+                    continue
+                if mtime != last:
+                    last = mtime
+                    print("[Proxy] {} changed, reloading".format(path))
+                    self.reload()
+
+        threading.Thread(target=loop, daemon=True).start()
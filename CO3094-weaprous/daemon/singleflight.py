@@ -0,0 +1,210 @@
+#
+# Copyright (C) 2025 pdnguyen of HCMC University of Technology VNU-HCM.
+# All rights reserved.
+# This file is part of the CO3093/CO3094 course.
+#
+# WeApRous release
+#
+# The authors hereby grant to Licensee personal permission to use
+# and modify the Licensed Source Code for the sole purpose of studying
+# while attending the course
+#
+
+"""
+daemon.singleflight
+~~~~~~~~~~~~~~~~~
+
+This module provides request coalescing ("single-flight") for the proxy.
+
+Concurrent identical requests share one upstream call: the first caller
+(the leader) runs it, the others wait and receive the very same response
+bytes. A short window keeps the finished result joinable, so callers
+arriving right after the answer share it too.
+
+Usage::
+
+  >>> flights = SingleFlight()
+  >>> response, shared = flights.do(("app1.local", "/channels/list"),
+  ...                               lambda: forward_request(host, port, request),
+  ...                               window=0.05)
+"""
+
+import asyncio
+import threading
+import time
+
+#: Finished calls kept in the table before a sweep of the expired ones.
+SWEEP_THRESHOLD = 1024
+
+
+class Call:
+    """One in-flight (or just finished) upstream call."""
+
+    __slots__ = ("event", "result", "error", "done_at")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+        self.done_at = None
+
+
+class SingleFlight:
+    """The :class:`SingleFlight <SingleFlight>` object, which collapses
+    concurrent calls sharing the same key into one.
+
+    :attrs leaders (int): calls which actually ran upstream.
+    :attrs collapsed (int): calls answered with a leader's result.
+    """
+
+    __attrs__ = [
+        "leaders",
+        "collapsed",
+    ]
+
+    def __init__(self):
+        self.leaders = 0
+        self.collapsed = 0
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, fn, window=0.0):
+        """
+        Runs ``fn`` once for all the concurrent callers of ``key``.
+
+        :params key (hashable): identity of the request.
+        :params fn (callable): the upstream call, run by the leader only.
+        :params window (float): seconds a finished result stays joinable.
+
+        :rtype (object, bool): the result of ``fn`` and whether it was shared
+                               from another caller.
+        """
+        now = time.monotonic()
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None and (call.done_at is None or now - call.done_at < window):
+                self.collapsed += 1
+                leader = False
+            else:
+                if len(self._calls) >= SWEEP_THRESHOLD:
+                    self._sweep(now, window)
+                call = Call()
+                self._calls[key] = call
+                self.leaders += 1
+                leader = True
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = fn()
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            call.done_at = time.monotonic()
+            call.event.set()
+            if window <= 0 or call.error is not None:
+                with self._lock:
+                    if self._calls.get(key) is call:
+                        del self._calls[key]
+        return call.result, False
+
+    def _sweep(self, now, window):
+        expired = [k for k, c in self._calls.items()
+                   if c.done_at is not None and now - c.done_at >= window]
+        for k in expired:
+            del self._calls[k]
+
+    def stats(self):
+        """
+        Returns the coalescing counters.
+
+        :rtype dict: leaders, collapsed requests and calls in the table.
+        """
+        with self._lock:
+            return {
+                "leaders": self.leaders,
+                "collapsed": self.collapsed,
+                "inflight": len(self._calls),
+            }
+
+
+class AsyncSingleFlight:
+    """The asyncio counterpart of :class:`SingleFlight <SingleFlight>`, used
+    by the asyncio proxy engine. Waiters await a future instead of blocking
+    a thread, so it must only be used from the event loop thread.
+    """
+
+    __attrs__ = [
+        "leaders",
+        "collapsed",
+    ]
+
+    def __init__(self):
+        self.leaders = 0
+        self.collapsed = 0
+        self._calls = {}
+
+    async def do(self, key, coro_fn, window=0.0):
+        """
+        Awaits ``coro_fn()`` once for all the concurrent callers of ``key``.
+
+        :params key (hashable): identity of the request.
+        :params coro_fn (callable): returns the upstream coroutine, run by
+                                    the leader only.
+        :params window (float): seconds a finished result stays joinable.
+
+        :rtype (object, bool): the result and whether it was shared.
+        """
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        entry = self._calls.get(key)
+        if entry is not None:
+            future, done_at = entry
+            if done_at is None or now - done_at < window:
+                self.collapsed += 1
+                return await asyncio.shield(future), True
+
+        future = loop.create_future()
+        self._calls[key] = (future, None)
+        self.leaders += 1
+        try:
+            result = await coro_fn()
+        except BaseException as e:
+            # Waiters must not hang on a failed or cancelled leader
+            if isinstance(e, Exception):
+                future.set_exception(e)
+                # Retrieve the exception so an unawaited future does not warn
+                future.exception()
+            else:
+                future.cancel()
+            self._calls.pop(key, None)
+            raise
+        future.set_result(result)
+        if window > 0:
+            self._calls[key] = (future, loop.time())
+            loop.call_later(window, self._expire, key, future)
+        else:
+            self._calls.pop(key, None)
+        return result, False
+
+    def _expire(self, key, future):
+        entry = self._calls.get(key)
+        if entry is not None and entry[0] is future:
+            del self._calls[key]
+
+    def stats(self):
+        """
+        Returns the coalescing counters.
+
+        :rtype dict: leaders, collapsed requests and calls in the table.
+        """
+        return {
+            "leaders": self.leaders,
+            "collapsed": self.collapsed,
+            "inflight": len(self._calls),
+        }
@@ -0,0 +1,147 @@
+#
+# Copyright (C) 2025 pdnguyen of HCMC University of Technology VNU-HCM.
+# All rights reserved.
+# This file is part of the CO3093/CO3094 course.
+#
+# WeApRous release
+#
+# The authors hereby grant to Licensee personal permission to use
+# and modify the Licensed Source Code for the sole purpose of studying
+# while attending the course
+#
+
+"""
+daemon.timeouts
+~~~~~~~~~~~~~~~~~
+
+This module provides the timeouts of the proxy, configured per host (or
+location) block of ``proxy.conf``:
+
+- ``proxy_connect_timeout 2s;``: connecting to one backend.
+- ``proxy_first_byte_timeout 10s;``: waiting for the first response byte.
+- ``proxy_timeout 30s;``: the whole request, retries included.
+
+The total timeout is a :class:`Deadline <Deadline>` started when the client
+connection is accepted. Every upstream wait is capped by what is left of
+it. The remaining budget is sent to the backend in the ``X-Timeout-Budget-Ms``
+header. A client may send that header too, and the smaller budget wins.
+When the budget runs out the client gets the precomputed
+:data:`GATEWAY_TIMEOUT` response.
+
+Usage::
+
+  >>> deadline = Deadline(total_timeout(options, headers))
+  >>> sock.settimeout(deadline.cap(first_byte_timeout(options)))
+"""
+
+import time
+
+from .failover import DeadlineExceeded
+from .utils import parse_duration
+
+#: Seconds a backend has to send its first byte, unless configured.
+DEFAULT_FIRST_BYTE_TIMEOUT = 30.0
+
+#: Seconds a whole request may take, unless configured.
+DEFAULT_TOTAL_TIMEOUT = 60.0
+
+#: Header carrying the remaining budget to the backend, in milliseconds.
+BUDGET_HEADER = "X-Timeout-Budget-Ms"
+
+_BUDGET_PREFIX = BUDGET_HEADER.lower().encode('latin-1') + b":"
+
+#: Response sent when the budget of a request ran out.
+GATEWAY_TIMEOUT = (
+    "HTTP/1.1 504 Gateway Timeout\r\n"
+    "Content-Type: text/plain\r\n"
+    "Content-Length: 19\r\n"
+    "Connection: close\r\n"
+    "\r\n"
+    "504 Gateway Timeout"
+).encode('utf-8')
+
+
+class Deadline:
+    """The :class:`Deadline <Deadline>` object, the end-to-end timeout
+    budget of one request.
+
+    :attrs expires_at (float): ``time.monotonic()`` of the deadline.
+    """
+
+    __slots__ = ("expires_at",)
+
+    def __init__(self, budget, start=None):
+        """
+        :params budget (float): seconds the request may take.
+        :params start (float): ``time.monotonic()`` the budget starts at,
+                               now by default.
+        """
+        self.expires_at = (time.monotonic() if start is None else start) + budget
+
+    def remaining(self):
+        """Returns the seconds left, negative once expired."""
+        return self.expires_at - time.monotonic()
+
+    def expired(self):
+        """Tells whether the budget ran out."""
+        return self.remaining() <= 0
+
+    def cap(self, timeout, sent=False):
+        """
+        Caps a timeout to the remaining budget.
+
+        :params timeout (float): the timeout of one wait, None for none.
+        :params sent (bool): whether the request may already be upstream.
+
+        :rtype float: the seconds to wait.
+
+        :raise DeadlineExceeded: when nothing is left.
+        """
+        remaining = self.remaining()
+        if remaining <= 0:
+            raise DeadlineExceeded("timeout budget exhausted", sent)
+        return remaining if timeout is None else min(timeout, remaining)
+
+
+def first_byte_timeout(options):
+    """Returns the ``proxy_first_byte_timeout`` of a route in seconds."""
+    return parse_duration(options.get('proxy_first_byte_timeout'),
+                          DEFAULT_FIRST_BYTE_TIMEOUT)
+
+
+def total_timeout(options, headers=None):
+    """
+    Returns the budget of a request: the ``proxy_timeout`` of its route,
+    lowered by the ``X-Timeout-Budget-Ms`` the client sent, if any.
+
+    :params options (dict): directives of the route.
+    :params headers (dict): lower-cased request headers.
+
+    :rtype float: seconds.
+    """
+    budget = parse_duration(options.get('proxy_timeout'), DEFAULT_TOTAL_TIMEOUT)
+    client = (headers or {}).get(BUDGET_HEADER.lower())
+    if client:
+        try:
+            budget = min(budget, max(0.0, int(client) / 1000.0))
+        except ValueError:
+            pass
+    return budget
+
+
+def with_budget_header(request, remaining):
+    """
+    Sets the ``X-Timeout-Budget-Ms`` header of a raw request, replacing the
+    one the client sent.
+
+    :params request (bytes): raw HTTP request.
+    :params remaining (float): seconds left.
+
+    :rtype bytes: the request with the header.
+    """
+    head, sep, body = request.partition(b"\r\n\r\n")
+    lines = [line for line in head.split(b"\r\n")
+             if not line.lower().startswith(_BUDGET_PREFIX)]
+    lines.insert(1, "{}: {}".format(
+        BUDGET_HEADER, max(0, int(remaining * 1000))).encode('latin-1'))
+    return b"\r\n".join(lines) + sep + body
@@ -0,0 +1,159 @@
+#
+# Copyright (C) 2025 pdnguyen of HCMC University of Technology VNU-HCM.
+# All rights reserved.
+# This file is part of the CO3093/CO3094 course.
+#
+# WeApRous release
+#
+# The authors hereby grant to Licensee personal permission to use
+# and modify the Licensed Source Code for the sole purpose of studying
+# while attending the course
+#
+
+"""
+daemon.tls
+~~~~~~~~~~~~~~~~~
+
+This module provides TLS termination for the proxy listeners
+(``start_proxy.py --tls-port 8443 --tls-cert cert.pem --tls-key key.pem``).
+
+The certificate is loaded once into a single :class:`ssl.SSLContext`
+shared by every client connection of both engines. Sharing the context
+also shares its session cache and ticket keys, so a returning client
+resumes its session (TLS 1.3 tickets, TLS 1.2 tickets or session IDs)
+with an abbreviated handshake instead of a full key exchange and
+certificate check.
+
+The threaded engine runs the handshake in the client thread, bounded by
+the client timeout, so a slow or silent client never blocks ``accept``.
+The asyncio engine hands the context to ``asyncio.start_server``.
+
+Every handshake is counted in ``proxy_tls_handshakes_total{mode}``
+(``full``, ``resumed`` or ``failed``), and the session cache counters of
+the context are served as ``proxy_tls_sessions``.
+
+Usage::
+
+  >>> context = create_server_context("cert.pem", "key.pem")
+  >>> create_proxy(ip, 8080, router, tls_port=8443, ssl_context=context)
+"""
+
+import os
+import socket
+import ssl
+import subprocess
+
+from .metrics import TLS_HANDSHAKES, inc, stats_family
+from .proxylog import log
+
+#: Session tickets sent to a TLS 1.3 client after a handshake.
+TLS13_TICKETS = 2
+
+
+def create_server_context(certfile, keyfile, tickets=TLS13_TICKETS):
+    """
+    Builds the server :class:`ssl.SSLContext` shared by all the TLS
+    connections of the proxy.
+
+    :params certfile (str): PEM certificate chain.
+    :params keyfile (str): PEM private key.
+    :params tickets (int): TLS 1.3 session tickets per handshake, 0
+                           disables resumption.
+
+    :rtype ssl.SSLContext: the context.
+
+    :raise ssl.SSLError, OSError: when the certificate cannot be loaded.
+    """
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    context.minimum_version = ssl.TLSVersion.TLSv1_2
+    context.load_cert_chain(certfile, keyfile)
+    context.set_alpn_protocols(["http/1.1"])
+    # Forward secret suites only, ECDHE first
+    context.set_ciphers("ECDHE+AESGCM:ECDHE+CHACHA20:DHE+AESGCM:!aNULL:!MD5")
+    if tickets:
+        context.options &= ~ssl.OP_NO_TICKET
+        context.num_tickets = tickets
+    else:
+        context.options |= ssl.OP_NO_TICKET
+        context.num_tickets = 0
+    # Renegotiation only costs CPU for a proxy
+    context.options |= getattr(ssl, 'OP_NO_RENEGOTIATION', 0)
+    return context
+
+
+def accept_tls(conn, context, timeout):
+    """
+    Runs the server side handshake on an accepted client socket.
+
+    :params conn (socket.socket): the accepted plaintext socket.
+    :params context (ssl.SSLContext): the shared context.
+    :params timeout (float): seconds the client has to finish it.
+
+    :rtype ssl.SSLSocket: the TLS socket, or None when the handshake
+                          failed (the socket is then closed).
+    """
+    conn.settimeout(timeout)
+    # Handshake flights, tickets and the response are small separate
+    # writes, Nagle would hold them for the delayed ACK of the client
+    # (asyncio transports set it already)
+    conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    try:
+        tls = context.wrap_socket(conn, server_side=True,
+                                  do_handshake_on_connect=False)
+        tls.do_handshake()
+    except (ssl.SSLError, socket.error) as e:
+        log("[Proxy] TLS handshake failed: {}".format(e))
+        inc(TLS_HANDSHAKES, ("failed",))
+        conn.close()
+        return None
+    record_handshake(tls)
+    return tls
+
+
+def record_handshake(ssl_object):
+    """
+    Counts one finished handshake.
+
+    :params ssl_object (ssl.SSLSocket or ssl.SSLObject): the connection.
+    """
+    inc(TLS_HANDSHAKES, ("resumed" if ssl_object.session_reused else "full",))
+
+
+def session_collector(context):
+    """
+    Returns the metrics collector of the session cache of ``context``:
+    ``accept_good`` handshakes, resumption ``hits``, ``misses``,
+    ``timeouts`` and the rest of OpenSSL's session statistics.
+    """
+    def collect():
+        return [stats_family("proxy_tls_sessions", "gauge",
+                             "TLS session cache counters.", context.session_stats())]
+
+    return collect
+
+
+def generate_self_signed(certfile, keyfile, common_name="localhost", days=365,
+                         key_type="ec"):
+    """
+    Generates a self-signed certificate for tests and benchmarks, with the
+    ``openssl`` command line tool.
+
+    :params certfile (str): where to write the PEM certificate.
+    :params keyfile (str): where to write the PEM private key.
+    :params common_name (str): certificate subject, also a DNS name.
+    :params days (int): validity.
+    :params key_type (str): ``ec`` (ECDSA P-256) or ``rsa`` (RSA 2048).
+
+    :raise OSError, subprocess.CalledProcessError: when openssl fails.
+    """
+    if key_type == "rsa":
+        key = ["-newkey", "rsa:2048"]
+    else:
+        key = ["-newkey", "ec", "-pkeyopt", "ec_paramgen_curve:prime256v1"]
+    subprocess.run(
+        ["openssl", "req", "-x509", "-nodes"] + key +
+        ["-keyout", keyfile, "-out", certfile, "-days", str(days),
+         "-subj", "/CN={}".format(common_name),
+         "-addext", "subjectAltName=DNS:{},IP:127.0.0.1".format(common_name)],
+        check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    os.chmod(keyfile, 0o600)
@@ -0,0 +1,333 @@
+#
+# Copyright (C) 2025 pdnguyen of HCMC University of Technology VNU-HCM.
+# All rights reserved.
+# This file is part of the CO3093/CO3094 course.
+#
+# WeApRous release
+#
+# The authors hereby grant to Licensee personal permission to use
+# and modify the Licensed Source Code for the sole purpose of studying
+# while attending the course
+#
+
+"""
+daemon.tracing
+~~~~~~~~~~~~~~~~~
+
+This module provides the request tracing shared by the proxy and the
+backend.
+
+Every request carries an ``X-Request-ID``: the proxy keeps the one the
+client sent or assigns one, forwards it to the backend with the client
+address appended to ``X-Forwarded-For``, and both hops echo it in the
+response. One ID therefore finds a request in the logs of every hop.
+
+A sampled request also times its steps as the spans of a
+:class:`Trace <Trace>`:
+
+- proxy: ``accept`` (reading the request), ``parse``, ``route``,
+  ``connect`` and ``upstream`` (waiting for the backend), ``send``;
+- backend: ``accept``, ``parse``, ``handler``, ``serialise``, ``send``.
+
+The spans are returned in a ``Server-Timing`` header (``send`` excepted,
+it ends after the header is written) and, with a trace log configured,
+appended to it as one JSON line per request.
+
+The proxy decides the sampling (``proxy_trace_sample 0.05;`` per host, or
+``--trace-sample``) and passes the decision on in ``X-Trace-Sampled``, so
+the backend traces the same requests. An unsampled request only costs its
+ID.
+
+Usage::
+
+  >>> trace = Trace(request_id(headers), "proxy", TRACER.sample(rate), start)
+  >>> trace.lap("parse")
+  >>> conn.sendall(trace.stamp(response))
+  >>> TRACER.write(trace, method=method, path=path)
+"""
+
+import contextvars
+import json
+import random
+import re
+import threading
+import time
+import uuid
+
+REQUEST_ID_HEADER = "X-Request-ID"
+FORWARDED_FOR_HEADER = "X-Forwarded-For"
+SAMPLED_HEADER = "X-Trace-Sampled"
+
+#: Request IDs accepted from clients, anything else is replaced.
+REQUEST_ID_RE = re.compile(r'^[\w.:@/+=-]{1,128}$')
+
+_REPLACED = tuple(name.lower() + ":" for name in (REQUEST_ID_HEADER, SAMPLED_HEADER))
+_FORWARDED_PREFIX = FORWARDED_FOR_HEADER.lower() + ":"
+_ECHOED_ID = "\r\n{}:".format(REQUEST_ID_HEADER.lower()).encode('latin-1')
+
+#: Trace of the request handled by the current thread or task.
+_current = contextvars.ContextVar("trace", default=None)
+
+
+class Trace:
+    """The :class:`Trace <Trace>` object, the ID and the span timings of
+    one request on one hop.
+
+    :attrs request_id (str): the ``X-Request-ID``.
+    :attrs service (str): the hop, ``proxy`` or ``backend``.
+    :attrs sampled (bool): whether spans are recorded.
+    :attrs spans (dict): span name -> seconds, in recording order.
+    """
+
+    __attrs__ = [
+        "request_id",
+        "service",
+        "sampled",
+        "spans",
+    ]
+
+    def __init__(self, request_id, service, sampled, start=None):
+        """
+        :params request_id (str): the ``X-Request-ID``.
+        :params service (str): the hop, ``proxy`` or ``backend``.
+        :params sampled (bool): whether spans are recorded.
+        :params start (float): ``time.monotonic()`` of the accept, now by
+                               default.
+        """
+        self.request_id = request_id
+        self.service = service
+        self.sampled = sampled
+        self.spans = {}
+        self.start = time.monotonic() if start is None else start
+        self._last = self.start
+
+    def add(self, name, seconds):
+        """Adds ``seconds`` to a span, e.g. one connect per retry."""
+        if self.sampled:
+            self.spans[name] = self.spans.get(name, 0.0) + seconds
+
+    def lap(self, name):
+        """Records the time since the previous lap (or the accept) as a span."""
+        if self.sampled:
+            now = time.monotonic()
+            self.add(name, now - self._last)
+            self._last = now
+
+    def skip(self):
+        """Starts the next lap now, the time since the last one was recorded
+        by :meth:`add` (upstream spans)."""
+        self._last = time.monotonic()
+
+    def total(self):
+        """Returns the seconds since the accept."""
+        return time.monotonic() - self.start
+
+    def server_timing(self):
+        """
+        Returns the ``Server-Timing`` value of the spans recorded so far.
+
+        :rtype str: e.g. ``proxy-parse;dur=0.12, proxy-total;dur=3.40``.
+        """
+        entries = ["{}-{};dur={:.2f}".format(self.service, name, seconds * 1000)
+                   for name, seconds in self.spans.items()]
+        entries.append("{}-total;dur={:.2f}".format(self.service, self.total() * 1000))
+        return ", ".join(entries)
+
+    def stamp(self, response):
+        """
+        Sets the ``X-Request-ID``, and adds ``Server-Timing`` when sampled,
+        of a raw response.
+
+        :params response (bytes): raw HTTP response.
+
+        :rtype bytes: the response with the headers.
+        """
+        end = response.find(b"\r\n\r\n")
+        if end > 0 and _ECHOED_ID in response[:end].lower():
+            # The ID echoed by the backend, which for a cached or coalesced
+            # response belongs to another request
+            lines = [line for line in response[:end].split(b"\r\n")
+                     if not line.lower().startswith(_ECHOED_ID[2:])]
+            response = b"\r\n".join(lines) + response[end:]
+        headers = [(REQUEST_ID_HEADER, self.request_id)]
+        if self.sampled:
+            headers.append(("Server-Timing", self.server_timing()))
+        return add_response_headers(response, headers)
+
+
+class Tracer:
+    """The :class:`Tracer <Tracer>` object, the sampling rate and the JSON
+    trace log of one process.
+
+    :attrs sample_rate (float): share of the requests traced, 0 to 1.
+    :attrs log_path (str): JSON lines trace log, None for none.
+    """
+
+    __attrs__ = [
+        "sample_rate",
+        "log_path",
+    ]
+
+    def __init__(self, sample_rate=0.0, log_path=None):
+        self.sample_rate = sample_rate
+        self.log_path = None
+        self._log = None
+        self._lock = threading.Lock()
+        self.configure(sample_rate, log_path)
+
+    def configure(self, sample_rate=None, log_path=None):
+        """
+        Sets the sampling rate and opens the trace log.
+
+        :params sample_rate (float): share of the requests traced.
+        :params log_path (str): JSON lines file traces are appended to.
+        """
+        if sample_rate is not None:
+            self.sample_rate = min(1.0, max(0.0, sample_rate))
+        if log_path:
+            with self._lock:
+                if self._log is not None:
+                    self._log.close()
+                self._log = open(log_path, "a", buffering=1, encoding="utf-8")
+                self.log_path = log_path
+
+    def sample(self, rate=None):
+        """
+        Draws the sampling decision of a new request.
+
+        :params rate (float): rate of the route, the process rate if None.
+
+        :rtype bool: True if the request is traced.
+        """
+        rate = self.sample_rate if rate is None else rate
+        return rate >= 1.0 or (rate > 0.0 and random.random() < rate)
+
+    def sampled(self, headers):
+        """
+        Returns the sampling decision of a request forwarded by the proxy,
+        or draws one when it carries none.
+
+        :params headers (dict): lower-cased request headers.
+        """
+        flag = headers.get(SAMPLED_HEADER.lower())
+        if flag in ("0", "1"):
+            return flag == "1"
+        return self.sample()
+
+    def write(self, trace, **fields):
+        """
+        Appends a sampled trace to the trace log.
+
+        :params trace (Trace): the finished trace.
+        :params fields: request details, e.g. method, path, status.
+        """
+        if not trace.sampled or self._log is None:
+            return
+        record = {
+            "time": round(time.time(), 3),
+            "service": trace.service,
+            "request_id": trace.request_id,
+        }
+        record.update(fields)
+        record["spans_ms"] = {name: round(seconds * 1000, 3)
+                              for name, seconds in trace.spans.items()}
+        record["total_ms"] = round(trace.total() * 1000, 3)
+        line = json.dumps(record, default=str) + "\n"
+        with self._lock:
+            if self._log is not None:
+                self._log.write(line)
+
+
+#: Tracer of the process, configured by the ``start_*`` scripts.
+TRACER = Tracer()
+
+
+def request_id(headers):
+    """
+    Returns the ``X-Request-ID`` of a request, or a new one when it has
+    none or an invalid one.
+
+    :params headers (dict): lower-cased request headers.
+
+    :rtype str: the request ID.
+    """
+    value = headers.get(REQUEST_ID_HEADER.lower(), "").strip()
+    if value and REQUEST_ID_RE.match(value):
+        return value
+    return uuid.uuid4().hex
+
+
+def trace_sample_rate(options):
+    """Returns the ``proxy_trace_sample`` of a route, or None."""
+    try:
+        return float(options['proxy_trace_sample'])
+    except (KeyError, ValueError):
+        return None
+
+
+def with_forwarded_headers(request, trace, client_ip):
+    """
+    Sets the ``X-Request-ID``, ``X-Trace-Sampled`` and ``X-Forwarded-For``
+    headers of a raw request before it goes upstream.
+
+    :params request (str): raw HTTP request.
+    :params trace (Trace): trace of the request.
+    :params client_ip (str): address of the client.
+
+    :rtype str: the request with the headers.
+    """
+    head, sep, body = request.partition("\r\n\r\n")
+    lines = head.split("\r\n")
+    forwarded = client_ip
+    kept = lines[:1]
+    for line in lines[1:]:
+        lower = line.lower()
+        if lower.startswith(_REPLACED):
+            continue
+        if lower.startswith(_FORWARDED_PREFIX):
+            forwarded = "{}, {}".format(line.split(":", 1)[1].strip(), client_ip)
+            continue
+        kept.append(line)
+    kept[1:1] = [
+        "{}: {}".format(REQUEST_ID_HEADER, trace.request_id),
+        "{}: {}".format(SAMPLED_HEADER, 1 if trace.sampled else 0),
+        "{}: {}".format(FORWARDED_FOR_HEADER, forwarded),
+    ]
+    return "\r\n".join(kept) + sep + body
+
+
+def add_response_headers(response, headers):
+    """
+    Inserts headers after the status line of a raw HTTP response.
+
+    :params response (bytes): raw HTTP response.
+    :params headers (list): ``(name, value)`` pairs.
+
+    :rtype bytes: the response, unchanged if it is not HTTP.
+    """
+    line_end = response.find(b"\r\n")
+    if line_end < 0 or not response.startswith(b"HTTP/"):
+        return response
+    extra = "".join("\r\n{}: {}".format(name, value) for name, value in headers)
+    return response[:line_end] + extra.encode('latin-1') + response[line_end:]
+
+
+def activate(trace):
+    """
+    Makes ``trace`` the trace of the current thread or task.
+
+    :rtype contextvars.Token: token to hand back to :func:`deactivate`.
+    """
+    return _current.set(trace)
+
+
+def deactivate(token):
+    """Restores the trace active before :func:`activate`."""
+    _current.reset(token)
+
+
+def add_span(name, seconds):
+    """Adds a span to the trace of the current thread or task, if any."""
+    trace = _current.get()
+    if trace is not None:
+        trace.add(name, seconds)
@@ -0,0 +1,345 @@
+#
+# Copyright (C) 2025 pdnguyen of HCMC University of Technology VNU-HCM.
+# All rights reserved.
+# This file is part of the CO3093/CO3094 course.
+#
+# WeApRous release
+#
+# The authors hereby grant to Licensee personal permission to use
+# and modify the Licensed Source Code for the sole purpose of studying
+# while attending the course
+#
+
+"""
+daemon.tunnel
+~~~~~~~~~~~~~~~~~
+
+This module provides the byte tunnels of the proxy, for the exchanges that
+are not one request and one response.
+
+A request asking to switch protocols (``Connection: Upgrade``, e.g. a
+WebSocket) or for an event stream (``Accept: text/event-stream``) is not
+buffered: the proxy connects to a backend, sends the request and copies
+bytes both ways until the backend is done or nothing moved for
+``proxy_tunnel_idle_timeout`` (5 minutes unless configured).
+
+Each direction holds at most one buffer of :data:`TUNNEL_BUFFER` bytes. The
+proxy stops reading from one side while the other side does not take the
+data, so a slow reader pushes back on the writer instead of growing the
+proxy memory.
+
+A tunnel holds its backend connection for its whole life, and it counts in
+the ``proxy_max_conns`` of that backend like any upstream connection.
+
+Usage::
+
+  >>> if is_tunnel_request(headers):
+  ...     target, sent, received, status = tunnel(conn, payload, balancer,
+  ...                                             target, options)
+"""
+
+import asyncio
+import selectors
+import socket
+import time
+
+from .failover import (
+    UpstreamBusy,
+    UpstreamError,
+    connect_upstream,
+    failover_plan,
+    open_upstream_connection,
+    split_target,
+)
+from .metrics import TUNNELS_OPEN, UPSTREAM_ACTIVE, UPSTREAM_CONNECT, inc, observe
+from .proxylog import debug, log
+from .ratelimit import UPSTREAM_LIMITER, upstream_limit
+from .utils import parse_duration
+
+#: Bytes read from one side before writing them to the other.
+TUNNEL_BUFFER = 64 * 1024
+
+#: Seconds a tunnel may stay silent in both directions, unless configured.
+DEFAULT_TUNNEL_IDLE_TIMEOUT = 300.0
+
+
+def is_tunnel_request(headers):
+    """
+    Tells whether a request opens a long-lived stream instead of waiting
+    for one buffered response.
+
+    :params headers (dict): lower-cased request headers.
+
+    :rtype bool: True for protocol upgrades and event streams.
+    """
+    connection = [token.strip().lower()
+                  for token in headers.get('connection', '').split(',')]
+    if 'upgrade' in connection and headers.get('upgrade'):
+        return True
+    return 'text/event-stream' in headers.get('accept', '')
+
+
+def tunnel_idle_timeout(options):
+    """Returns the ``proxy_tunnel_idle_timeout`` of a route in seconds."""
+    return parse_duration(options.get('proxy_tunnel_idle_timeout'),
+                          DEFAULT_TUNNEL_IDLE_TIMEOUT)
+
+
+def _reserve(targets, limit):
+    """Yields the backends of ``targets`` holding a ``proxy_max_conns`` slot."""
+    for target in targets:
+        if limit is not None and not UPSTREAM_LIMITER.acquire(target, limit):
+            log("[Proxy] Upstream {} is at proxy_max_conns".format(target))
+            continue
+        yield target
+
+
+def _release(target, limit):
+    if limit is not None:
+        UPSTREAM_LIMITER.release(target)
+
+
+def open_tunnel(balancer, first, options):
+    """
+    Connects to ``first``, or to the next healthy backend when it cannot be
+    reached. Nothing was sent yet, so every backend of the route may be
+    tried.
+
+    :params balancer (Balancer): balancer of the route.
+    :params first (str): backend chosen by the routing policy.
+    :params options (dict): directives of the route.
+
+    :rtype (str, socket.socket): the backend and the connected socket.
+
+    :raise UpstreamError: when no backend could be reached,
+                          :class:`UpstreamBusy` when all were full.
+    """
+    targets, _, _, connect_timeout = failover_plan(balancer, first, 'GET', options)
+    limit = upstream_limit(options)
+    error = UpstreamBusy("every upstream is at proxy_max_conns")
+    for target in _reserve(targets, limit):
+        host, port = split_target(target)
+        started = time.monotonic()
+        try:
+            backend = connect_upstream(host, port, connect_timeout)
+        except socket.error as e:
+            _release(target, limit)
+            log("[Proxy] Upstream {} failed: {}".format(target, e))
+            balancer.mark_failed(target)
+            error = UpstreamError("connect to {} failed: {}".format(target, e),
+                                  timed_out=isinstance(e, socket.timeout))
+            continue
+        observe(UPSTREAM_CONNECT, (target,), time.monotonic() - started)
+        return target, backend
+    raise error
+
+
+def splice(conn, backend, idle_timeout, buffer_size=TUNNEL_BUFFER):
+    """
+    Copies bytes between two sockets until the backend closes or the
+    tunnel is idle. The end of the client data is passed on with a
+    half-close, and the answers keep coming.
+
+    :params conn (socket.socket): the client.
+    :params backend (socket.socket): the backend.
+    :params idle_timeout (float): seconds without traffic before closing.
+    :params buffer_size (int): bytes moved per read.
+
+    :rtype (int, int, bytes): bytes sent upstream, bytes sent to the client
+                              and the status code of the backend answer.
+    """
+    moved = {conn: 0, backend: 0}
+    status = b""
+    selector = selectors.DefaultSelector()
+    selector.register(conn, selectors.EVENT_READ, backend)
+    selector.register(backend, selectors.EVENT_READ, conn)
+    # A peer which does not read for idle_timeout fails the write
+    conn.settimeout(idle_timeout)
+    backend.settimeout(idle_timeout)
+    try:
+        while selector.get_map():
+            ready = selector.select(idle_timeout)
+            if not ready:
+                debug("[Proxy] Tunnel idle for {}s, closing".format(idle_timeout))
+                break
+            for key, _ in ready:
+                source, sink = key.fileobj, key.data
+                data = source.recv(buffer_size)
+                # A TLS client may hold decrypted bytes the selector
+                # cannot see, they are read now or never
+                pending = getattr(source, 'pending', None)
+                while data and pending is not None and pending():
+                    data += source.recv(pending())
+                if not data:
+                    if source is backend:
+                        # Nothing more can answer the client
+                        return moved[conn], moved[backend], status
+                    selector.unregister(source)
+                    try:
+                        sink.shutdown(socket.SHUT_WR)
+                    except socket.error:
+                        pass
+                    continue
+                if source is backend and not status:
+                    status = data[9:12]
+                # Blocks until the peer took it: one buffer per direction
+                sink.sendall(data)
+                moved[source] += len(data)
+    except socket.error as e:
+        debug("[Proxy] Tunnel closed: {}".format(e))
+    finally:
+        selector.close()
+    return moved[conn], moved[backend], status
+
+
+def tunnel(conn, request, balancer, first, options):
+    """
+    Opens a tunnel between a client and a backend and relays it until it
+    ends.
+
+    :params conn (socket.socket): the client.
+    :params request (bytes): raw HTTP request already read from the client.
+    :params balancer (Balancer): balancer of the route.
+    :params first (str): backend chosen by the routing policy.
+    :params options (dict): directives of the route.
+
+    :rtype (str, int, int, bytes): the backend, bytes sent upstream, bytes
+                                   sent to the client and the status code
+                                   of the backend answer.
+
+    :raise UpstreamError: when the tunnel could not be opened.
+    """
+    target, backend = open_tunnel(balancer, first, options)
+    upstream = (target,)
+    inc(UPSTREAM_ACTIVE, upstream)
+    inc(TUNNELS_OPEN, upstream)
+    debug("[Proxy] Tunnel to {} opened".format(target))
+    try:
+        backend.settimeout(None)
+        backend.sendall(request)
+        sent, received, status = splice(conn, backend, tunnel_idle_timeout(options))
+        return target, len(request) + sent, received, status
+    except socket.error as e:
+        raise UpstreamError("tunnel to {} failed: {}".format(target, e), sent=True)
+    finally:
+        backend.close()
+        inc(UPSTREAM_ACTIVE, upstream, -1)
+        inc(TUNNELS_OPEN, upstream, -1)
+        _release(target, upstream_limit(options))
+
+
+async def open_tunnel_async(balancer, first, options):
+    """
+    Coroutine counterpart of :func:`open_tunnel`.
+
+    :rtype (str, asyncio.StreamReader, asyncio.StreamWriter): the backend
+                                                              and its streams.
+    """
+    targets, _, _, connect_timeout = failover_plan(balancer, first, 'GET', options)
+    limit = upstream_limit(options)
+    error = UpstreamBusy("every upstream is at proxy_max_conns")
+    for target in _reserve(targets, limit):
+        host, port = split_target(target)
+        started = time.monotonic()
+        try:
+            reader, writer = await asyncio.wait_for(
+                open_upstream_connection(host, port), connect_timeout)
+        except (OSError, asyncio.TimeoutError) as e:
+            _release(target, limit)
+            log("[Proxy] Upstream {} failed: {}".format(target, e))
+            balancer.mark_failed(target)
+            error = UpstreamError("connect to {} failed: {}".format(target, e),
+                                  timed_out=isinstance(e, asyncio.TimeoutError))
+            continue
+        observe(UPSTREAM_CONNECT, (target,), time.monotonic() - started)
+        return target, reader, writer
+    raise error
+
+
+async def splice_async(client, backend, idle_timeout, buffer_size=TUNNEL_BUFFER):
+    """
+    Coroutine counterpart of :func:`splice`, on stream pairs. ``drain``
+    keeps each direction at about one buffer.
+
+    :params client (tuple): reader and writer of the client.
+    :params backend (tuple): reader and writer of the backend.
+
+    :rtype (int, int, bytes): bytes sent upstream, bytes sent to the client
+                              and the status code of the backend answer.
+    """
+    loop = asyncio.get_running_loop()
+    #: Last time a byte moved either way, shared by both directions.
+    last = [loop.time()]
+    #: Bytes moved upstream and downstream, and the backend status code.
+    moved = [0, 0, b""]
+
+    async def pump(reader, writer, direction):
+        while True:
+            try:
+                data = await asyncio.wait_for(reader.read(buffer_size), idle_timeout)
+            except asyncio.TimeoutError:
+                # Idle only if the other direction was silent too
+                if loop.time() - last[0] < idle_timeout:
+                    continue
+                raise
+            if not data:
+                if writer.can_write_eof():
+                    writer.write_eof()
+                return
+            if direction == 1 and not moved[2]:
+                moved[2] = data[9:12]
+            writer.write(data)
+            await asyncio.wait_for(writer.drain(), idle_timeout)
+            moved[direction] += len(data)
+            last[0] = loop.time()
+
+    tasks = (asyncio.ensure_future(pump(client[0], backend[1], 0)),
+             asyncio.ensure_future(pump(backend[0], client[1], 1)))
+    try:
+        # The end of the client data leaves the answers going (half-close),
+        # the end of the answers or an idle or broken side ends the tunnel
+        done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        if tasks[1] not in done and tasks[0].exception() is None:
+            done, _ = await asyncio.wait((tasks[1],))
+        if any(task.exception() is not None for task in done):
+            debug("[Proxy] Tunnel idle or closed by a peer")
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+    return moved[0], moved[1], moved[2]
+
+
+async def tunnel_async(reader, writer, request, balancer, first, options):
+    """
+    Coroutine counterpart of :func:`tunnel`.
+
+    :params reader (asyncio.StreamReader): client input stream.
+    :params writer (asyncio.StreamWriter): client output stream.
+
+    :rtype (str, int, int, bytes): the backend, bytes sent upstream, bytes
+                                   sent to the client and the status code
+                                   of the backend answer.
+
+    :raise UpstreamError: when the tunnel could not be opened.
+    """
+    target, backend_reader, backend_writer = await open_tunnel_async(
+        balancer, first, options)
+    upstream = (target,)
+    inc(UPSTREAM_ACTIVE, upstream)
+    inc(TUNNELS_OPEN, upstream)
+    debug("[Proxy] Tunnel to {} opened".format(target))
+    try:
+        backend_writer.write(request)
+        await backend_writer.drain()
+        sent, received, status = await splice_async(
+            (reader, writer), (backend_reader, backend_writer),
+            tunnel_idle_timeout(options))
+        return target, len(request) + sent, received, status
+    except OSError as e:
+        raise UpstreamError("tunnel to {} failed: {}".format(target, e), sent=True)
+    finally:
+        backend_writer.close()
+        inc(UPSTREAM_ACTIVE, upstream, -1)
+        inc(TUNNELS_OPEN, upstream, -1)
+        _release(target, upstream_limit(options))
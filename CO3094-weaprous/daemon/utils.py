@@ -26,4 +26,26 @@ def get_auth_from_url(url):
     except (AttributeError, TypeError):
         auth = ("", "")
 
-    return auth
\ No newline at end of file
+    return auth
+
+
+def parse_duration(value, default=None):
+    """
+    Parses a config duration such as ``50ms``, ``2s`` or ``3`` (seconds).
+
+    :params value (str): the raw directive value.
+    :params default (float): returned when the value is missing or invalid.
+
+    :rtype float: the duration in seconds.
+    """
+    if not value:
+        return default
+    value = value.strip().lower()
+    try:
+        if value.endswith('ms'):
+            return float(value[:-2]) / 1000.0
+        if value.endswith('s'):
+            return float(value[:-1])
+        return float(value)
+    except ValueError:
+        return default
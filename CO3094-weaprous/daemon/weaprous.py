@@ -17,6 +17,8 @@ deamon.weaproute
 This module provides a WeApRous object to deploy RESTful url web app with routing
 """
 
+import inspect
+
 from .backend import create_backend
 
 class WeApRous:
@@ -40,6 +42,10 @@ class WeApRous:
       >>> def hello(headers, body):
       >>>     return {'message': 'Hello, world!'}
 
+      >>> @app.route('/search', methods=['GET'])
+      >>> def search(headers, body, query):
+      >>>     return {'q': query.get('q')}
+
       >>> app.run()
     """
 
@@ -80,22 +86,27 @@ class WeApRous:
             # Optional attach route metadata to the function
             func._route_path = path
             func._route_methods = methods
+            # Handlers declaring a ``query`` parameter get the query string
+            func._route_query = 'query' in inspect.signature(func).parameters
 
             return func
         return decorator
 
-    def run(self):
+    def run(self, unix_socket=None):
         """
         Start the backend server and begin handling requests.
 
         This method launches the TCP server using the configured IP and port,
         and dispatches incoming requests to the registered route handlers.
 
+        :param unix_socket (str): path of a Unix domain socket to listen on
+                                  as well, for a proxy on the same host.
+
         :raise: Error if IP or port has not been configured.
         """
         if not self.ip or not self.port:
             print("Rous app need to preapre address"
                   "by calling app.prepare_address(ip,port)")
 
-        create_backend(self.ip, self.port, self.routes)
+        create_backend(self.ip, self.port, self.routes, unix_socket)
         
@@ -32,68 +32,152 @@ Requirements:
 - httpadapter: the class for handling HTTP requests.
 - urlparse: parses URLs to extract host and port information.
 - daemon.create_proxy: initializes and starts the proxy server.
+- daemon.create_async_proxy: initializes and starts the asyncio proxy engine.
+- daemon.Router: compiled routing table, reloaded on SIGHUP or config change.
+- daemon.metrics: Prometheus metrics served on the admin listener.
+- daemon.tls: the shared ``SSLContext`` of the optional TLS listener.
+- daemon.proxylog: the proxy log, written off the request path.
 
 """
 
 import socket
+import signal
 import threading
 import argparse
 import re
 from urllib.parse import urlparse
 from collections import defaultdict
-from daemon import create_proxy
+from daemon import create_proxy, create_async_proxy, Router
+from daemon.metrics import register_collector, start_metrics_server
+from daemon.tracing import TRACER
+from daemon.proxylog import configure as configure_log
+from daemon.tls import create_server_context, session_collector
+from daemon.proxy import balancer_collector
 
 PROXY_PORT = 8080
+PROXY_CONFIG = "config/proxy.conf"
+
+# Config patterns, compiled once for the start-up parse and every reload
+HOST_BLOCK_RE = re.compile(r'host\s+"([^"]+)"\s*\{')
+LOCATION_BLOCK_RE = re.compile(r'location\s+(?:(=|\^~)\s*)?([^\s{]+)\s*\{')
+# "http://127.0.0.1:9000", "unix:/tmp/app.sock" or nginx's "http://unix:/tmp/app.sock:"
+PROXY_PASS_RE = re.compile(r'proxy_pass\s+(?:http://)?([^\s;]+?):?;')
+DIST_POLICY_RE = re.compile(r'dist_policy\s+([\w-]+)')
+DIRECTIVE_RE = re.compile(r'^\s*(\w+)\s+([^;\n]+?)\s*;?\s*$', re.MULTILINE)
+COMMENT_RE = re.compile(r'#[^\n]*')
+
+
+def find_blocks(pattern, text):
+    """
+    Finds the ``<header> { ... }`` blocks of a config text. Braces are
+    counted, so a block may contain nested blocks.
+
+    :params pattern (re.Pattern): matches a block header up to its ``{``.
+    :params text (str): the config text.
+
+    :rtype list: (header match, block body, block start, block end) tuples.
+    """
+    blocks = []
+    pos = 0
+    while True:
+        match = pattern.search(text, pos)
+        if match is None:
+            return blocks
+        depth, i = 1, match.end()
+        while i < len(text) and depth:
+            if text[i] == '{':
+                depth += 1
+            elif text[i] == '}':
+                depth -= 1
+            i += 1
+        blocks.append((match, text[match.end():i - 1], match.start(), i))
+        pos = i
+
+
+def parse_block(block, default_policy='round-robin', inherited=None):
+    """
+    Parses the directives of a host or location block.
+
+    :params block (str): the block body, without nested blocks.
+    :params default_policy (str): policy when the block sets none.
+    :params inherited (dict): options of the enclosing block.
+
+    :rtype tuple: (proxy_pass str or list, dist_policy, options)
+    """
+    # Find all proxy_pass entries
+    proxy_passes = PROXY_PASS_RE.findall(block)
+
+    # Find dist_policy if present
+    policy_match = DIST_POLICY_RE.search(block)
+    if policy_match:
+        dist_policy = policy_match.group(1)
+    else:
+        dist_policy = default_policy
+
+    # Remaining directives are options, e.g. "proxy_cache on;"
+    options = dict(inherited or {})
+    for name, value in DIRECTIVE_RE.findall(block):
+        if name not in ('proxy_pass', 'dist_policy'):
+            options[name] = value
+
+    #
+    # @bksysnet: Build the mapping and policy
+    # TODO: this policy varies among scenarios 
+    #       the default policy is provided with one proxy_pass
+    #       In the multi alternatives of proxy_pass then
+    #       the policy is applied to identify the highes matching
+    #       proxy_pass
+    #
+    if len(proxy_passes) == 1:
+        return (proxy_passes[0], dist_policy, options)
+    return (proxy_passes, dist_policy, options)
 
 
 def parse_virtual_hosts(config_file):
     """
     Parses virtual host blocks from a config file.
 
+    A host block may hold nginx-style ``location`` blocks. ``location = /x``
+    matches the path ``/x`` only, ``location /x`` (or ``location ^~ /x``)
+    matches every path starting with ``/x``, the longest prefix winning.
+    Requests matching no location use the host's own ``proxy_pass``.
+    Locations inherit the host policy and options unless they set their
+    own.
+
     :config_file (str): Path to the NGINX config file.
-    :rtype list of dict: Each dict contains 'listen'and 'server_name'.
+    :rtype dict: hostname -> (proxy_pass list or str, dist_policy, options,
+                 locations) where options maps the other directives of the
+                 block (e.g. ``proxy_cache on;``) to their value and
+                 locations lists ``(modifier, path, route)`` with ``route``
+                 shaped like the first three items.
     """
 
     with open(config_file, 'r') as f:
-        config_text = f.read()
+        config_text = COMMENT_RE.sub('', f.read())
 
+    routes = {}
     # Match each host block
-    host_blocks = re.findall(r'host\s+"([^"]+)"\s*\{(.*?)\}', config_text, re.DOTALL)
+    for host_match, block, _, _ in find_blocks(HOST_BLOCK_RE, config_text):
+        host = host_match.group(1)
 
-    dist_policy_map = ""
+        # Host directives are the block minus its location blocks
+        location_blocks = find_blocks(LOCATION_BLOCK_RE, block)
+        host_block, pos = "", 0
+        for _, _, start, end in location_blocks:
+            host_block += block[pos:start]
+            pos = end
+        host_block += block[pos:]
 
-    routes = {}
-    for host, block in host_blocks:
-        proxy_map = {}
-
-        # Find all proxy_pass entries
-        proxy_passes = re.findall(r'proxy_pass\s+http://([^\s;]+);', block)
-        map = proxy_map.get(host,[])
-        map = map + proxy_passes
-        proxy_map[host] = map
-
-        # Find dist_policy if present
-        policy_match = re.search(r'dist_policy\s+(\w+)', block)
-        if policy_match:
-            dist_policy_map = policy_match.group(1)
-        else: #default policy is round_robin
-            dist_policy_map = 'round-robin'
-            
-        #
-        # @bksysnet: Build the mapping and policy
-        # TODO: this policy varies among scenarios 
-        #       the default policy is provided with one proxy_pass
-        #       In the multi alternatives of proxy_pass then
-        #       the policy is applied to identify the highes matching
-        #       proxy_pass
-        #
-        if len(proxy_map.get(host,[])) == 1:
-            routes[host] = (proxy_map.get(host,[])[0], dist_policy_map)
-        # esle if:
-        #         TODO:  apply further policy matching here
-        #
-        else:
-            routes[host] = (proxy_map.get(host,[]), dist_policy_map)
+        proxy_map, dist_policy, options = parse_block(host_block)
+
+        locations = []
+        for location_match, location_block, _, _ in location_blocks:
+            modifier = location_match.group(1) or ''
+            path = location_match.group(2)
+            locations.append((modifier, path,
+                              parse_block(location_block, dist_policy, options)))
+
+        routes[host] = (proxy_map, dist_policy, options, locations)
 
     for key, value in routes.items():
         print(key, value)
@@ -110,16 +194,71 @@ if __name__ == "__main__":
 
     :arg --server-ip (str): IP address to bind the server (default: 127.0.0.1).
     :arg --server-port (int): Port number to bind the server (default: 9000).
+    :arg --engine (str): ``threaded`` (one thread per client, default) or
+                         ``asyncio`` (one event loop for every client).
+    :arg --watch-config: reload the config when the file changes.
+    :arg --metrics-port (int): serve Prometheus metrics on this port.
+    :arg --trace-sample (float): share of the requests traced (0 to 1).
+    :arg --trace-log (str): JSON lines file the sampled traces go to.
+    :arg --tls-port (int): also accept TLS clients on this port.
+    :arg --tls-cert (str): PEM certificate chain of the TLS listener.
+    :arg --tls-key (str): PEM private key of the TLS listener.
+    :arg --verbose: also log a line per request (host, backend, cache).
+
+    ``kill -HUP <pid>`` reloads the config without dropping connections.
     """
 
     parser = argparse.ArgumentParser(prog='Proxy', description='', epilog='Proxy daemon')
     parser.add_argument('--server-ip', default='127.0.0.1')
     parser.add_argument('--server-port', type=int, default=PROXY_PORT)
+    parser.add_argument('--engine', choices=['threaded', 'asyncio'], default='threaded',
+        help='Proxy engine: a thread per client or a single asyncio event loop.')
+    parser.add_argument('--watch-config', action='store_true',
+        help='Reload the routing table whenever the config file changes.')
+    parser.add_argument('--metrics-port', type=int, default=None,
+        help='Admin port serving Prometheus metrics on /metrics.')
+    parser.add_argument('--trace-sample', type=float, default=0.0,
+        help='Share of the requests traced with Server-Timing spans (0 to 1).')
+    parser.add_argument('--trace-log', default=None,
+        help='JSON lines file the sampled request traces are appended to.')
+    parser.add_argument('--tls-port', type=int, default=None,
+        help='Port of the TLS listener, terminating HTTPS at the proxy.')
+    parser.add_argument('--tls-cert', default=None,
+        help='PEM certificate chain of the TLS listener.')
+    parser.add_argument('--tls-key', default=None,
+        help='PEM private key of the TLS listener (defaults to --tls-cert).')
+    parser.add_argument('--verbose', action='store_true',
+        help='Log a line per request, off by default to keep stdout off the hot path.')
  
     args = parser.parse_args()
     ip = args.server_ip
     port = args.server_port
 
-    routes = parse_virtual_hosts("config/proxy.conf")
+    if args.tls_port and not args.tls_cert:
+        parser.error('--tls-port needs --tls-cert')
+    # One context for every TLS client: its session cache and ticket keys
+    # let returning clients resume instead of a full handshake
+    ssl_context = None
+    if args.tls_port:
+        ssl_context = create_server_context(args.tls_cert, args.tls_key or args.tls_cert)
+
+    router = Router(lambda: parse_virtual_hosts(PROXY_CONFIG))
+    TRACER.configure(args.trace_sample, args.trace_log)
+    configure_log(args.verbose)
+
+    if hasattr(signal, 'SIGHUP'):
+        # Reload off the signal handler, parsing may block on file I/O
+        signal.signal(signal.SIGHUP, lambda signum, frame: threading.Thread(
+            target=router.reload, daemon=True).start())
+    if args.watch_config:
+        router.watch(PROXY_CONFIG)
+    if args.metrics_port:
+        register_collector(balancer_collector(router))
+        if ssl_context is not None:
+            register_collector(session_collector(ssl_context))
+        start_metrics_server(ip, args.metrics_port)
 
-    create_proxy(ip, port, routes)
+    if args.engine == 'asyncio':
+        create_async_proxy(ip, port, router, args.tls_port, ssl_context)
+    else:
+        create_proxy(ip, port, router, args.tls_port, ssl_context)
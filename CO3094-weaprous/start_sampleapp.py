@@ -36,8 +36,16 @@ from urllib.parse import parse_qs, unquote # Dùng để parse body
 import os
 
 from daemon.weaprous import WeApRous
+from daemon.longpoll import LongPoll
+from daemon.response import JSONBytes
+from daemon.tracing import TRACER
+from apps.tracker_state import TrackerState, OFFLINE_PAGE_SIZE, encode_message, page_json
+from apps.fanout import fan_out
 PORT = 8000  # Port cho Tracker Server
 HEARTBEAT_TIMEOUT = 30 # Xóa peer nếu không thấy "nhịp tim" trong 30 giây
+EVENTS_TIMEOUT = 25 # Giữ /events tối đa 25 giây (dưới timeout 30 giây của proxy)
+BATCH_MAX_OPS = 32 # Số thao tác tối đa trong một /batch
+OFFLINE_PAGE_MAX = 500 # Số tin nhắn offline tối đa trong một trang
 
 app = WeApRous()
 
@@ -45,29 +53,20 @@ app = WeApRous()
 # KHỞI TẠO "DATABASE"
 # =====================================================================
 
-db_lock = threading.Lock()
-
-USER_DB = {} 
-ACTIVE_SESSIONS = {}
-PEER_DB = {}
-CHANNEL_DB = {
-    "chung": [] 
-}
-OFFLINE_STORE = {}
+# Users, sessions, peers, channels va tin nhan offline: moi cau truc co
+# lock rieng, sessions / peers / offline chia lock theo user (striping)
+STATE = TrackerState(heartbeat_timeout=HEARTBEAT_TIMEOUT)
 
 # LOAD USER DATABASE
 def load_user_db():
-    """Đọc file users.json vào biến toàn cục USER_DB."""
-    global USER_DB
-    
+    """Đọc file users.json vào bảng users của STATE."""
     _APP_DIR = os.path.abspath(__file__)
     DB_PATH = os.path.join(os.path.dirname(_APP_DIR), 'data', 'users.json')
     
     try:
         with open(DB_PATH, "r") as f:
-            with db_lock:
-                USER_DB = json.load(f)
-        print(f"[Tracker] Da tai {len(USER_DB)} users tu {DB_PATH}.")
+            STATE.load_users(json.load(f))
+        print(f"[Tracker] Da tai {len(STATE.users)} users tu {DB_PATH}.")
     except Exception as e:
         print(f"[Tracker] KHONG THE TAI USER DB: {e}")
 
@@ -102,43 +101,19 @@ def get_user_from_session(headers):
     :rtype str or None: Returns the username if session is valid, otherwise None.
     """
     cookies = extract_cookies(headers)
-    session_id = cookies.get("session_id")
-    if not session_id:
-        return None 
-
-    with db_lock:
-        # Look up the session ID in ACTIVE_SESSIONS
-        username = ACTIVE_SESSIONS.get(session_id)
-    
-    return username 
+    # Look up the session ID, under the lock of its stripe only
+    return STATE.session_user(cookies.get("session_id"))
 
 def get_active_peers():
     """
     Retrieves active peers whose heartbeat was within the timeout threshold.
 
-    Also removes peers that have timed out from the peer database and
-    from all channels.
+    Peers that have timed out were already removed from the peer database
+    and from all channels by the reaper thread (see ``STATE.start_reaper``).
 
     :rtypes dict: Dictionary mapping active usernames to their peer info.
     """
-    active_peers = {}
-    current_time = int(time.time())
-    
-    with db_lock:
-        # Copy to avoid modifying dict during iteration
-        for username, data in PEER_DB.copy().items():
-            if (current_time - data['last_seen']) < HEARTBEAT_TIMEOUT:
-                active_peers[username] = data
-            else:
-                # Delete timed-out peer
-                print(f"[Tracker] Xoa peer (timeout): {username}")
-                del PEER_DB[username]
-                # Delete from all channels
-                for channel_users in CHANNEL_DB.values():
-                    if username in channel_users:
-                        channel_users.remove(username)
-                        
-    return active_peers
+    return STATE.active_peers()
 
 # =====================================================================
 # API CHO TASK 2.1 (Login & Trang chủ)
@@ -161,21 +136,13 @@ def login(headers, body):
     except Exception as e:
         return (400, {"status": "failed", "reason": "Bad request body"})
 
-    # Xác thực với USER_DB
-    with db_lock:
-        expected_password = USER_DB.get(username)
+    # Xác thực với bảng users, tạo session mới nếu đúng
+    session_id = STATE.login(username, password)
 
-    if expected_password and expected_password == password:
-        # Create a new session
+    if session_id:
         print(f"[Tracker] Login thanh cong cho: {username}")
-        session_id = secrets.token_hex(16) 
-        
-        # Store in ACTIVE_SESSIONS
-        with db_lock:
-            ACTIVE_SESSIONS[session_id] = username
-            
         # Return tuple (status_code, body, headers)
-            return (200, 
+        return (200, 
                 {"__pass_through__": True, "username": username}, 
                 {"Set-Cookie": f"session_id={session_id}; Path=/; HttpOnly"})
     else:
@@ -224,14 +191,10 @@ def api_login(headers, body):
         return (400, {"status": "failed", "reason": "Bad JSON request"})
 
     # Xác thực (giống hệt hàm login)
-    with db_lock:
-        expected_password = USER_DB.get(username)
+    session_id = STATE.login(username, password)
 
-    if expected_password and expected_password == password:
+    if session_id:
         print(f"[Tracker] API Login thanh cong cho: {username}")
-        session_id = secrets.token_hex(16)
-        with db_lock:
-            ACTIVE_SESSIONS[session_id] = username
         return (200, 
                 {"login": "success", "username": username}, 
                 {"Set-Cookie": f"session_id={session_id}; Path=/; HttpOnly"})
@@ -263,16 +226,9 @@ def register_peer(headers, body):
     except Exception as e:
         return (400, {"status": "failed", "reason": f"Bad JSON body: {e}"})
 
-    # Register peer in PEER_DB
-    with db_lock:
-        PEER_DB[username] = {
-            "ip": peer_ip, 
-            "port": peer_port, 
-            "last_seen": int(time.time())
-        }
-        if username not in CHANNEL_DB["chung"]:
-            CHANNEL_DB["chung"].append(username)
-            
+    # Register peer, it joins the default channel
+    STATE.register_peer(username, peer_ip, peer_port)
+
     print(f"[Tracker] Dang ky Peer: {username} tai {peer_ip}:{peer_port}")
     return (200, {"status": "registered", "peer": username})
 
@@ -285,24 +241,82 @@ def heartbeat(headers, body):
     if not username:
         return (401, {"status": "failed", "reason": "unauthorized"})
 
-    with db_lock:
-        if username not in PEER_DB:
-            return (404, {"status": "failed", "reason": "not registered"})
-        PEER_DB[username]['last_seen'] = int(time.time())
-        
+    # Only the stripe lock of this user is taken
+    if not STATE.heartbeat(username):
+        return (404, {"status": "failed", "reason": "not registered"})
+
     return (200, {"status": "ok"})
 
 @app.route('/get-peers', methods=['GET'])
-def get_peers(headers, body):
+def get_peers(headers, body, query):
     """
     API để Client Chat (P2P) lấy danh sách peer (đã lọc).
+
+    With ``?since=<version>`` only the changes after that version are
+    returned (see ``TrackerState`` snapshots): ``{"version", "full",
+    "peers", "left", "channels"}``, or 304 when nothing changed. The
+    ``ETag`` is the current version.
     """
     username = get_user_from_session(headers)
     if not username:
         return (401, {"status": "failed", "reason": "unauthorized"})
 
-    active_list = get_active_peers()
-    return (200, active_list)
+    snapshot = STATE.snapshot
+    etag = '"{}"'.format(snapshot.version)
+    if headers.get("if-none-match") == etag:
+        return (304, "", {"ETag": etag})
+    since = query.get("since")
+    if since is None:
+        # Body serialised once per change of the peer list, shared by all pollers
+        return (200, snapshot.peers_json(), {"ETag": etag})
+    try:
+        since = int(since)
+    except ValueError:
+        return (400, {"status": "failed", "reason": "since must be a version"})
+    if since == snapshot.version:
+        return (304, "", {"ETag": etag})
+    return (200, snapshot.changes_json(since), {"ETag": etag})
+
+@app.route('/events', methods=['GET'])
+def events(headers, body, query):
+    """
+    Long-poll: giữ kết nối đến khi có sự kiện cho user (peer vào / ra,
+    kênh mới, tin nhắn offline) rồi trả về ngay.
+
+    ``?since=<version>`` is the version the client is at (the current one
+    by default), ``?after=<cursor>`` the last offline message it read.
+    The answer is ``{"version", "changes", "messages", "cursor", "more"}``:
+    the ``/get-peers?since=`` delta (or null) and a page of the offline
+    messages, as ``/api/fetch_offline`` reads it. After ``EVENTS_TIMEOUT`` seconds, or the timeout budget the
+    proxy sent, without any event it is a 204. The waiting connection is
+    parked in the shared event loop, it holds no thread.
+    """
+    username = get_user_from_session(headers)
+    if not username:
+        return (401, {"status": "failed", "reason": "unauthorized"})
+    try:
+        since = int(query.get("since", STATE.snapshot.version))
+        after = int(query.get("after", 0))
+    except ValueError:
+        return (400, {"status": "failed", "reason": "since and after must be integers"})
+
+    timeout = EVENTS_TIMEOUT
+    try:
+        # Answer before the proxy gives up on us
+        budget = int(headers.get("x-timeout-budget-ms", 0)) / 1000.0
+        if budget:
+            timeout = max(1.0, min(timeout, budget - 1.0))
+    except ValueError:
+        pass
+
+    def check():
+        body = STATE.events(username, since, after)
+        return None if body is None else (200, body)
+
+    poll = LongPoll(check, timeout)
+    STATE.watch(username, poll)
+    poll.on_close(lambda: STATE.unwatch(username, poll))
+    return poll
 
 # =====================================================================
 # API CHO TASK 2.2 (Channel Management)
@@ -312,7 +326,7 @@ def get_peers(headers, body):
 def api_send_offline(headers, body):
     """
     Nhận tin nhắn từ User A gửi cho User B (khi B offline).
-    Lưu vào OFFLINE_STORE.
+    Lưu vào hàng đợi offline của B.
     """
     username = get_user_from_session(headers) # Người gửi
     if not username: return (401, {"status": "failed"})
@@ -323,60 +337,250 @@ def api_send_offline(headers, body):
         message_payload = data.get("payload") # Nội dung tin nhắn gốc
     except: return (400, {"status": "failed", "reason": "Bad JSON"})
 
-    with db_lock:
-        if target_user not in OFFLINE_STORE:
-            OFFLINE_STORE[target_user] = []
-        
-        # Đánh dấu tin nhắn này là offline để Client nhận biết
-        message_payload["is_offline"] = True
-        message_payload["timestamp"] = time.time()
-        
-        OFFLINE_STORE[target_user].append(message_payload)
-        
-    print(f"[Tracker] Da luu tin nhan Offline cho: {target_user}")
+    try:
+        store_offline_message(target_user, message_payload)
+    except ValueError as e:
+        return (413, {"status": "failed", "reason": str(e)})
     return (200, {"status": "saved"})
 
+def store_offline_message(target_user, message_payload):
+    """
+    Đánh dấu tin nhắn là offline (để Client nhận biết) rồi lưu cho ``target_user``.
+
+    :raises ValueError: when the message is too large.
+    """
+    STATE.store_offline(target_user, dict(message_payload, is_offline=True,
+                                          timestamp=time.time()))
+
+    print(f"[Tracker] Da luu tin nhan Offline cho: {target_user}")
+
+def offline_page(username, params):
+    """
+    Đọc một trang tin nhắn offline theo ``after`` / ``limit`` của ``params``.
+
+    :rtype JSONBytes: ``{"status", "messages", "cursor", "more"}``.
+    :raises ValueError: when ``after`` or ``limit`` is not an integer.
+    """
+    after = int(params.get("after", 0))
+    limit = min(max(int(params.get("limit", OFFLINE_PAGE_SIZE)), 1), OFFLINE_PAGE_MAX)
+    messages, cursor, more = STATE.fetch_offline(username, after, limit)
+    if messages:
+        print(f"[Tracker] Tra {len(messages)} tin nhan offline cho {username}")
+    # Các tin nhắn đã được serialise sẵn khi lưu
+    return page_json(messages, cursor, more)
+
 @app.route('/api/fetch_offline', methods=['GET'])
-def api_fetch_offline(headers, body):
+def api_fetch_offline(headers, body, query):
     """
-    User B gọi API này để lấy tin nhắn đã bỏ lỡ.
-    Sau khi lấy xong, Server sẽ XÓA tin nhắn đó (để không tải lại lần sau).
+    User B gọi API này để lấy tin nhắn đã bỏ lỡ, từng trang một.
+    Tin nhắn chỉ bị XÓA khi Client xác nhận (``/api/ack_offline``).
+
+    ``?after=<cursor>`` skips the messages already read, ``?limit=`` caps
+    the page (100 by default, at most 500; the page also stops at about
+    256 KB). The answer is ``{"status", "messages", "cursor", "more"}``:
+    ``cursor`` is the ``after`` of the next page and what to acknowledge,
+    ``more`` tells whether more messages follow.
     """
     username = get_user_from_session(headers)
     if not username: return (401, {"status": "failed"})
-    
-    messages = []
-    with db_lock:
-        if username in OFFLINE_STORE:
-            messages = OFFLINE_STORE[username]
-            del OFFLINE_STORE[username] # Xóa sau khi đã lấy
-            print(f"[Tracker] Tra {len(messages)} tin nhan offline cho {username}")
-            
-    return (200, {"status": "ok", "messages": messages})
+
+    try:
+        return (200, offline_page(username, query))
+    except ValueError:
+        return (400, {"status": "failed", "reason": "after and limit must be integers"})
+
+@app.route('/api/ack_offline', methods=['POST'])
+def api_ack_offline(headers, body):
+    """
+    Xác nhận đã nhận tin nhắn offline: ``{"cursor": <cursor>}`` xóa các tin
+    nhắn đến ``cursor`` (của trang cuối cùng đã nhận), không xóa tin nhắn
+    nào mới hơn.
+    """
+    username = get_user_from_session(headers)
+    if not username: return (401, {"status": "failed"})
+
+    try:
+        cursor = int(json.loads(body)["cursor"])
+    except (ValueError, KeyError, TypeError):
+        return (400, {"status": "failed", "reason": "expected {\"cursor\": <cursor>}"})
+    return (200, {"status": "ok", "acked": STATE.ack_offline(username, cursor)})
+
+
+# =====================================================================
+# BATCH: nhiều thao tác trong một request
+# =====================================================================
+
+def batch_register(username, op):
+    STATE.register_peer(username, "127.0.0.1", int(op["port"]))
+    return (200, {"status": "registered", "peer": username})
+
+def batch_heartbeat(username, op):
+    if not STATE.heartbeat(username):
+        return (404, {"status": "failed", "reason": "not registered"})
+    return (200, {"status": "ok"})
+
+def batch_get_peers(username, op):
+    snapshot = STATE.snapshot
+    since = op.get("since")
+    if since is None:
+        return (200, snapshot.peers_json())
+    if int(since) == snapshot.version:
+        return (304, None)
+    return (200, snapshot.changes_json(int(since)))
+
+def batch_channel_list(username, op):
+    return (200, STATE.snapshot.channels_json())
+
+def batch_join_channel(username, op):
+    STATE.join_channel(op["channel_name"], username)
+    return (200, {"status": "joined"})
+
+def batch_channel_peers(username, op):
+    return (200, STATE.snapshot.channel_peers_json(op["channel_name"]))
+
+def batch_send_offline(username, op):
+    store_offline_message(op["target_user"], op["payload"])
+    return (200, {"status": "saved"})
+
+def batch_fetch_offline(username, op):
+    return (200, offline_page(username, op))
+
+def batch_ack_offline(username, op):
+    return (200, {"status": "ok", "acked": STATE.ack_offline(username, int(op["cursor"]))})
+
+#: Thao tác của /batch: tên -> hàm (username, op) -> (status, body)
+BATCH_OPS = {
+    "register": batch_register,
+    "heartbeat": batch_heartbeat,
+    "get-peers": batch_get_peers,
+    "channels/list": batch_channel_list,
+    "channels/join": batch_join_channel,
+    "channels/peers": batch_channel_peers,
+    "send_offline": batch_send_offline,
+    "fetch_offline": batch_fetch_offline,
+    "ack_offline": batch_ack_offline,
+}
+
+@app.route('/batch', methods=['POST'])
+def batch(headers, body):
+    """
+    Chạy nhiều thao tác (JSON array) trong một request, với một lần tra
+    session duy nhất.
+
+    Each operation is ``{"op": name, ...its fields}``, e.g.
+    ``[{"op": "heartbeat"}, {"op": "get-peers", "since": 12}]``, run in
+    order. The answer is ``{"results": [{"op", "status", "body"}, ...]}``.
+    Reads take no lock (current snapshot) and their cached JSON bodies
+    are embedded as they are; an operation failing does not stop the
+    others.
+    """
+    username = get_user_from_session(headers)
+    if not username:
+        return (401, {"status": "failed", "reason": "unauthorized"})
+    try:
+        ops = json.loads(body)
+    except ValueError:
+        return (400, {"status": "failed", "reason": "Bad JSON"})
+    if not isinstance(ops, list) or len(ops) > BATCH_MAX_OPS:
+        return (400, {"status": "failed",
+                      "reason": f"expected a list of at most {BATCH_MAX_OPS} operations"})
+
+    results = []
+    for op in ops:
+        name = op.get("op") if isinstance(op, dict) else None
+        handler = BATCH_OPS.get(name)
+        if handler is None:
+            status, result = (400, {"status": "failed", "reason": "unknown op"})
+        else:
+            try:
+                status, result = handler(username, op)
+            except (KeyError, TypeError, ValueError) as e:
+                status, result = (400, {"status": "failed", "reason": f"bad op: {e}"})
+        if not isinstance(result, bytes):
+            result = json.dumps(result).encode('utf-8')
+        results.append(b'{"op": %s, "status": %d, "body": %s}' % (
+            json.dumps(name).encode('utf-8'), status, result))
+    return (200, JSONBytes(b'{"results": [' + b', '.join(results) + b']}'))
 
 
 @app.route('/channels/list', methods=['GET'])
 def get_channel_list(headers, body):
-    with db_lock: return (200, {"status": "ok", "channels": list(CHANNEL_DB.keys())})
+    # Same list for every caller: let the proxy cache it for a moment
+    return (200, STATE.snapshot.channels_json(),
+            {"Cache-Control": "public, max-age=2, stale-while-revalidate=10"})
 
 @app.route('/channels/join', methods=['POST'])
 def join_channel(headers, body):
     username = get_user_from_session(headers)
     try:
         channel = json.loads(body).get("channel_name")
-        with db_lock:
-            if channel not in CHANNEL_DB: CHANNEL_DB[channel] = []
-            if username not in CHANNEL_DB[channel]: CHANNEL_DB[channel].append(username)
+        STATE.join_channel(channel, username)
         return (200, {"status": "joined"})
     except: return (400, {"status": "error"})
 
+@app.route('/channels/broadcast', methods=['POST'])
+def broadcast_channel(headers, body):
+    """
+    Gửi một tin nhắn tới mọi thành viên của kênh: Tracker đẩy song song
+    tới các peer đang sống, phần còn lại (offline hoặc không kết nối được)
+    được lưu offline một lần cho tất cả.
+
+    Body: ``{"channel_name", "payload"}``. The answer is ``{"status",
+    "delivered", "queued", "recipients"}``, ``recipients`` mapping each
+    member but the sender to ``delivered`` or ``queued``. Only members
+    may send (403 otherwise), and a message too large to be queued
+    offline is refused (413) before anything is sent.
+    """
+    username = get_user_from_session(headers)
+    if not username:
+        return (401, {"status": "failed", "reason": "unauthorized"})
+    try:
+        data = json.loads(body)
+        channel = data["channel_name"]
+        payload = dict(data["payload"])
+    except (ValueError, KeyError, TypeError):
+        return (400, {"status": "failed", "reason": "Bad JSON"})
+    members = STATE.channel_members(channel)
+    if members is None:
+        return (400, {"status": "failed", "reason": "unknown channel"})
+    if username not in members:
+        return (403, {"status": "failed", "reason": "not a member of the channel"})
+
+    payload.update({"type": "channel_message", "channel": channel, "from": username})
+    try:
+        # Bản offline được serialise (và kiểm tra kích thước) trước khi gửi cho ai
+        offline = encode_message(dict(payload, is_offline=True, timestamp=time.time()))
+    except ValueError as e:
+        return (413, {"status": "failed", "reason": str(e)})
+    recipients = members - {username}
+    peers = STATE.snapshot.peers
+    targets = {}
+    for member in recipients:
+        peer = peers.get(member)
+        if peer is not None:
+            targets[member] = (peer["ip"], peer["port"])
+
+    delivered = fan_out(targets, payload)
+    queued = [member for member in recipients if not delivered.get(member)]
+    if queued:
+        # Một bản offline dùng chung cho mọi người nhận
+        STATE.store_offline_many(queued, offline)
+
+    print(f"[Tracker] Broadcast kenh {channel}: {len(recipients) - len(queued)} gui truc tiep, "
+          f"{len(queued)} luu offline")
+    return (200, {
+        "status": "ok",
+        "delivered": len(recipients) - len(queued),
+        "queued": len(queued),
+        "recipients": {member: "delivered" if delivered.get(member) else "queued"
+                       for member in recipients},
+    })
+
 @app.route('/channels/peers', methods=['POST'])
 def get_channel_peers(headers, body):
     try:
         channel = json.loads(body).get("channel_name")
-        actives = get_active_peers()
-        with db_lock: users = CHANNEL_DB.get(channel, [])
-        return (200, {u: actives[u] for u in users if u in actives})
+        return (200, STATE.snapshot.channel_peers_json(channel))
     except: return (200, {})
 
 # =====================================================================
@@ -387,13 +591,22 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser(prog='TrackerServer', description='Backend cho Chat App')
     parser.add_argument('--server-ip', default='0.0.0.0')
     parser.add_argument('--server-port', type=int, default=PORT)
+    parser.add_argument('--unix-socket', default=None,
+                        help='Lang nghe them tren Unix domain socket (proxy_pass unix:<path>;)')
+    parser.add_argument('--trace-sample', type=float, default=0.0,
+                        help='Ty le request duoc trace khi khong di qua proxy (0..1)')
+    parser.add_argument('--trace-log', default=None,
+                        help='File JSON lines ghi trace cua cac request duoc lay mau')
     
     args = parser.parse_args()
     ip = args.server_ip
     port = args.server_port
 
     load_user_db()
+    # Xoa dan cac peer het han (timing wheel), /get-peers khong phai quet
+    STATE.start_reaper()
+    TRACER.configure(args.trace_sample, args.trace_log)
 
     print(f"--- Tracker Server (Task 2.1 & 2.2) dang khoi dong tai {ip}:{port} ---")
     app.prepare_address(ip, port)
-    app.run()
\ No newline at end of file
+    app.run(args.unix_socket)
\ No newline at end of file